@@ -1,42 +1,122 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+import time
+
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi import Request
+from fastapi.responses import FileResponse, PlainTextResponse
 import os
+import sys
 import shutil
-from typing import List
-
-from backend.utils.schema import UploadResponse, TrainRequest, TrainResponse, PredictRequest, PredictionResponse
-from backend.utils.helpers import save_upload_file, get_file_path, UPLOAD_DIR
-from backend.services.preprocess import load_data, get_column_info
-from backend.services.train import train_model
-from backend.services.predict import make_prediction
-from backend.services.explain import generate_shap_explanation, simulate_prediction, generate_report
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
+
+# Services are imported by the endpoints that use them (see _service):
+# pandas, sklearn, shap, matplotlib and fpdf load on first use, not at boot.
+from backend.utils.helpers import save_upload_file, get_file_path, file_index, UploadTooLarge, UPLOAD_DIR, BodySizeLimit
+from backend.utils.config import SCHEMA_SAMPLE_ROWS, SHAP_CONFIDENCE, SHAP_TOP_K, TRACE_HEADER, WARMUP_MODELS
+from backend.utils.executor import executor, Saturated
+from backend.utils.parallel import cpu_budget
+from backend.utils.metrics import metrics, begin_request, end_request, process_age
 from backend.utils.schema import (
     UploadResponse, TrainRequest, TrainResponse, PredictRequest, PredictionResponse,
-    ExplainRequest, ExplainResponse, SimulateRequest, SimulateResponse, ReportRequest
+    ExplainRequest, ExplainResponse, SimulateRequest, SimulateResponse, ReportRequest,
+    SimulateBatchRequest, SimulateBatchResponse, TrainJobStatus, RetrainRequest,
+    CompressRequest, CompressResponse, ExplainJobRequest, RowExplanationResponse
 )
 
-app = FastAPI(title="ML Full-Stack App")
+metrics.set_gauge("churn_startup_seconds", {"phase": "import"}, time.perf_counter() - _import_started)
+
+_services = {}
+
+async def _service(module: str, *names):
+    """
+    Attributes of backend.services.<module>. The first use imports it (with
+    whatever pandas / sklearn / shap it pulls in) in a worker thread, so
+    requests already in flight are not stalled behind the import.
+    """
+    loaded = _services.get(module)
+    if loaded is None:
+        loaded = await asyncio.to_thread(importlib.import_module, f"backend.services.{module}")
+        _services[module] = loaded
+    values = tuple(getattr(loaded, name) for name in names)
+    return values[0] if len(values) == 1 else values
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Pick up uploads written before the index existed or by another process.
+    file_index.rebuild()
+    if WARMUP_MODELS:
+        warm_up = await _service("registry", "warm_up")
+        await asyncio.to_thread(warm_up, WARMUP_MODELS)
+    metrics.set_gauge("churn_startup_seconds", {"phase": "startup"}, time.perf_counter() - started)
+    age = process_age()
+    if age is not None:
+        metrics.set_gauge("churn_startup_seconds", {"phase": "process"}, age)
+    yield
+    executor.shutdown()
+    # Only the pools of services some request actually imported.
+    for module, attr in (("backend.services.jobs", "training_jobs"), ("backend.services.shapley", None),
+                         ("backend.services.render", "renderer")):
+        if module in sys.modules:
+            service = sys.modules[module]
+            (getattr(service, attr) if attr else service).shutdown()
+
+def too_busy(error: Saturated) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": "1"})
+
+app = FastAPI(title="ML Full-Stack App", lifespan=lifespan)
 
+# Inside CORS, so browsers can read the 413.
+app.add_middleware(BodySizeLimit)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Trace-Summary"],
 )
 
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    # Stages timed anywhere below (including executor threads) land in this trace.
+    trace = begin_request()
+    try:
+        response = await call_next(request)
+    except Exception:
+        end_request(trace, getattr(request.scope.get("route"), "path", "unmatched"), request.method, 500)
+        raise
+    end_request(trace, getattr(request.scope.get("route"), "path", "unmatched"), request.method,
+                response.status_code)
+    if request.headers.get(TRACE_HEADER, "0") != "0":
+        response.headers.update(trace.headers())
+    return response
+
 @app.post("/upload-csv", response_model=UploadResponse)
 async def upload_csv(file: UploadFile = File(...)):
+    load_sample, get_column_info = await _service("preprocess", "load_sample", "get_column_info")
     if not file.filename.endswith(".csv"):
         raise HTTPException(status_code=400, detail="Only CSV files are allowed.")
     
-    content = await file.read()
-    file_id = save_upload_file(content, file.filename)
+    try:
+        # Always a thread of this process, whatever EXECUTOR_KIND is: the copy
+        # is I/O-bound and needs the live upload file, which (once spooled to
+        # disk) cannot be pickled over to a worker process.
+        file_id = await asyncio.to_thread(save_upload_file, file.file, file.filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
     
     file_path = get_file_path(file_id)
     try:
-        df = load_data(file_path)
+        # Types are inferred from a bounded sample; the full parse happens
+        # lazily on first use and is cached in columnar form.
+        df = await executor.run("upload-csv", load_sample, file_path, SCHEMA_SAMPLE_ROWS)
         columns, dtypes = get_column_info(df)
         
         return UploadResponse(
@@ -50,6 +130,9 @@ async def upload_csv(file: UploadFile = File(...)):
 
 @app.post("/train-model", response_model=TrainResponse)
 async def train(request: TrainRequest):
+    training_jobs = await _service("jobs", "training_jobs")
+    registry = await _service("registry", "registry")
+    TrainingCancelled = await _service("train", "TrainingCancelled")
     file_path = get_file_path(request.file_id)
     if not file_path:
         raise HTTPException(status_code=404, detail="File not found.")
@@ -57,25 +140,146 @@ async def train(request: TrainRequest):
     try:
         model_id = request.file_id + "_" + request.target 
         
-        metrics, feature_importance = train_model(
+        # Fit in the training pool and await it, so the event loop stays free.
+        # Submitting happens in a thread too: the first job boots the pool.
+        job_id = await asyncio.to_thread(
+            training_jobs.submit,
             file_path=file_path, 
             target=request.target, 
             task=request.task, 
-            model_id=model_id
+            model_id=model_id,
+            n_jobs=request.n_jobs,
+            backend=request.backend,
+            tune=request.tune,
+            tune_candidates=request.tune_candidates
         )
+        metrics, feature_importance, memory_report, tuning = await asyncio.wrap_future(training_jobs.get_future(job_id))
+        registry.invalidate(model_id)
         
         return TrainResponse(
             model_id=model_id,
             metrics=metrics,
-            feature_importance=feature_importance
+            feature_importance=feature_importance,
+            memory_report=memory_report,
+            tuning=tuning
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except TrainingCancelled as tc:
+        raise HTTPException(status_code=409, detail=str(tc))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/train-jobs", response_model=TrainJobStatus)
+async def submit_train_job(request: TrainRequest):
+    training_jobs = await _service("jobs", "training_jobs")
+    file_path = get_file_path(request.file_id)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found.")
+    
+    model_id = request.file_id + "_" + request.target
+    job_id = await asyncio.to_thread(
+        training_jobs.submit,
+        file_path=file_path,
+        target=request.target,
+        task=request.task,
+        model_id=model_id,
+        n_jobs=request.n_jobs,
+        backend=request.backend,
+        tune=request.tune,
+        tune_candidates=request.tune_candidates
+    )
+    return training_jobs.status(job_id)
+
+@app.get("/train-jobs/{job_id}", response_model=TrainJobStatus)
+async def train_job_status(job_id: str):
+    training_jobs = await _service("jobs", "training_jobs")
+    try:
+        return training_jobs.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+@app.get("/train-jobs/{job_id}/result", response_model=TrainResponse)
+async def train_job_result(job_id: str):
+    training_jobs = await _service("jobs", "training_jobs")
+    try:
+        status = training_jobs.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    
+    if status["status"] == "failed":
+        raise HTTPException(status_code=400, detail=status["error"])
+    if status["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']}.")
+    if status["kind"] == "shap":
+        raise HTTPException(status_code=400, detail="SHAP jobs have no training result; query /explain/{file_id}/row/{idx}.")
+    
+    metrics, feature_importance, memory_report, details = training_jobs.result(job_id)
+    return TrainResponse(
+        model_id=status["model_id"],
+        metrics=metrics,
+        feature_importance=feature_importance,
+        memory_report=memory_report,
+        **{"retrain" if status["kind"] == "retrain" else "tuning": details}
+    )
+
+async def submit_retrain(request: RetrainRequest) -> str:
+    training_jobs = await _service("jobs", "training_jobs")
+    file_path = get_file_path(request.file_id)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found.")
+    
+    return await asyncio.to_thread(
+        training_jobs.submit_retrain,
+        model_id=request.model_id,
+        file_path=file_path,
+        target=request.target,
+        output_model_id=request.output_model_id,
+        new_trees=request.new_trees,
+        max_trees=request.max_trees,
+        n_jobs=request.n_jobs,
+        backend=request.backend
+    )
+
+@app.post("/retrain-model", response_model=TrainResponse)
+async def retrain(request: RetrainRequest):
+    training_jobs = await _service("jobs", "training_jobs")
+    TrainingCancelled = await _service("train", "TrainingCancelled")
+    job_id = await submit_retrain(request)
+    try:
+        metrics, feature_importance, _, retrain_report = await asyncio.wrap_future(training_jobs.get_future(job_id))
+        
+        return TrainResponse(
+            model_id=training_jobs.status(job_id)["model_id"],
+            metrics=metrics,
+            feature_importance=feature_importance,
+            retrain=retrain_report
         )
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TrainingCancelled as tc:
+        raise HTTPException(status_code=409, detail=str(tc))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/retrain-jobs", response_model=TrainJobStatus)
+async def submit_retrain_job(request: RetrainRequest):
+    training_jobs = await _service("jobs", "training_jobs")
+    return training_jobs.status(await submit_retrain(request))
+
+@app.post("/train-jobs/{job_id}/cancel", response_model=TrainJobStatus)
+async def cancel_train_job(job_id: str):
+    training_jobs = await _service("jobs", "training_jobs")
+    try:
+        return training_jobs.cancel(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(request: PredictRequest):
+    make_prediction, make_prediction_stream = await _service("predict", "make_prediction", "make_prediction_stream")
     
     
     file_path = get_file_path(request.file_id)
@@ -83,7 +287,19 @@ async def predict(request: PredictRequest):
         raise HTTPException(status_code=404, detail="Prediction file not found.")
         
     try:
-        predictions, result_filename = make_prediction(request.model_id, file_path)
+        if request.stream:
+            summary, result_filename = await executor.run(
+                "predict", make_prediction_stream, request.model_id, file_path, request.chunk_size, request.n_jobs,
+                request.engine
+            )
+            return PredictionResponse(
+                summary=summary,
+                download_url=f"/download/{result_filename}"
+            )
+        
+        predictions, result_filename = await executor.run(
+            "predict", make_prediction, request.model_id, file_path, request.n_jobs, request.engine
+        )
         
         download_url = f"/download/{result_filename}"
         
@@ -91,6 +307,10 @@ async def predict(request: PredictRequest):
             predictions=predictions,
             download_url=download_url
         )
+    except Saturated as s:
+        raise too_busy(s)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -103,15 +323,43 @@ async def download_file(filename: str):
         return FileResponse(file_path, filename=filename)
     raise HTTPException(status_code=404, detail="File not found")
 
+@app.get("/renders/{filename}")
+async def download_render(filename: str):
+    renderer = await _service("render", "renderer")
+    key, ext = os.path.splitext(filename)
+    if ext not in (".png", ".json"):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    try:
+        if ext == ".png":
+            path = await executor.run("render", renderer.ensure_plot, key)
+        else:
+            path = renderer.ensure_data(key)
+    except Saturated as s:
+        raise too_busy(s)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(path, filename=filename)
+
 @app.get("/download-model/{model_id}")
-async def download_model(model_id: str):
-    model_path = f"backend/models/{model_id}.pkl"
-    if os.path.exists(model_path):
-        return FileResponse(model_path, filename=f"{model_id}.pkl")
-    raise HTTPException(status_code=404, detail="Model not found")
+async def download_model(model_id: str, compress: int = 0):
+    export_model = await _service("model_store", "export_model")
+    try:
+        model_path = await executor.run("download-model", export_model, model_id, compress)
+    except Saturated as s:
+        raise too_busy(s)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Model not found")
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return FileResponse(model_path, filename=f"{model_id}.pkl")
 
 @app.post("/upload-model")
 async def upload_model(file: UploadFile = File(...)):
+    remove_store = await _service("model_store", "remove_store")
+    registry = await _service("registry", "registry")
     if not file.filename.endswith(".pkl"):
         raise HTTPException(status_code=400, detail="Only .pkl files are allowed.")
     
@@ -124,49 +372,211 @@ async def upload_model(file: UploadFile = File(...)):
     file_path = os.path.join(model_dir, file.filename)
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
+    
+    model_id = file.filename.replace(".pkl", "")
+    # The uploaded pickle replaces any stored forest of the same id.
+    remove_store(model_id)
+    registry.invalidate(model_id)
         
-    return {"message": "Model uploaded successfully", "model_id": file.filename.replace(".pkl", "")}
+    return {"message": "Model uploaded successfully", "model_id": model_id}
+
+@app.post("/compress-model", response_model=CompressResponse)
+async def compress(request: CompressRequest):
+    compress_model = await _service("compress", "compress_model")
+    registry = await _service("registry", "registry")
+    file_path = get_file_path(request.file_id)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found.")
+    
+    try:
+        report = await executor.run(
+            "compress-model",
+            compress_model,
+            request.model_id,
+            file_path,
+            request.target,
+            output_model_id=request.output_model_id,
+            top_k=request.top_k,
+            max_depth=request.max_depth,
+            threshold_dtype=request.threshold_dtype,
+            value_dtype=request.value_dtype
+        )
+        registry.invalidate(report["model_id"])
+        return CompressResponse(**report)
+    except Saturated as s:
+        raise too_busy(s)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/model-cache/stats")
+async def model_cache_stats():
+    registry = await _service("registry", "registry")
+    return registry.stats()
+
+@app.get("/scoring-cache/stats")
+async def scoring_cache_stats():
+    scoring_cache = await _service("score_cache", "scoring_cache")
+    return scoring_cache.stats()
+
+@app.get("/render-cache/stats")
+async def render_cache_stats():
+    renderer = await _service("render", "renderer")
+    return renderer.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/executor/metrics")
+async def executor_metrics():
+    return {**executor.metrics(), "cpu_budget": cpu_budget.stats()}
 
 @app.post("/explain", response_model=ExplainResponse)
 async def explain(request: ExplainRequest):
+    generate_shap_explanation = await _service("explain", "generate_shap_explanation")
     file_path = get_file_path(request.file_id)
     if not file_path:
         raise HTTPException(status_code=404, detail="File not found.")
         
     try:
-        feature_importance, plot_filename = generate_shap_explanation(request.model_id, file_path)
+        if request.plot not in ("png", "data"):
+            raise ValueError("plot must be 'png' or 'data'.")
         
-        plot_url = f"/download/{plot_filename}"
+        feature_importance, render_key, details = await executor.run(
+            "explain",
+            generate_shap_explanation,
+            request.model_id,
+            file_path,
+            request.sample,
+            request.sample_size,
+            request.approximate,
+            request.feature_perturbation,
+            request.confidence or SHAP_CONFIDENCE,
+            request.plot == "png"
+        )
+        if request.plot != "data":
+            details.pop("plot_data")
         
+        # The PNG renders in the background; fetching the URL waits for it.
         return ExplainResponse(
-            summary_plot_url=plot_url,
-            feature_importance=feature_importance
+            summary_plot_url=f"/renders/{render_key}.png",
+            plot_data_url=f"/renders/{render_key}.json",
+            feature_importance=feature_importance,
+            **details
         )
+    except Saturated as s:
+        raise too_busy(s)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/explain-jobs", response_model=TrainJobStatus)
+async def submit_explain_job(request: ExplainJobRequest):
+    training_jobs = await _service("jobs", "training_jobs")
+    file_path = get_file_path(request.file_id)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found.")
+    
+    # SHAP for every row runs once in the job pool; rows are then served from the store.
+    job_id = await asyncio.to_thread(training_jobs.submit_shap, request.model_id, file_path, request.approximate)
+    return training_jobs.status(job_id)
+
+@app.get("/explain-jobs/{job_id}", response_model=TrainJobStatus)
+async def explain_job_status(job_id: str):
+    training_jobs = await _service("jobs", "training_jobs")
+    try:
+        return training_jobs.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+@app.get("/explain/{file_id}/row/{idx}", response_model=RowExplanationResponse)
+async def explain_row(file_id: str, idx: int, model_id: str, top_k: int = SHAP_TOP_K):
+    row_drivers = await _service("shap_store", "row_drivers")
+    file_path = get_file_path(file_id)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found.")
+    
+    try:
+        drivers = await executor.run("explain-row", row_drivers, file_path, model_id, idx, top_k)
+        return RowExplanationResponse(file_id=file_id, **drivers)
+    except Saturated as s:
+        raise too_busy(s)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/simulate", response_model=SimulateResponse)
 async def simulate(request: SimulateRequest):
+    simulate_prediction = await _service("explain", "simulate_prediction")
     try:
-        prediction = simulate_prediction(request.model_id, request.features)
+        prediction = await executor.run("simulate", simulate_prediction, request.model_id, request.features)
         return SimulateResponse(prediction=prediction)
+    except Saturated as s:
+        raise too_busy(s)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/simulate-batch", response_model=SimulateBatchResponse)
+async def simulate_many(request: SimulateBatchRequest):
+    simulate_batch = await _service("explain", "simulate_batch")
+    try:
+        predictions, columns = await executor.run(
+            "simulate-batch",
+            simulate_batch,
+            request.model_id,
+            rows=request.rows,
+            base=request.base,
+            grid=request.grid
+        )
+        return SimulateBatchResponse(
+            n_rows=len(predictions),
+            columns=columns,
+            predictions=predictions
+        )
+    except Saturated as s:
+        raise too_busy(s)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-report")
 async def report(request: ReportRequest):
+    generate_report = await _service("explain", "generate_report")
     file_path = get_file_path(request.file_id)
     if not file_path:
         raise HTTPException(status_code=404, detail="File not found.")
         
     try:
-        report_filename = generate_report(
+        report_filename = await executor.run(
+            "generate-report",
+            generate_report,
             request.model_id, 
             file_path, 
             request.thresholds, 
-            request.recommendations
+            request.recommendations,
+            request.n_jobs,
+            request.engine
         )
         return {"download_url": f"/download/{report_filename}"}
+    except Saturated as s:
+        raise too_busy(s)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
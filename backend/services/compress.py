@@ -0,0 +1,162 @@
+import copy
+
+import numpy as np
+from sklearn.base import is_classifier
+from sklearn.model_selection import train_test_split
+
+from .model_store import load_model_file, model_version, quantize_state, save_model, tree_from_state
+from .preprocess import load_data
+from .train import evaluate_model
+
+THRESHOLD_DTYPES = ("float32", "float16")
+VALUE_DTYPES = ("float32", "float16", "uint8")
+
+
+def cap_depth(state: dict, max_depth: int) -> dict:
+    """
+    Cut a tree state (Tree.__getstate__()) at max_depth: internal nodes at
+    that depth become leaves predicting their own value, and the nodes
+    below them are dropped and the rest renumbered.
+    """
+    nodes, values = state["nodes"], state["values"]
+    left, right = nodes["left_child"], nodes["right_child"]
+    depth = np.full(len(nodes), -1, dtype=np.int64)
+    frontier = np.array([0])
+    level = 0
+    while frontier.size and level <= max_depth:
+        depth[frontier] = level
+        internal = frontier[left[frontier] != -1]
+        frontier = np.concatenate([left[internal], right[internal]])
+        level += 1
+
+    keep = depth >= 0
+    new_index = np.cumsum(keep) - 1
+    nodes = nodes[keep].copy()
+    cut = (depth[keep] == max_depth) & (nodes["left_child"] != -1)
+    internal = (nodes["left_child"] != -1) & ~cut
+    nodes["left_child"] = np.where(internal, new_index[np.maximum(nodes["left_child"], 0)], -1)
+    nodes["right_child"] = np.where(internal, new_index[np.maximum(nodes["right_child"], 0)], -1)
+    # sklearn's leaf markers (TREE_UNDEFINED).
+    nodes["feature"][cut] = -2
+    nodes["threshold"][cut] = -2.0
+    nodes["missing_go_to_left"][cut] = 0
+    return {
+        "max_depth": min(state["max_depth"], max_depth),
+        "node_count": int(keep.sum()),
+        "nodes": nodes,
+        "values": np.ascontiguousarray(values[keep]),
+    }
+
+
+def _oob_scores(forest, X_train, y_train) -> np.ndarray:
+    """
+    Each tree's accuracy (classifiers) or negative MSE (regressors) on the
+    training rows left out of its bootstrap sample.
+    """
+    y_train = np.asarray(y_train)
+    scores = np.full(len(forest.estimators_), -np.inf)
+    for i, (est, in_bag) in enumerate(zip(forest.estimators_, forest.estimators_samples_)):
+        oob = np.ones(X_train.shape[0], dtype=bool)
+        oob[in_bag] = False
+        if not oob.any():
+            continue
+        if is_classifier(forest):
+            predicted = forest.classes_.take(np.argmax(est.predict_proba(X_train[oob]), axis=1))
+            scores[i] = np.mean(predicted == y_train[oob])
+        else:
+            scores[i] = -np.mean((est.predict(X_train[oob]) - y_train[oob]) ** 2)
+    return scores
+
+
+def compress_model(model_id: str, file_path: str, target: str, output_model_id: str = None, top_k: int = None,
+                   max_depth: int = None, threshold_dtype: str = None, value_dtype: str = None):
+    """
+    Shrink a stored forest and save it as output_model_id (default
+    "<model_id>_compressed"):
+
+    - max_depth cuts every tree at that depth;
+    - top_k keeps the k trees with the best out-of-bag score, which needs
+      file_path to be the file the model was trained on;
+    - threshold_dtype / value_dtype store split thresholds and leaf values
+      in narrower types (uint8 leaf probabilities for classifiers).
+
+    The held-out 20% split that train_model evaluated on is reproduced from
+    file_path, and both models are scored on it. Returns a report with the
+    original and compressed metrics, their deltas and the size on disk.
+    """
+    output_model_id = output_model_id or f"{model_id}_compressed"
+    if output_model_id == model_id:
+        raise ValueError("output_model_id must differ from model_id.")
+    if threshold_dtype not in (None,) + THRESHOLD_DTYPES:
+        raise ValueError(f"threshold_dtype must be one of {', '.join(THRESHOLD_DTYPES)}.")
+    if value_dtype not in (None,) + VALUE_DTYPES:
+        raise ValueError(f"value_dtype must be one of {', '.join(VALUE_DTYPES)}.")
+    if max_depth is not None and max_depth < 1:
+        raise ValueError("max_depth must be at least 1.")
+
+    original = load_model_file(model_id)
+    preprocessor = original.named_steps['preprocessor']
+    task = "classification" if is_classifier(original.named_steps['classifier']) else "regression"
+    if value_dtype == "uint8" and task != "classification":
+        raise ValueError("uint8 leaf values are only supported for classifiers.")
+
+    columns = list(getattr(preprocessor, 'feature_names_in_', []))
+    df = load_data(file_path, columns=columns + [target] if columns else None)
+    df = df.dropna(subset=[target])
+    X = df.drop(columns=[target])
+    y = df[target]
+    # Same split as train_model, so X_test is data neither model has seen.
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    compressed = copy.deepcopy(original)
+    forest = compressed.named_steps['classifier']
+    nodes_before = sum(est.tree_.node_count for est in forest.estimators_)
+    trees_before = len(forest.estimators_)
+
+    for est in forest.estimators_:
+        state = est.tree_.__getstate__()
+        if max_depth is not None:
+            state = cap_depth(state, max_depth)
+        if threshold_dtype == "float16":
+            internal = state["nodes"]["left_child"] != -1
+            if np.abs(state["nodes"]["threshold"][internal]).max(initial=0.0) > np.finfo(np.float16).max:
+                raise ValueError("Split thresholds exceed the float16 range; use threshold_dtype='float32'.")
+        if threshold_dtype or value_dtype:
+            state = quantize_state(state, threshold_dtype, value_dtype)
+        est.tree_ = tree_from_state(forest, est, state)
+
+    oob_kept = None
+    if top_k is not None and top_k < trees_before:
+        if top_k < 1:
+            raise ValueError("top_k must be at least 1.")
+        if not forest.bootstrap:
+            raise ValueError("top_k needs a forest trained with bootstrap sampling.")
+        X_train_transformed = preprocessor.transform(X_train)
+        if getattr(forest, "_n_samples", None) != X_train_transformed.shape[0]:
+            raise ValueError("top_k needs the file the model was trained on.")
+        oob = _oob_scores(forest, X_train_transformed, y_train)
+        # Keep the original tree order among the survivors.
+        keep = np.sort(np.argsort(-oob, kind="stable")[:top_k])
+        oob_kept = oob[keep].tolist()
+        forest.estimators_ = [forest.estimators_[i] for i in keep]
+        forest.set_params(n_estimators=len(forest.estimators_))
+
+    quantize = {key: dtype for key, dtype in (("threshold", threshold_dtype), ("value", value_dtype)) if dtype}
+    save_model(compressed, output_model_id, fmt="forest", quantize=quantize or None)
+
+    before = evaluate_model(original, X_test, y_test, task)
+    after = evaluate_model(compressed, X_test, y_test, task)
+    return {
+        "model_id": output_model_id,
+        "base_model_id": model_id,
+        "metrics_before": before,
+        "metrics_after": after,
+        "metrics_delta": {name: after[name] - before[name] for name in before if name in after},
+        "trees_before": trees_before,
+        "trees_after": len(forest.estimators_),
+        "nodes_before": nodes_before,
+        "nodes_after": sum(est.tree_.node_count for est in forest.estimators_),
+        "bytes_before": model_version(model_id)[1],
+        "bytes_after": model_version(output_model_id)[1],
+        "oob_scores_kept": oob_kept,
+    }
@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from ..utils.metrics import stage
+
+CACHE_DIRNAME = ".columnar"
+META_FILENAME = "meta.json"
+FORMAT_VERSION = 1
+
+
+class UnsupportedColumn(ValueError):
+    pass
+
+
+def get_cache_dir(file_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(os.path.dirname(file_path), CACHE_DIRNAME, stem)
+
+
+def _source_signature(file_path: str) -> dict:
+    st = os.stat(file_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _encode_column(series: pd.Series):
+    """
+    Returns (kind, array, categories). Numeric and bool columns are stored
+    as-is; text columns as int32 codes into a list of category strings.
+    """
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy()
+        if values.dtype == object:
+            raise UnsupportedColumn(f"Column {series.name!r} has no fixed-width dtype")
+        return "numeric", np.ascontiguousarray(values), None
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    categories = list(uniques)
+    if not all(isinstance(c, str) for c in categories):
+        raise UnsupportedColumn(f"Column {series.name!r} mixes text and non-text values")
+    return "codes", codes.astype(np.int32), categories
+
+
+def write_cache(file_path: str, df: pd.DataFrame) -> bool:
+    """
+    Store df as one raw binary file per column next to the source upload.
+    Returns False (and writes nothing) if a column cannot be represented.
+    """
+    try:
+        encoded = [(col, *_encode_column(df[col])) for col in df.columns]
+    except UnsupportedColumn as e:
+        print(f"Skipping columnar cache for {file_path}: {e}")
+        return False
+
+    cache_dir = get_cache_dir(file_path)
+    tmp_dir = f"{cache_dir}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_dir)
+
+    columns = []
+    with stage("columnar_write") as timed:
+        for i, (col, kind, values, categories) in enumerate(encoded):
+            filename = f"col_{i}.bin"
+            values.tofile(os.path.join(tmp_dir, filename))
+            timed.bytes_written += values.nbytes
+            columns.append({
+                "name": col,
+                "dtype": str(df[col].dtype),
+                "kind": kind,
+                "storage": str(values.dtype),
+                "file": filename,
+                "categories": categories,
+            })
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "source": _source_signature(file_path),
+        "n_rows": len(df),
+        "columns": columns,
+    }
+    with open(os.path.join(tmp_dir, META_FILENAME), "w") as f:
+        json.dump(meta, f)
+
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.replace(tmp_dir, cache_dir)
+    return True
+
+
+def read_meta(file_path: str):
+    """Cache metadata, or None if there is no cache or it is stale."""
+    meta_path = os.path.join(get_cache_dir(file_path), META_FILENAME)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != FORMAT_VERSION or meta.get("source") != _source_signature(file_path):
+        return None
+    return meta
+
+
+def _decode_column(cache_dir: str, spec: dict, n_rows: int, start: int, stop: int):
+    if n_rows == 0:
+        values = np.empty(0, dtype=spec["storage"])
+    else:
+        values = np.memmap(os.path.join(cache_dir, spec["file"]), dtype=spec["storage"], mode="r", shape=(n_rows,))
+        # Plain ndarray view over the mapping; pandas should not see the memmap subclass.
+        values = np.asarray(values[start:stop])
+    if spec["kind"] == "numeric":
+        return pd.Series(values, dtype=spec["dtype"], copy=False)
+
+    categories = np.empty(len(spec["categories"]) + 1, dtype=object)
+    categories[:-1] = spec["categories"]
+    categories[-1] = np.nan
+    # Code -1 (missing) picks the trailing NaN slot.
+    return pd.Series(categories[values], dtype=spec["dtype"])
+
+
+def read_cache(file_path: str, columns=None, start: int = 0, stop: int = None, meta: dict = None):
+    """
+    Rows [start, stop) of the cached table, optionally projected to
+    `columns`. Numeric columns are memory-mapped. Returns None on a miss.
+    """
+    meta = meta or read_meta(file_path)
+    if meta is None:
+        return None
+
+    n_rows = meta["n_rows"]
+    stop = n_rows if stop is None else min(stop, n_rows)
+    specs = {spec["name"]: spec for spec in meta["columns"]}
+    names = list(specs) if columns is None else list(columns)
+    missing = [name for name in names if name not in specs]
+    if missing:
+        raise ValueError(f"Columns not found in dataset: {missing}")
+
+    cache_dir = get_cache_dir(file_path)
+    with stage("columnar_read") as timed:
+        data = {name: _decode_column(cache_dir, specs[name], n_rows, start, stop) for name in names}
+        df = pd.DataFrame(data, copy=False)
+        timed.bytes_read = sum(np.dtype(specs[name]["storage"]).itemsize for name in names) * max(stop - start, 0)
+    df.index = pd.RangeIndex(start, stop)
+    return df
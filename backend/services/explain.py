@@ -1,87 +1,82 @@
 import pandas as pd
-import shap
-import joblib
 import os
-import matplotlib.pyplot as plt
 import numpy as np
-from fpdf import FPDF
-from .preprocess import load_data
+from .preprocess import get_transformed_feature_names
+from .registry import load_model
+from .fastpath import get_compiled_pipeline
+from .shapley import explain_global
+from .render import renderer, summary_data
+from .score_cache import scoring_cache
 from ..utils.helpers import UPLOAD_DIR
+from ..utils.metrics import stage
 import uuid
+import heapq
+import itertools
+from ..utils.config import (
+    SIMULATE_BATCH_MAX_ROWS, SIMULATE_COMPILED_MAX_ROWS, SHAP_SAMPLE_SIZE, SHAP_CONFIDENCE, PREDICT_CHUNK_SIZE,
+    REPORT_TOP_N
+)
 
-MODEL_DIR = "backend/models" 
-
-def load_model(model_id: str):
-    model_path = os.path.join(MODEL_DIR, f"{model_id}.pkl")
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model {model_id} not found.")
-    return joblib.load(model_path)
-
-def get_feature_names(model, numeric_cols, categorical_cols):
+def get_feature_names(model):
     """
     Attempt to extract feature names from the pipeline preprocessor.
     """
-    try:
-        preprocessor = model.named_steps['preprocessor']
-        if 'cat' in preprocessor.named_transformers_:
-            cat_transformer = preprocessor.named_transformers_['cat']
-            if hasattr(cat_transformer, 'named_steps'):
-                 onehot = cat_transformer.named_steps['onehot']
-            else:
-                 onehot = cat_transformer 
-            
-            
-            if hasattr(cat_transformer, 'named_steps') and 'onehot' in cat_transformer.named_steps:
-                onehot = cat_transformer.named_steps['onehot']
-                cat_names = onehot.get_feature_names_out(categorical_cols)
-                return numeric_cols + list(cat_names)
-    except Exception as e:
-        print(f"Error extracting feature names: {e}")
-    
-    return []
-
-def generate_shap_explanation(model_id: str, file_path: str):
-    model = load_model(model_id)
-    df = load_data(file_path) 
-    
-    
-    preprocessor = model.named_steps['preprocessor']
-    X_transformed = preprocessor.transform(df)
-    
-    rf = model.named_steps['classifier']
-    
-    
-    explainer = shap.TreeExplainer(rf)
-    shap_values = explainer.shap_values(X_transformed)
-    
-    if isinstance(shap_values, list):
-         shap_values = shap_values[1]
-    
-    
-    numeric_features = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
-    categorical_features = df.select_dtypes(include=['object', 'bool']).columns.tolist()
-    
-    feature_names = get_feature_names(model, numeric_features, categorical_features)
-    if len(feature_names) != X_transformed.shape[1]:
-        feature_names = [f"Feature {i}" for i in range(X_transformed.shape[1])]
+    return get_transformed_feature_names(model.named_steps['preprocessor'])
 
-    plt.figure()
-    shap.summary_plot(shap_values, X_transformed, feature_names=feature_names, show=False)
-    
-    plot_filename = f"shap_summary_{uuid.uuid4()}.png"
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
-    plot_path = os.path.join(UPLOAD_DIR, plot_filename)
-    plt.savefig(plot_path, bbox_inches='tight')
-    plt.close()
-    
-    global_shap_importance = np.abs(shap_values).mean(0)
-    importance_dict = dict(zip(feature_names, global_shap_importance))
-    importance_dict = dict(sorted(importance_dict.items(), key=lambda item: item[1], reverse=True)[:20])
-    
-    return importance_dict, plot_filename
+def generate_shap_explanation(model_id: str, file_path: str, sample: bool = False, sample_size: int = None,
+                              approximate: bool = False, feature_perturbation: str = "tree_path_dependent",
+                              confidence: float = SHAP_CONFIDENCE, render: bool = True):
+    """
+    Top-20 global SHAP importances and the summary chart data. With sample
+    (or an explicit sample_size, default SHAP_SAMPLE_SIZE) only a
+    stratified sample of the file is explained; see explain_global.
+
+    Results are cached per (model version, file, sample config), so a
+    repeated request does no SHAP work. The PNG is rendered in the
+    background (if render) and served from /renders/{key}.png; returns
+    (importance_dict, key, details), details also holding plot_data and
+    whether the PNG is ready yet.
+    """
+    if sample and sample_size is None:
+        sample_size = SHAP_SAMPLE_SIZE
+    config = {"sample_size": sample_size, "approximate": approximate,
+              "feature_perturbation": feature_perturbation, "confidence": confidence}
+    key = renderer.key(model_id, file_path, config)
+    payload = renderer.load(key)
+    
+    if payload is None:
+        model = load_model(model_id)
+        result = explain_global(model_id, file_path, sample_size, approximate, feature_perturbation, confidence)
+        X_transformed = result["X"]
+        
+        feature_names = get_feature_names(model)
+        if len(feature_names) != X_transformed.shape[1]:
+            feature_names = [f"Feature {i}" for i in range(X_transformed.shape[1])]
+        
+        top = np.argsort(result["importance"])[::-1][:20]
+        payload = {
+            "feature_importance": {feature_names[i]: float(result["importance"][i]) for i in top},
+            "details": {
+                "importance_bounds": {feature_names[i]: [float(result["lower"][i]), float(result["upper"][i])]
+                                      for i in top},
+                "expected_value": result["expected_value"],
+                "rows_explained": result["rows_explained"],
+                "n_rows": result["n_rows"],
+            },
+            "plot_data": summary_data(result["shap_values"], X_transformed, feature_names, result["importance"],
+                                      result["expected_value"]),
+        }
+        renderer.store(key, payload)
+    
+    details = dict(payload["details"], plot_data=payload["plot_data"])
+    details["plot_ready"] = renderer.submit(key, payload["plot_data"]) if render else False
+    return payload["feature_importance"], key, details
 
 def simulate_prediction(model_id: str, features: dict):
+    compiled = get_compiled_pipeline(model_id)
+    if compiled is not None:
+        return compiled.predict_one(features)
+
     model = load_model(model_id)
     
     input_df = pd.DataFrame([features])
@@ -102,61 +97,137 @@ def simulate_prediction(model_id: str, features: dict):
     else:
         return model.predict(input_df)[0]
 
+def build_simulation_frame(rows=None, base=None, grid=None):
+    """
+    Assemble the scenarios for a batch simulation as one DataFrame.
+    Either explicit rows, or a base row crossed with a grid of per-feature
+    values (cartesian product). Returns the frame and the varied columns.
+    """
+    if rows:
+        if grid:
+            raise ValueError("Provide either 'rows' or 'base' + 'grid', not both.")
+        if len(rows) > SIMULATE_BATCH_MAX_ROWS:
+            raise ValueError(f"Too many scenarios ({len(rows)}); the limit is {SIMULATE_BATCH_MAX_ROWS}.")
+        return pd.DataFrame(rows), {}
+
+    if not grid:
+        raise ValueError("Provide 'rows' or a 'grid' of feature values to sweep.")
+
+    n_rows = 1
+    for values in grid.values():
+        n_rows *= len(values)
+    if n_rows == 0:
+        raise ValueError("Every grid feature needs at least one value.")
+    if n_rows > SIMULATE_BATCH_MAX_ROWS:
+        raise ValueError(f"Grid expands to {n_rows} scenarios; the limit is {SIMULATE_BATCH_MAX_ROWS}.")
 
-class PDFReport(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 15)
-        self.cell(0, 10, 'Churn Prediction & Explainability Report', 0, 1, 'C')
-        self.ln(10)
+    names = list(grid.keys())
+    combos = list(zip(*itertools.product(*(grid[name] for name in names))))
+    varied = {name: list(combos[i]) for i, name in enumerate(names)}
+
+    data = {col: [value] * n_rows for col, value in (base or {}).items() if col not in varied}
+    data.update(varied)
+    return pd.DataFrame(data), varied
+
+def simulate_batch(model_id: str, rows=None, base=None, grid=None):
+    df, varied = build_simulation_frame(rows, base, grid)
+    compiled = get_compiled_pipeline(model_id) if len(df) <= SIMULATE_COMPILED_MAX_ROWS else None
+    if compiled is not None:
+        return compiled.predict_many(df.to_dict("records")).tolist(), varied
 
-def generate_report(model_id: str, file_path: str, thresholds: dict, recommendations: dict):
     model = load_model(model_id)
-    df = load_data(file_path)
-    
-    
-    predictions = model.predict(df)
     
     rf = model.named_steps['classifier']
     if hasattr(rf, 'predict_proba'):
-        probs = model.predict_proba(df)[:, 1]
+        predictions = model.predict_proba(df)[:, 1]
     else:
-        probs = predictions 
-        
+        predictions = model.predict(df)
+    
+    return predictions.tolist(), varied
+
+
+def _pdf_report():
+    """Empty report with the title header; fpdf is only imported once a report is built."""
+    from fpdf import FPDF
+    
+    class PDFReport(FPDF):
+        def header(self):
+            self.set_font('Arial', 'B', 15)
+            self.cell(0, 10, 'Churn Prediction & Explainability Report', 0, 1, 'C')
+            self.ln(10)
+    
+    return PDFReport()
+
+RISK_LEVELS = ("Low Risk", "Medium Risk", "High Risk")
+
+def risk_tiers(probs: np.ndarray, thresholds: dict) -> np.ndarray:
+    """Index into RISK_LEVELS per row; same precedence as checking high first, then medium."""
+    high, medium = thresholds.get('high', 0.75), thresholds.get('medium', 0.5)
+    return np.select([probs >= high, probs >= medium], [2, 1], default=0)
+
+def score_report(model_id: str, file_path: str, thresholds: dict, top_n: int = REPORT_TOP_N,
+                 chunk_size: int = None, n_jobs: int = None, engine: str = None):
+    """
+    Single pass over the file's scores in chunks, read from the scoring
+    cache or scored (and cached) now: tier each chunk, add to the per-tier
+    counts and keep the top_n high-risk rows in a min-heap. Memory is
+    bounded by chunk_size, not the file size. Returns (total, counts per
+    RISK_LEVELS entry, [(row, probability)] by descending probability).
+    """
+    chunk_size = chunk_size or PREDICT_CHUNK_SIZE
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive.")
     
-    df['Churn Probability'] = probs
+    model = load_model(model_id)
+    rf = model.named_steps['classifier']
     
-    def get_risk(prob):
-        if prob >= thresholds.get('high', 0.75):
-            return 'High Risk'
-        elif prob >= thresholds.get('medium', 0.5):
-            return 'Medium Risk'
-        else:
-            return 'Low Risk'
-            
-    df['Risk Level'] = df['Churn Probability'].apply(get_risk)
+    total = 0
+    counts = np.zeros(len(RISK_LEVELS), dtype=np.int64)
+    # (probability, -row): the smallest is evicted first, and among equal
+    # probabilities the later row, so earlier rows win ties.
+    heap = []
+    for _, _, output in scoring_cache.iter_scores(model_id, model, file_path, chunk_size, n_jobs, engine):
+        probs = output[:, 1] if hasattr(rf, 'predict_proba') else output
+        
+        tiers = risk_tiers(probs, thresholds)
+        counts += np.bincount(tiers, minlength=len(RISK_LEVELS))
+        
+        high = np.flatnonzero(tiers == 2)
+        # At most top_n candidates per chunk: highest probability, then earliest row.
+        high = high[np.lexsort((high, -probs[high]))[:top_n]]
+        for i in high.tolist():
+            item = (float(probs[i]), -(total + i))
+            if len(heap) < top_n:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        total += len(probs)
+    
+    top = [(-row, prob) for prob, row in sorted(heap, reverse=True)]
+    return total, counts, top
+
+def generate_report(model_id: str, file_path: str, thresholds: dict, recommendations: dict, n_jobs: int = None,
+                    engine: str = None):
+    model = load_model(model_id)
+    rf = model.named_steps['classifier']
+    total, counts, top = score_report(model_id, file_path, thresholds, n_jobs=n_jobs, engine=engine)
     
     
-    pdf = PDFReport()
+    pdf = _pdf_report()
     pdf.add_page()
     pdf.set_font('Arial', '', 12)
     
     
-    high_risk_count = df[df['Risk Level'] == 'High Risk'].shape[0]
-    medium_risk_count = df[df['Risk Level'] == 'Medium Risk'].shape[0]
+    high_risk_count = int(counts[2])
+    medium_risk_count = int(counts[1])
     
-    pdf.cell(0, 10, f"Total Customers: {len(df)}", 0, 1)
+    pdf.cell(0, 10, f"Total Customers: {total}", 0, 1)
     pdf.cell(0, 10, f"High Risk: {high_risk_count} (Recommendation: {recommendations.get('high', 'N/A')})", 0, 1)
     pdf.cell(0, 10, f"Medium Risk: {medium_risk_count} (Recommendation: {recommendations.get('medium', 'N/A')})", 0, 1)
     pdf.ln(10)
     
     
-    numeric_features = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
-    numeric_features = [f for f in numeric_features if f not in ['Churn Probability', 'Risk Level']]
-    
-    categorical_features = df.select_dtypes(include=['object', 'bool']).columns.tolist()
-    categorical_features = [f for f in categorical_features if f not in ['Risk Level']]
-
-    feature_names = get_feature_names(model, numeric_features, categorical_features)
+    feature_names = get_feature_names(model)
     
     if hasattr(rf, 'feature_importances_') and len(feature_names) == len(rf.feature_importances_):
         importances = rf.feature_importances_
@@ -173,16 +244,11 @@ def generate_report(model_id: str, file_path: str, thresholds: dict, recommendat
     
     
     pdf.set_font('Arial', 'B', 14)
-    pdf.cell(0, 10, "High Risk Customers (Top 50)", 0, 1)
+    pdf.cell(0, 10, f"High Risk Customers (Top {REPORT_TOP_N})", 0, 1)
     pdf.set_font('Arial', '', 10)
     
-    high_risk_df = df[df['Risk Level'] == 'High Risk'].sort_values(by='Churn Probability', ascending=False).head(50)
-    
-    
-    
-    
-    for idx, row in high_risk_df.iterrows():
-        row_str = f"ID: {idx} | Prob: {row['Churn Probability']:.2f}"
+    for idx, prob in top:
+        row_str = f"ID: {idx} | Prob: {prob:.2f}"
         pdf.cell(0, 8, row_str, 0, 1)
         
     report_filename = f"churn_report_{uuid.uuid4()}.pdf"
@@ -190,6 +256,8 @@ def generate_report(model_id: str, file_path: str, thresholds: dict, recommendat
         os.makedirs(UPLOAD_DIR)
         
     report_path = os.path.join(UPLOAD_DIR, report_filename)
-    pdf.output(report_path)
+    with stage("pdf_write") as timed:
+        pdf.output(report_path)
+        timed.bytes_written = os.path.getsize(report_path)
     
     return report_filename
@@ -0,0 +1,505 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from .model_store import FLAT_DIRNAME, get_store_path
+from .preprocess import FrequencyEncoder, HashEncoder, DatetimeFeatures
+from .registry import registry
+from ..utils.config import INFERENCE_ENGINE, ENGINE_BLOCK_ROWS, FLAT_ENGINE_MAX_ROWS
+from ..utils.metrics import stage
+
+ENGINES = ("sklearn", "flat")
+
+
+class UnsupportedPipeline(ValueError):
+    pass
+
+
+# Levels every cursor advances between two compactions in predict_batch.
+COMPACT_LEVELS = 4
+
+
+def _float32_floor(threshold: np.ndarray) -> np.ndarray:
+    """
+    Largest float32 not above each threshold: for any float32 x,
+    x <= t holds exactly when x <= _float32_floor(t).
+    """
+    narrowed = threshold.astype(np.float32)
+    above = narrowed.astype(np.float64) > threshold
+    narrowed[above] = np.nextafter(narrowed[above], np.float32(-np.inf))
+    return narrowed
+
+
+class FlatForest:
+    """
+    All trees of a fitted random forest packed into flat node arrays.
+
+    Child indices are global (already offset by the tree's position), leaves
+    are marked with -1 in `left`, and `value` holds the per-node output that
+    sklearn averages: normalised class distribution for classifiers, the
+    regression value otherwise. `missing_left` is sklearn's
+    missing_go_to_left flag, the branch NaN inputs take.
+
+    save() writes every table as an .npy file; load() memory-maps them
+    read-only, so processes scoring the same stored model share one copy
+    in the page cache.
+    """
+
+    # Everything predict_row and predict_batch read, derived tables included.
+    TABLES = ("left", "right", "feature", "threshold", "value", "roots", "missing_left",
+              "is_leaf", "children", "threshold32")
+
+    def __init__(self, left, right, feature, threshold, value, roots, n_features, missing_left=None):
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.n_features = n_features
+        self.missing_left = missing_left if missing_left is not None else np.zeros(len(left), dtype=bool)
+
+        # Batch traversal tables: leaves point to themselves, so a finished
+        # cursor can keep stepping, and children[2 * node + (x <= threshold)]
+        # is the next node (right child first).
+        self.is_leaf = left == -1
+        own = np.arange(len(left), dtype=np.int64)
+        self.children = np.stack([np.where(self.is_leaf, own, right), np.where(self.is_leaf, own, left)], axis=1).ravel()
+        self.threshold32 = _float32_floor(np.where(self.is_leaf, np.inf, threshold))
+        self.has_missing = bool(self.missing_left.any())
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def save(self, path: str):
+        os.makedirs(path)
+        for name in self.TABLES:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"n_features": int(self.n_features), "has_missing": self.has_missing}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """FlatForest written by save(), its tables memory-mapped read-only by default."""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        forest = cls.__new__(cls)
+        mmap_mode = "r" if mmap else None
+        for name in cls.TABLES:
+            setattr(forest, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+        forest.n_features = meta["n_features"]
+        forest.has_missing = meta["has_missing"]
+        return forest
+
+    def matches(self, forest) -> bool:
+        """Whether this packs a forest of the same shape as the fitted `forest`."""
+        return (self.n_trees == len(forest.estimators_) and self.n_features == forest.n_features_in_
+                and len(self.left) == sum(est.tree_.node_count for est in forest.estimators_))
+
+    @classmethod
+    def from_estimator(cls, forest):
+        if not isinstance(forest, (RandomForestClassifier, RandomForestRegressor)):
+            raise UnsupportedPipeline(f"Unsupported estimator {type(forest).__name__}")
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise UnsupportedPipeline("Multi-output forests are not supported")
+
+        is_classifier = isinstance(forest, RandomForestClassifier)
+        lefts, rights, features, thresholds, values, roots, missing = [], [], [], [], [], [], []
+        offset = 0
+        for est in forest.estimators_:
+            tree = est.tree_
+            left = tree.children_left.astype(np.int64)
+            right = tree.children_right.astype(np.int64)
+            leaf = left == -1
+            lefts.append(np.where(leaf, -1, left + offset))
+            rights.append(np.where(leaf, -1, right + offset))
+            features.append(np.where(leaf, 0, tree.feature).astype(np.int64))
+            thresholds.append(tree.threshold.astype(np.float64))
+            missing_left = getattr(tree, "missing_go_to_left", None)
+            missing.append(np.zeros(tree.node_count, dtype=bool) if missing_left is None
+                           else np.asarray(missing_left, dtype=bool) & ~leaf)
+            if is_classifier:
+                # Same normalisation DecisionTreeClassifier.predict_proba applies.
+                value = tree.value[:, 0, :].astype(np.float64)
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            else:
+                value = tree.value[:, 0, :1].astype(np.float64)
+            values.append(value)
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int64),
+            n_features=forest.n_features_in_,
+            missing_left=np.concatenate(missing),
+        )
+
+    def predict_row(self, x: np.ndarray) -> np.ndarray:
+        """
+        Average forest output for a single transformed row. All trees are
+        walked together, one level per iteration.
+        """
+        # Forests score float32 inputs; cast the same way to take identical branches.
+        x = np.asarray(x, dtype=np.float32)
+        nodes = self.roots.copy()
+        while True:
+            internal = self.left[nodes] != -1
+            if not internal.any():
+                break
+            current = nodes[internal]
+            x_node = x[self.feature[current]]
+            go_left = (x_node <= self.threshold[current]) | (np.isnan(x_node) & self.missing_left[current])
+            nodes[internal] = np.where(go_left, self.left[current], self.right[current])
+        # cumsum accumulates tree by tree, matching sklearn's summation order.
+        return np.cumsum(self.value[nodes], axis=0)[-1] / self.n_trees
+
+    def predict_batch(self, X, block_rows: int = ENGINE_BLOCK_ROWS) -> np.ndarray:
+        """
+        Average forest output for every row of the transformed matrix X
+        (dense or sparse), shape (n_rows, n_classes) for classifiers and
+        (n_rows, 1) for regressors. Rows are scored in blocks of block_rows,
+        run in parallel under the active joblib config.
+        """
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, the forest expects {self.n_features}.")
+        blocks = [(start, min(start + block_rows, X.shape[0])) for start in range(0, X.shape[0], block_rows)]
+        if len(blocks) <= 1:
+            return self._predict_block(X)
+        results = Parallel(prefer="threads")(delayed(self._predict_block)(X[start:stop]) for start, stop in blocks)
+        return np.concatenate(results)
+
+    def _predict_block(self, X) -> np.ndarray:
+        X = X.toarray() if sp.issparse(X) else X
+        # Forests score float32 inputs; cast the same way to take identical branches.
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_trees = X.shape[0], self.n_trees
+        values = X.ravel()
+        # One cursor per (row, tree), row-major. Cursors step COMPACT_LEVELS
+        # levels at a time; those that reached a leaf are then written back
+        # and dropped, so deep trees do not drag the finished ones along.
+        nodes = np.tile(self.roots, n_rows)
+        active = np.arange(nodes.size)
+        current = nodes.copy()
+        base = np.repeat(np.arange(n_rows, dtype=np.int64) * X.shape[1], n_trees)
+        while active.size:
+            for _ in range(COMPACT_LEVELS):
+                x = values[base + self.feature[current]]
+                go_left = x <= self.threshold32[current]
+                if self.has_missing:
+                    go_left |= np.isnan(x) & self.missing_left[current]
+                current = self.children[2 * current + go_left]
+            done = self.is_leaf[current]
+            nodes[active[done]] = current[done]
+            # Integer takes are much cheaper than three boolean masks.
+            pending = np.flatnonzero(~done)
+            active, current, base = active[pending], current[pending], base[pending]
+
+        leaves = nodes.reshape(n_rows, n_trees)
+        output = np.zeros((n_rows, self.value.shape[1]), dtype=np.float64)
+        # Tree by tree, in estimator order: the summation sklearn does.
+        for t in range(n_trees):
+            output += self.value[leaves[:, t]]
+        output /= n_trees
+        return output
+
+
+class RowVectorizer:
+    """
+    Flat numpy re-implementation of the ColumnTransformer produced by
+    build_pipeline, for turning a single feature dict into a model row.
+    """
+
+    def __init__(self, numeric_cols, numeric_offset, medians, means, scales, categorical_cols, cat_fill, cat_maps,
+                 n_output, cat_unknown=None, highcard=(), dates=(), columns=()):
+        # Every column the preprocessor was fitted on; rows must have them all, as for sklearn.
+        self.columns = list(columns)
+        self.numeric_cols = numeric_cols
+        self.numeric_offset = numeric_offset
+        self.medians = medians
+        self.means = means
+        self.scales = scales
+        self.categorical_cols = categorical_cols
+        self.cat_fill = cat_fill
+        self.cat_maps = cat_maps
+        # Output index for categories unseen at fit time (the "infrequent" column), or None.
+        self.cat_unknown = cat_unknown if cat_unknown is not None else [None] * len(categorical_cols)
+        # (column, output index, encoder, input position) for frequency/hash encoded columns.
+        self.highcard = list(highcard)
+        # (column, input position, output offset, DatetimeFeatures, imputer medians).
+        self.dates = list(dates)
+        self.n_output = n_output
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor):
+        if not isinstance(preprocessor, ColumnTransformer):
+            raise UnsupportedPipeline("Preprocessor is not a ColumnTransformer")
+        if not hasattr(preprocessor, "feature_names_in_"):
+            raise UnsupportedPipeline("Preprocessor was fitted without column names")
+
+        numeric_cols, categorical_cols = [], []
+        numeric_offset = 0
+        medians = means = scales = None
+        cat_fill, cat_maps, cat_unknown = [], [], []
+        highcard, dates = [], []
+        n_output = 0
+
+        for name, transformer, columns in preprocessor.transformers_:
+            if name == "remainder":
+                if transformer != "drop":
+                    raise UnsupportedPipeline("Remainder passthrough is not supported")
+                continue
+            columns = list(columns)
+            if len(columns) == 0:
+                continue
+            steps = dict(transformer.steps) if isinstance(transformer, Pipeline) else {}
+
+            if name == "num":
+                imputer, scaler = steps.get("imputer"), steps.get("scaler")
+                if not isinstance(imputer, SimpleImputer) or not isinstance(scaler, StandardScaler):
+                    raise UnsupportedPipeline("Unexpected numeric transformer")
+                stats = np.asarray(imputer.statistics_, dtype=np.float64)
+                if np.isnan(stats).any():
+                    raise UnsupportedPipeline("Imputer dropped empty numeric columns")
+                numeric_cols = columns
+                numeric_offset = n_output
+                medians = stats
+                means = scaler.mean_ if scaler.mean_ is not None else np.zeros(len(columns))
+                scales = scaler.scale_ if scaler.scale_ is not None else np.ones(len(columns))
+                n_output += len(columns)
+
+            elif name == "cat":
+                imputer, onehot = steps.get("imputer"), steps.get("onehot")
+                if not isinstance(imputer, SimpleImputer) or not isinstance(onehot, OneHotEncoder):
+                    raise UnsupportedPipeline("Unexpected categorical transformer")
+                if onehot.drop_idx_ is not None:
+                    raise UnsupportedPipeline("One-hot drop is not supported")
+                infrequent_enabled = getattr(onehot, "_infrequent_enabled", False)
+                categorical_cols = columns
+                cat_fill = list(imputer.statistics_)
+                for i, categories in enumerate(onehot.categories_):
+                    infrequent = onehot.infrequent_categories_[i] if infrequent_enabled else None
+                    if infrequent is None:
+                        cat_maps.append({cat: n_output + j for j, cat in enumerate(categories)})
+                        cat_unknown.append(None)
+                        n_output += len(categories)
+                        continue
+                    # Frequent categories keep their order; the rest share one trailing column.
+                    rare = set(infrequent)
+                    frequent = [cat for cat in categories if cat not in rare]
+                    mapping = {cat: n_output + j for j, cat in enumerate(frequent)}
+                    other = n_output + len(frequent)
+                    mapping.update({cat: other for cat in infrequent})
+                    cat_maps.append(mapping)
+                    cat_unknown.append(other if onehot.handle_unknown == "infrequent_if_exist" else None)
+                    n_output += len(frequent) + 1
+
+            elif name == "highcard":
+                if not isinstance(transformer, (FrequencyEncoder, HashEncoder)):
+                    raise UnsupportedPipeline("Unexpected high-cardinality transformer")
+                for i, col in enumerate(columns):
+                    highcard.append((col, n_output, transformer, i))
+                    n_output += 1
+
+            elif name == "date":
+                extract, imputer = steps.get("extract"), steps.get("imputer")
+                if not isinstance(extract, DatetimeFeatures) or not isinstance(imputer, SimpleImputer):
+                    raise UnsupportedPipeline("Unexpected datetime transformer")
+                stats = np.asarray(imputer.statistics_, dtype=np.float64)
+                width = len(stats) // len(columns)
+                for i, col in enumerate(columns):
+                    dates.append((col, i, n_output, extract, stats[i * width:(i + 1) * width]))
+                    n_output += width
+
+            else:
+                raise UnsupportedPipeline(f"Unexpected transformer {name!r}")
+
+        return cls(numeric_cols, numeric_offset, medians, means, scales, categorical_cols, cat_fill, cat_maps,
+                   n_output, cat_unknown, highcard, dates, preprocessor.feature_names_in_)
+
+    def transform(self, features: dict) -> np.ndarray:
+        """
+        Model row for one feature dict. Rejects what Pipeline.predict_proba
+        rejects, with the same ValueError: missing columns and numeric
+        values that are not numbers. Extra keys are ignored.
+        """
+        missing_cols = [col for col in self.columns if col not in features]
+        if missing_cols:
+            raise ValueError(f"columns are missing: {set(missing_cols)}")
+        row = np.zeros(self.n_output, dtype=np.float64)
+
+        if self.numeric_cols:
+            values = np.empty(len(self.numeric_cols), dtype=np.float64)
+            for i, col in enumerate(self.numeric_cols):
+                value = features[col]
+                try:
+                    values[i] = np.nan if value is None else float(value)
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f"Cannot use median strategy with non-numeric data:\n{e}")
+            missing = np.isnan(values)
+            values[missing] = self.medians[missing]
+            row[self.numeric_offset:self.numeric_offset + len(values)] = (values - self.means) / self.scales
+
+        for col, fill, mapping, unknown in zip(self.categorical_cols, self.cat_fill, self.cat_maps, self.cat_unknown):
+            value = features.get(col)
+            if _is_missing(value):
+                value = fill
+            index = mapping.get(value, unknown)
+            if index is not None:
+                row[index] = 1.0
+
+        for col, index, encoder, position in self.highcard:
+            value = features.get(col)
+            if isinstance(encoder, FrequencyEncoder):
+                row[index] = 0.0 if _is_missing(value) else encoder.frequencies_[position].get(value, 0.0)
+            elif _is_missing(value):
+                row[index] = -1.0
+            else:
+                row[index] = pd.util.hash_array(np.array([str(value)], dtype=object))[0] % encoder.n_buckets
+
+        for col, position, offset, extract, fill in self.dates:
+            parts = extract.transform_value(position, features.get(col))
+            missing = np.isnan(parts)
+            parts[missing] = fill[missing]
+            row[offset:offset + len(parts)] = parts
+
+        return row
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+class CompiledPipeline:
+    def __init__(self, vectorizer: RowVectorizer, forest: FlatForest, is_classifier: bool):
+        self.vectorizer = vectorizer
+        self.forest = forest
+        self.is_classifier = is_classifier
+
+    def predict_one(self, features: dict) -> float:
+        """
+        Probability of the positive class (column 1) for classifiers, the
+        predicted value for regressors; mirrors simulate_prediction.
+        """
+        output = self.forest.predict_row(self.vectorizer.transform(features))
+        return float(output[1] if self.is_classifier else output[0])
+
+    def predict_many(self, rows) -> np.ndarray:
+        """predict_one for each feature dict of `rows`, scored as one batch."""
+        output = self.forest.predict_batch(np.vstack([self.vectorizer.transform(row) for row in rows]))
+        return output[:, 1] if self.is_classifier else output[:, 0]
+
+
+def compile_pipeline(model, forest: FlatForest = None) -> CompiledPipeline:
+    if not isinstance(model, Pipeline) or "preprocessor" not in model.named_steps or "classifier" not in model.named_steps:
+        raise UnsupportedPipeline("Expected a Pipeline with 'preprocessor' and 'classifier' steps")
+
+    rf = model.named_steps["classifier"]
+    is_classifier = isinstance(rf, RandomForestClassifier)
+    if is_classifier and len(rf.classes_) < 2:
+        raise UnsupportedPipeline("Classifier was fitted on a single class")
+
+    vectorizer = RowVectorizer.from_preprocessor(model.named_steps["preprocessor"])
+    forest = forest if forest is not None else FlatForest.from_estimator(rf)
+    if vectorizer.n_output != forest.n_features:
+        raise UnsupportedPipeline("Preprocessor output does not match forest input width")
+    return CompiledPipeline(vectorizer, forest, is_classifier)
+
+
+def get_compiled_pipeline(model_id: str):
+    """
+    Compiled scorer for model_id, cached in the model registry. Returns None
+    when the pipeline has a shape the fast path does not understand, so the
+    caller can fall back to the regular sklearn path.
+    """
+    def _build(model):
+        try:
+            return compile_pipeline(model, get_flat_forest(model_id))
+        except UnsupportedPipeline as e:
+            print(f"Fast path unavailable for {model_id}: {e}")
+            return None
+
+    return registry.get_artifact(model_id, "compiled", _build)
+
+
+def stored_flat_forest(model_id: str, forest):
+    """
+    The packed table save_model wrote to model_id's forest store, memory-mapped,
+    or None when there is none (pickled and older models) or it does not
+    match `forest`.
+    """
+    path = os.path.join(get_store_path(model_id), FLAT_DIRNAME)
+    if not os.path.isdir(path):
+        return None
+    try:
+        flat = FlatForest.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return flat if flat.matches(forest) else None
+
+
+def get_flat_forest(model_id: str):
+    """
+    Packed FlatForest of model_id's forest, cached in the model registry, or
+    None when the estimator is not a supported random forest. Stored tables
+    are memory-mapped; other models are packed in memory.
+    """
+    def _build(model):
+        forest = model.named_steps["classifier"]
+        stored = stored_flat_forest(model_id, forest)
+        if stored is not None:
+            return stored
+        try:
+            return FlatForest.from_estimator(forest)
+        except UnsupportedPipeline as e:
+            print(f"Flat engine unavailable for {model_id}: {e}")
+            return None
+
+    return registry.get_artifact(model_id, "flat_forest", _build)
+
+
+def forest_output(model_id: str, model, X: pd.DataFrame, engine: str = None) -> np.ndarray:
+    """
+    Class probabilities (classifiers) or predictions (regressors) of the
+    pipeline for X. engine "sklearn" runs the forest as sklearn does;
+    "flat" walks the packed forest for batches of up to
+    FLAT_ENGINE_MAX_ROWS rows, giving bit-identical output, and leaves
+    larger batches and forests it cannot pack to sklearn. Defaults to
+    INFERENCE_ENGINE.
+    """
+    with stage("transform"):
+        X = model.named_steps['preprocessor'].transform(X)
+    return transformed_output(model_id, model, X, engine)
+
+
+def transformed_output(model_id: str, model, X, engine: str = None) -> np.ndarray:
+    """forest_output for rows already run through the pipeline's preprocessor."""
+    engine = engine or INFERENCE_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown inference engine {engine!r}; use one of {', '.join(ENGINES)}.")
+
+    rf = model.named_steps['classifier']
+    is_classifier = hasattr(rf, 'predict_proba')
+    # Past a few hundred rows sklearn's Cython traversal outpaces the numpy walk.
+    forest = get_flat_forest(model_id) if engine == "flat" and X.shape[0] <= FLAT_ENGINE_MAX_ROWS else None
+    with stage("predict"):
+        if forest is not None:
+            output = forest.predict_batch(X)
+            return output if is_classifier else output[:, 0]
+        return rf.predict_proba(X) if is_classifier else rf.predict(X)
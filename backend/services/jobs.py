@@ -0,0 +1,170 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .registry import registry
+from .train import train_model, retrain_model, TrainingCancelled
+from .shap_store import build_shap_store
+from ..utils.config import TRAIN_WORKERS, JOB_HISTORY_SIZE
+
+
+def _run_job(job_id: str, state, cancelled, fn, kwargs: dict):
+    """
+    Worker-process entry point for train_model / retrain_model /
+    build_shap_store. Progress
+    and cancellation flow through Manager proxies shared with the API process.
+    """
+    def progress(fraction, stage):
+        state[job_id] = {"progress": fraction, "stage": stage}
+
+    def should_cancel():
+        return cancelled.get(job_id, False)
+
+    return fn(progress=progress, should_cancel=should_cancel, **kwargs)
+
+
+class TrainingJobManager:
+    """
+    Runs train_model, retrain_model and build_shap_store in a process pool so CPU-bound fits never block the
+    API event loop. Jobs are identified by a uuid and kept in memory; the
+    most recent JOB_HISTORY_SIZE finished jobs remain queryable.
+    """
+
+    def __init__(self, max_workers: int = TRAIN_WORKERS, history_size: int = JOB_HISTORY_SIZE):
+        self.max_workers = max_workers
+        self.history_size = history_size
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+        self._state = None
+        self._cancelled = None
+
+    def _ensure_started(self):
+        # The first call boots the Manager process and the pool, which takes
+        # a while: async callers submit through asyncio.to_thread.
+        if self._executor is None:
+            # spawn rather than fork: the API process is multi-threaded.
+            context = multiprocessing.get_context("spawn")
+            self._manager = context.Manager()
+            self._state = self._manager.dict()
+            self._cancelled = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["future"].done()]
+        for job_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self._jobs[job_id]
+            self._state.pop(job_id, None)
+            self._cancelled.pop(job_id, None)
+
+    def _submit(self, kind: str, model_id: str, fn, kwargs: dict, writes_model: bool = True) -> str:
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._ensure_started()
+            self._prune()
+            future = self._executor.submit(_run_job, job_id, self._state, self._cancelled, fn, kwargs)
+            self._jobs[job_id] = {"kind": kind, "model_id": model_id, "future": future, "created_at": time.time()}
+
+        if writes_model:
+            # The worker overwrote the .pkl; make sure no stale pipeline is served.
+            future.add_done_callback(lambda _: registry.invalidate(model_id))
+        return job_id
+
+    def submit(self, file_path: str, target: str, task: str, model_id: str, n_jobs: int = None, backend: str = None,
+               tune: bool = False, tune_candidates: int = None) -> str:
+        return self._submit("train", model_id, train_model, dict(
+            file_path=file_path, target=target, task=task, model_id=model_id,
+            n_jobs=n_jobs, backend=backend, tune=tune, tune_candidates=tune_candidates
+        ))
+
+    def submit_retrain(self, model_id: str, file_path: str, target: str, output_model_id: str = None,
+                       new_trees: int = None, max_trees: int = None, n_jobs: int = None, backend: str = None) -> str:
+        output_model_id = output_model_id or model_id
+        kwargs = dict(
+            model_id=model_id, file_path=file_path, target=target, output_model_id=output_model_id,
+            max_trees=max_trees, n_jobs=n_jobs, backend=backend
+        )
+        if new_trees is not None:
+            kwargs["new_trees"] = new_trees
+        return self._submit("retrain", output_model_id, retrain_model, kwargs)
+
+    def submit_shap(self, model_id: str, file_path: str, approximate: bool = False) -> str:
+        return self._submit("shap", model_id, build_shap_store, dict(
+            model_id=model_id, file_path=file_path, approximate=approximate
+        ), writes_model=False)
+
+    def get_future(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job["future"]
+
+    def status(self, job_id: str) -> dict:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        future = job["future"]
+        state = dict(self._state.get(job_id) or {})
+
+        error = None
+        if future.cancelled():
+            status = "cancelled"
+        elif future.done():
+            exc = future.exception()
+            if exc is None:
+                status = "completed"
+            elif isinstance(exc, TrainingCancelled):
+                status = "cancelled"
+            else:
+                status = "failed"
+                error = str(exc)
+        elif self._cancelled.get(job_id, False):
+            status = "cancelling"
+        elif state:
+            status = "running"
+        else:
+            status = "queued"
+
+        return {
+            "job_id": job_id,
+            "kind": job["kind"],
+            "model_id": job["model_id"],
+            "status": status,
+            "progress": state.get("progress", 1.0 if status == "completed" else 0.0),
+            "stage": state.get("stage"),
+            "error": error,
+            "created_at": job["created_at"],
+        }
+
+    def result(self, job_id: str):
+        """
+        Returns (metrics, feature_importance, memory_report, details), details
+        being the tuning report for training and the retrain report for
+        retraining jobs; SHAP jobs return the store metadata instead. Raises
+        if the job is not completed.
+        """
+        return self.get_future(job_id).result(timeout=0)
+
+    def cancel(self, job_id: str) -> dict:
+        future = self.get_future(job_id)
+        # Queued jobs are dropped outright; running ones stop at the next tree batch.
+        if not future.cancel() and not future.done():
+            self._cancelled[job_id] = True
+        return self.status(job_id)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                for job_id in self._jobs:
+                    self._cancelled[job_id] = True
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._manager.shutdown()
+                self._executor = None
+                self._manager = None
+
+
+training_jobs = TrainingJobManager()
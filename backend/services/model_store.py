@@ -0,0 +1,313 @@
+import copy
+import json
+import os
+import shutil
+import uuid
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.tree._tree import NODE_DTYPE, Tree
+
+from ..utils.helpers import MODEL_DIR
+from ..utils.config import MODEL_FORMAT
+
+STORE_SUFFIX = ".forest"
+EXPORT_DIRNAME = ".export"
+META_FILENAME = "meta.json"
+FLAT_DIRNAME = "flat"
+PIPELINE_FILENAME = "pipeline.joblib"
+FORMAT_VERSION = 1
+VALUE_UINT8_SCALE = 255
+
+
+def get_pickle_path(model_id: str) -> str:
+    return os.path.join(MODEL_DIR, f"{model_id}.pkl")
+
+
+def get_store_path(model_id: str) -> str:
+    return os.path.join(MODEL_DIR, f"{model_id}{STORE_SUFFIX}")
+
+
+def _is_storable(model) -> bool:
+    return (isinstance(model, Pipeline) and "classifier" in model.named_steps
+            and isinstance(model.named_steps["classifier"], (RandomForestClassifier, RandomForestRegressor)))
+
+
+def _storage_dtype(name: str, column: np.ndarray):
+    """int64 node fields shrink to int32 when every value fits; floats are kept exact."""
+    if column.dtype.kind == "i" and column.dtype.itemsize > 4:
+        info = np.iinfo(np.int32)
+        if column.size == 0 or (column.min() >= info.min and column.max() <= info.max):
+            return np.int32
+    return column.dtype
+
+
+def save_model(model, model_id: str, fmt: str = MODEL_FORMAT, quantize: dict = None) -> str:
+    """
+    Persist a fitted pipeline. In "forest" format the trees of the forest
+    are written as one contiguous .npy buffer per node field (all trees
+    concatenated) plus value.npy, next to a pickle of the pipeline with the
+    trees stripped out; anything that is not a random-forest pipeline, or
+    fmt="pickle", is stored as a single joblib .pkl as before. The other
+    representation of the same model_id, if any, is removed.
+
+    The store also holds the forest packed for the flat inference engine
+    (FLAT_DIRNAME, see fastpath.FlatForest.save), which workers memory-map
+    instead of each packing their own copy.
+
+    quantize optionally narrows storage: {"threshold": "float16"|"float32",
+    "value": "uint8"|"float16"|"float32"}. uint8 values are class
+    fractions scaled by 255 (classifiers only). Callers are expected to
+    have rounded the model the same way (see quantize_state) so that what
+    is saved is exactly what was evaluated.
+    """
+    if fmt not in ("forest", "pickle"):
+        raise ValueError("fmt must be 'forest' or 'pickle'.")
+    if quantize and fmt != "forest":
+        raise ValueError("Quantized storage needs the 'forest' format.")
+    if not os.path.exists(MODEL_DIR):
+        os.makedirs(MODEL_DIR)
+
+    store_path, pickle_path = get_store_path(model_id), get_pickle_path(model_id)
+    if fmt == "pickle" or not _is_storable(model):
+        if quantize:
+            raise ValueError("Only random-forest pipelines can be quantized.")
+        joblib.dump(model, pickle_path)
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+        return pickle_path
+
+    quantize = quantize or {}
+    forest = model.named_steps["classifier"]
+    states = [est.tree_.__getstate__() for est in forest.estimators_]
+    nodes = np.concatenate([state["nodes"] for state in states]) if states else np.empty(0, dtype=NODE_DTYPE)
+    offsets = np.zeros(len(states) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([state["node_count"] for state in states])
+    values = np.concatenate([state["values"] for state in states]) if states else np.empty((0, 1, 1))
+    value_scale = None
+    if quantize.get("value") == "uint8":
+        if not isinstance(forest, RandomForestClassifier):
+            raise ValueError("uint8 leaf values are only supported for classifiers.")
+        if values.size and (values.min() < 0.0 or values.max() > 1.0):
+            raise ValueError("uint8 storage needs leaf values as class fractions; round them with quantize_state first.")
+        value_scale = VALUE_UINT8_SCALE
+        values = np.rint(values * value_scale).astype(np.uint8)
+    elif quantize.get("value"):
+        values = values.astype(quantize["value"])
+
+    # Same pipeline, but the forest's estimators keep everything except tree_.
+    skeleton = copy.copy(model)
+    stripped_forest = copy.copy(forest)
+    stripped_forest.estimators_ = []
+    for est in forest.estimators_:
+        shell = copy.copy(est)
+        del shell.tree_
+        stripped_forest.estimators_.append(shell)
+    skeleton.steps = [(name, stripped_forest if step is forest else step) for name, step in model.steps]
+
+    tmp_path = f"{store_path}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_path)
+    fields = {}
+    for name in NODE_DTYPE.names:
+        column = np.ascontiguousarray(nodes[name])
+        dtype = quantize["threshold"] if name == "threshold" and quantize.get("threshold") else _storage_dtype(name, column)
+        column = column.astype(dtype, copy=False)
+        np.save(os.path.join(tmp_path, f"{name}.npy"), column)
+        fields[name] = str(column.dtype)
+    np.save(os.path.join(tmp_path, "value.npy"), values)
+    np.save(os.path.join(tmp_path, "tree_offsets.npy"), offsets)
+    np.save(os.path.join(tmp_path, "tree_max_depth.npy"),
+            np.asarray([state["max_depth"] for state in states], dtype=np.int64))
+    joblib.dump(skeleton, os.path.join(tmp_path, PIPELINE_FILENAME))
+    # fastpath imports the registry, which imports this module.
+    from .fastpath import FlatForest, UnsupportedPipeline
+    try:
+        FlatForest.from_estimator(forest).save(os.path.join(tmp_path, FLAT_DIRNAME))
+    except UnsupportedPipeline:
+        pass
+
+    with open(os.path.join(tmp_path, META_FILENAME), "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "n_trees": len(states),
+            "n_nodes": int(offsets[-1]),
+            "fields": fields,
+            "value_dtype": str(values.dtype),
+            "value_scale": value_scale,
+        }, f)
+
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    os.replace(tmp_path, store_path)
+    if os.path.exists(pickle_path):
+        os.remove(pickle_path)
+    return store_path
+
+
+def _tree_size(path: str) -> int:
+    """Bytes of every file under path, subdirectories (FLAT_DIRNAME) included."""
+    size = 0
+    for entry in os.scandir(path):
+        size += _tree_size(entry.path) if entry.is_dir() else entry.stat().st_size
+    return size
+
+
+def model_version(model_id: str):
+    """
+    ((mtime_ns, size), size) identifying the stored model, preferring the
+    forest store over a legacy .pkl; the size of a forest store includes its
+    flat-engine tables. Raises FileNotFoundError if neither exists.
+    """
+    store_path = get_store_path(model_id)
+    if os.path.isdir(store_path):
+        # meta.json is written last and the directory swapped in atomically.
+        st = os.stat(os.path.join(store_path, META_FILENAME))
+        size = _tree_size(store_path)
+        return (st.st_mtime_ns, size), size
+    try:
+        st = os.stat(get_pickle_path(model_id))
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Model {model_id} not found.")
+    return (st.st_mtime_ns, st.st_size), st.st_size
+
+
+def list_models():
+    """Ids of every stored model, forest store or legacy .pkl."""
+    if not os.path.isdir(MODEL_DIR):
+        return []
+    model_ids = set()
+    for entry in os.scandir(MODEL_DIR):
+        stem, ext = os.path.splitext(entry.name)
+        if (ext == STORE_SUFFIX and entry.is_dir()) or ext == ".pkl":
+            model_ids.add(stem)
+    return sorted(model_ids)
+
+
+def load_tree_arrays(model_id: str, mmap: bool = True) -> dict:
+    """
+    The raw node buffers of a stored forest, memory-mapped read-only by
+    default (_rebuild_trees copies them into sklearn Trees; the tables the
+    flat engine shares between processes are in FLAT_DIRNAME). Keys are
+    the NODE_DTYPE field names plus value, tree_offsets and tree_max_depth,
+    and value_scale (None unless values are stored as scaled integers).
+    Raises FileNotFoundError for models without a store.
+    """
+    store_path = get_store_path(model_id)
+    meta_path = os.path.join(store_path, META_FILENAME)
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"Model {model_id} has no forest store.")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported forest store version {meta.get('version')!r} for {model_id}.")
+
+    mmap_mode = "r" if mmap else None
+    names = list(meta["fields"]) + ["value", "tree_offsets", "tree_max_depth"]
+    arrays = {name: np.load(os.path.join(store_path, f"{name}.npy"), mmap_mode=mmap_mode) for name in names}
+    arrays["value_scale"] = meta.get("value_scale")
+    return arrays
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    """Per-node class fractions, as DecisionTreeClassifier.predict_proba normalises them."""
+    totals = values.sum(axis=-1, keepdims=True)
+    totals[totals == 0.0] = 1.0
+    return values / totals
+
+
+def quantize_state(state: dict, threshold_dtype: str = None, value_dtype: str = None) -> dict:
+    """
+    Round a tree state (Tree.__getstate__()) through the storage dtypes of
+    save_model's quantize option, returning float64 arrays holding exactly
+    what a quantized store will load back.
+    """
+    nodes = state["nodes"].copy()
+    values = np.asarray(state["values"], dtype=np.float64)
+    if threshold_dtype:
+        internal = nodes["left_child"] != -1
+        nodes["threshold"][internal] = nodes["threshold"][internal].astype(threshold_dtype).astype(np.float64)
+    if value_dtype == "uint8":
+        values = np.rint(_normalize(values) * VALUE_UINT8_SCALE).astype(np.uint8) / VALUE_UINT8_SCALE
+    elif value_dtype:
+        values = values.astype(value_dtype).astype(np.float64)
+    return dict(state, nodes=nodes, values=np.ascontiguousarray(values))
+
+
+def tree_from_state(forest, est, state: dict) -> Tree:
+    if isinstance(forest, RandomForestClassifier):
+        n_classes = np.atleast_1d(np.asarray(forest.n_classes_, dtype=np.intp))
+    else:
+        n_classes = np.ones(forest.n_outputs_, dtype=np.intp)
+    tree = Tree(est.n_features_in_, n_classes, forest.n_outputs_)
+    # Tree copies the buffers into its own storage here.
+    tree.__setstate__(state)
+    return tree
+
+
+def _rebuild_trees(forest, arrays: dict):
+    offsets = arrays["tree_offsets"]
+    for i, est in enumerate(forest.estimators_):
+        start, stop = int(offsets[i]), int(offsets[i + 1])
+        nodes = np.empty(stop - start, dtype=NODE_DTYPE)
+        for name in NODE_DTYPE.names:
+            nodes[name] = arrays[name][start:stop]
+        values = np.asarray(arrays["value"][start:stop], dtype=np.float64)
+        if arrays.get("value_scale"):
+            values = values / arrays["value_scale"]
+        est.tree_ = tree_from_state(forest, est, {
+            "max_depth": int(arrays["tree_max_depth"][i]),
+            "node_count": stop - start,
+            "nodes": nodes,
+            "values": np.ascontiguousarray(values),
+        })
+
+
+def load_model_file(model_id: str):
+    """
+    Load a pipeline from the forest store, or from a legacy .pkl when no
+    store exists. Raises FileNotFoundError if the model is unknown.
+    """
+    store_path = get_store_path(model_id)
+    if os.path.isdir(store_path):
+        model = joblib.load(os.path.join(store_path, PIPELINE_FILENAME))
+        _rebuild_trees(model.named_steps["classifier"], load_tree_arrays(model_id))
+        return model
+
+    pickle_path = get_pickle_path(model_id)
+    if not os.path.exists(pickle_path):
+        raise FileNotFoundError(f"Model {model_id} not found.")
+    return joblib.load(pickle_path)
+
+
+def export_model(model_id: str, compress: int = 0) -> str:
+    """
+    Single-file .pkl of the model for download, loadable with joblib.load
+    and accepted by /upload-model. compress is a zlib level (0-9). Exports
+    are kept under MODEL_DIR/.export keyed by model version and level.
+    """
+    if not 0 <= compress <= 9:
+        raise ValueError("compress must be between 0 and 9.")
+    version, _ = model_version(model_id)
+    if compress == 0 and not os.path.isdir(get_store_path(model_id)):
+        return get_pickle_path(model_id)
+
+    export_dir = os.path.join(MODEL_DIR, EXPORT_DIRNAME)
+    os.makedirs(export_dir, exist_ok=True)
+    export_path = os.path.join(export_dir, f"{model_id}-{version[0]}-{version[1]}-z{compress}.pkl")
+    if not os.path.exists(export_path):
+        for entry in os.scandir(export_dir):
+            # Older exports of this model are stale.
+            if entry.name.startswith(f"{model_id}-"):
+                os.remove(entry.path)
+        tmp_path = f"{export_path}.tmp-{uuid.uuid4().hex}"
+        joblib.dump(load_model_file(model_id), tmp_path, compress=("zlib", compress) if compress else 0)
+        os.replace(tmp_path, export_path)
+    return export_path
+
+
+def remove_store(model_id: str):
+    store_path = get_store_path(model_id)
+    if os.path.isdir(store_path):
+        shutil.rmtree(store_path)
@@ -1,35 +1,105 @@
-import pandas as pd
-import joblib
+import numpy as np
 import os
 import uuid
-from .preprocess import load_data, clean_data
+from .preprocess import load_data
+from .registry import load_model
+from .score_cache import scoring_cache
+from ..utils.config import PREDICT_CHUNK_SIZE
+from ..utils.metrics import stage
 
-MODEL_DIR = "backend/models"
 UPLOAD_DIR = "uploads" 
+HISTOGRAM_BINS = 10
 
-def make_prediction(model_id: str, file_path: str):
-    model_path = os.path.join(MODEL_DIR, f"{model_id}.pkl")
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model {model_id} not found.")
+def _result_path():
+    pred_id = str(uuid.uuid4())
+    result_filename = f"prediction_{pred_id}.csv"
     
-    model = joblib.load(model_path)
+    if not os.path.exists(UPLOAD_DIR):
+        os.makedirs(UPLOAD_DIR)
     
-    df = pd.read_csv(file_path)
+    return result_filename, os.path.join(UPLOAD_DIR, result_filename)
+
+def make_prediction(model_id: str, file_path: str, n_jobs: int = None, engine: str = None):
+    model = load_model(model_id)
+    rf = model.named_steps['classifier']
     
+    df = load_data(file_path)
     
     
-    predictions = model.predict(df)
     
-    result_df = df.copy()
-    result_df['prediction'] = predictions
+    output = scoring_cache.score_frame(model_id, model, file_path, df, n_jobs, engine)
+    predictions = rf.classes_.take(np.argmax(output, axis=1)) if hasattr(rf, 'predict_proba') else output
     
-    pred_id = str(uuid.uuid4())
-    result_filename = f"prediction_{pred_id}.csv"
+    df['prediction'] = predictions
     
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
-        
-    result_path = os.path.join(UPLOAD_DIR, result_filename)
-    result_df.to_csv(result_path, index=False)
+    result_filename, result_path = _result_path()
+    with stage("csv_write") as timed:
+        df.to_csv(result_path, index=False)
+        timed.bytes_written = os.path.getsize(result_path)
     
     return predictions.tolist(), result_filename
+
+def make_prediction_stream(model_id: str, file_path: str, chunk_size: int = None, n_jobs: int = None,
+                           engine: str = None):
+    """
+    Score the file chunk by chunk and append each scored chunk to the
+    result CSV, so memory stays bounded by chunk_size rather than file size.
+    Returns a summary of the predictions instead of the predictions themselves.
+    """
+    chunk_size = chunk_size or PREDICT_CHUNK_SIZE
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive.")
+    
+    model = load_model(model_id)
+    rf = model.named_steps['classifier']
+    is_classifier = hasattr(rf, 'predict_proba')
+    
+    result_filename, result_path = _result_path()
+    
+    row_count = 0
+    class_counts = {}
+    bin_edges = np.linspace(0.0, 1.0, HISTOGRAM_BINS + 1)
+    histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    total = 0.0
+    low, high = np.inf, -np.inf
+    
+    scores = scoring_cache.iter_scores(model_id, model, file_path, chunk_size, n_jobs, engine, frames=True)
+    for i, (chunk, _, output) in enumerate(scores):
+        if is_classifier:
+            proba = output
+            # Same decision rule as ForestClassifier.predict, without scoring twice.
+            predictions = rf.classes_.take(np.argmax(proba, axis=1))
+            if proba.shape[1] == 2:
+                histogram += np.histogram(proba[:, 1], bins=bin_edges)[0]
+                total += proba[:, 1].sum()
+            labels, counts = np.unique(predictions, return_counts=True)
+            for label, count in zip(labels.tolist(), counts.tolist()):
+                class_counts[str(label)] = class_counts.get(str(label), 0) + count
+        else:
+            predictions = output
+            total += predictions.sum()
+            low = min(low, predictions.min())
+            high = max(high, predictions.max())
+        
+        chunk['prediction'] = predictions
+        with stage("csv_write") as timed:
+            written = os.path.getsize(result_path) if i else 0
+            chunk.to_csv(result_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            timed.bytes_written = os.path.getsize(result_path) - written
+        row_count += len(chunk)
+    
+    summary = {"row_count": row_count}
+    if is_classifier:
+        summary["class_counts"] = class_counts
+        if histogram.any():
+            summary["probability_histogram"] = {
+                "bin_edges": bin_edges.tolist(),
+                "counts": histogram.tolist()
+            }
+            summary["mean_probability"] = float(total / row_count)
+    elif row_count:
+        summary["mean_prediction"] = float(total / row_count)
+        summary["min_prediction"] = float(low)
+        summary["max_prediction"] = float(high)
+    
+    return summary, result_filename
@@ -1,32 +1,323 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import StandardScaler, OneHotEncoder, FunctionTransformer
-import io
+from sklearn.preprocessing import StandardScaler, OneHotEncoder
+from sklearn.base import BaseEstimator, TransformerMixin
+import os
+import warnings
+from .dataset_cache import read_cache, read_meta, write_cache
+from ..utils.metrics import stage
+from ..utils.config import (
+    ONEHOT_MAX_CATEGORIES, ONEHOT_MIN_FREQUENCY, HIGH_CARDINALITY_ENCODING, DATETIME_SAMPLE_ROWS
+)
 
-def load_data(file_path: str) -> pd.DataFrame:
+def load_data(file_path: str, columns=None) -> pd.DataFrame:
+    """
+    Read an uploaded CSV, optionally projected to `columns`. The first full
+    read converts the file to the columnar cache; later reads come from it.
+    """
+    df = read_cache(file_path, columns)
+    if df is not None:
+        return df
+    
+    try:
+        with stage("csv_parse") as timed:
+            df = pd.read_csv(file_path)
+            timed.bytes_read = os.path.getsize(file_path)
+    except Exception as e:
+        raise ValueError(f"Error reading CSV file: {e}")
+    
     try:
-        df = pd.read_csv(file_path)
+        write_cache(file_path, df)
+    except OSError as e:
+        print(f"Could not write columnar cache for {file_path}: {e}")
+    
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+def load_sample(file_path: str, n_rows: int) -> pd.DataFrame:
+    """First n_rows of the dataset, without parsing the rest of the file."""
+    df = read_cache(file_path, stop=n_rows)
+    if df is not None:
         return df
+    
+    try:
+        with stage("csv_parse"):
+            return pd.read_csv(file_path, nrows=n_rows)
     except Exception as e:
         raise ValueError(f"Error reading CSV file: {e}")
 
+def iter_data_chunks(file_path: str, chunk_size: int, columns=None):
+    """
+    Yield the dataset in row chunks of chunk_size, from the columnar cache
+    when present and by incremental CSV parsing otherwise.
+    """
+    meta = read_meta(file_path)
+    if meta is not None:
+        for start in range(0, meta["n_rows"], chunk_size):
+            yield read_cache(file_path, columns, start, start + chunk_size, meta=meta)
+        return
+    
+    with pd.read_csv(file_path, chunksize=chunk_size, usecols=columns) as reader:
+        while True:
+            with stage("csv_parse") as timed:
+                chunk = next(reader, None)
+                if chunk is None:
+                    # The parser's position is not exposed; count the file once it is consumed.
+                    timed.bytes_read = os.path.getsize(file_path)
+            if chunk is None:
+                return
+            yield chunk
+
 def get_column_info(df: pd.DataFrame):
     columns = df.columns.tolist()
+    datetime_columns = set(detect_datetime_columns(df))
     dtypes = {}
     for col in columns:
         if pd.api.types.is_numeric_dtype(df[col]):
             dtypes[col] = "numeric"
-        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+        elif col in datetime_columns:
             dtypes[col] = "datetime"
         else:
             dtypes[col] = "categorical"
     return columns, dtypes
 
-def build_pipeline(numeric_features, categorical_features):
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+HIGH_CARDINALITY_UNIQUE_RATIO = 0.9
+HASH_BUCKETS = 1024
+DATETIME_MIN_PARSED_RATIO = 0.95
+DATETIME_EPOCH = pd.Timestamp("1970-01-01")
+DATETIME_PARTS = ("year", "month", "dayofweek", "dayofyear", "days_since_epoch")
+
+def _guess_datetime_format(series: pd.Series):
+    first = series.dropna()
+    if first.empty:
+        return None
+    return pd.tseries.api.guess_datetime_format(str(first.iloc[0]))
+
+def parse_datetime(series: pd.Series, fmt: str = None) -> pd.Series:
+    """
+    Parse text to datetime64, unparseable values becoming NaT. With a known
+    format the whole column is parsed in one vectorised pass; without one
+    each value is parsed on its own.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return pd.to_datetime(series, format=fmt or "mixed", errors="coerce")
+
+def detect_datetime_columns(df: pd.DataFrame, sample_rows: int = DATETIME_SAMPLE_ROWS):
+    """
+    Text columns (like Onboard_date) where nearly every value in a sample of
+    sample_rows parses as a date. Numeric columns are never reported.
+    """
+    found = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            found.append(col)
+            continue
+        if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+            continue
+        sample = series.dropna().head(sample_rows)
+        if sample.empty or not sample.map(lambda v: isinstance(v, str)).all():
+            continue
+        parsed = parse_datetime(sample, _guess_datetime_format(sample))
+        if parsed.notna().mean() >= DATETIME_MIN_PARSED_RATIO:
+            found.append(col)
+    return found
+
+def _downcast_numeric(series: pd.Series) -> pd.Series:
+    """float64 -> float32 and int64 -> int32, but only when no value changes."""
+    if pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+        downcast = series.astype(np.float32)
+        if np.array_equal(downcast.to_numpy(np.float64), series.to_numpy(np.float64), equal_nan=True):
+            return downcast
+    elif pd.api.types.is_integer_dtype(series) and series.dtype.itemsize > 4:
+        info = np.iinfo(np.int32)
+        if series.empty or (series.min() >= info.min and series.max() <= info.max):
+            return series.astype(np.int32)
+    return series
+
+def optimize_dtypes(df: pd.DataFrame, target: str = None, keep=()):
+    """
+    Shrink a frame before training: lossless numeric downcasts, `category`
+    for low-cardinality text, and drop near-unique text columns such as
+    names or addresses, which would otherwise explode into one one-hot
+    column per row. Text columns that are kept but too diverse to one-hot
+    are encoded inside the pipeline (FrequencyEncoder / HashEncoder), so
+    the same encoding applies at inference. The target column and the
+    columns in `keep` (e.g. dates that are encoded later) are left
+    untouched. Returns the new frame and a report of what changed.
+    """
+    bytes_before = int(df.memory_usage(deep=True).sum())
+    n_rows = max(len(df), 1)
+    report = {"downcast": {}, "categorized": [], "dropped": []}
+    
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col == target or col in keep or pd.api.types.is_bool_dtype(series):
+            columns[col] = series
+        elif pd.api.types.is_numeric_dtype(series):
+            downcast = _downcast_numeric(series)
+            if downcast.dtype != series.dtype:
+                report["downcast"][col] = f"{series.dtype} -> {downcast.dtype}"
+            columns[col] = downcast
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            unique_ratio = series.nunique(dropna=True) / n_rows
+            if unique_ratio >= HIGH_CARDINALITY_UNIQUE_RATIO:
+                report["dropped"].append(col)
+            elif unique_ratio <= CATEGORY_MAX_UNIQUE_RATIO:
+                columns[col] = series.astype("category")
+                report["categorized"].append(col)
+            else:
+                columns[col] = series
+        else:
+            columns[col] = series
+    
+    optimized = pd.DataFrame(columns, index=df.index)
+    bytes_after = int(optimized.memory_usage(deep=True).sum())
+    report.update({
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved": bytes_before - bytes_after
+    })
+    return optimized, report
+
+class FrequencyEncoder(BaseEstimator, TransformerMixin):
+    """
+    Replace each category by its share of the training rows, giving one
+    output column per input column however many categories there are.
+    Missing and unseen values map to 0.
+    """
+
+    def fit(self, X, y=None):
+        X = pd.DataFrame(X)
+        self.columns_ = [str(col) for col in X.columns]
+        self.frequencies_ = [X[col].value_counts(normalize=True, dropna=True).to_dict() for col in X.columns]
+        return self
+
+    def transform(self, X):
+        X = pd.DataFrame(X)
+        out = np.empty((len(X), len(self.frequencies_)), dtype=np.float64)
+        for i, (col, frequencies) in enumerate(zip(X.columns, self.frequencies_)):
+            out[:, i] = X[col].astype(object).map(frequencies).fillna(0.0).to_numpy(dtype=np.float64)
+        return out
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray([f"{col}_frequency" for col in self.columns_], dtype=object)
+
+class HashEncoder(BaseEstimator, TransformerMixin):
+    """
+    Hash each value into one of n_buckets integer codes (missing -> -1).
+    Stateless, so unseen categories need no special handling.
+    """
+
+    def __init__(self, n_buckets: int = HASH_BUCKETS):
+        self.n_buckets = n_buckets
+
+    def fit(self, X, y=None):
+        self.columns_ = [str(col) for col in pd.DataFrame(X).columns]
+        return self
+
+    def transform(self, X):
+        X = pd.DataFrame(X)
+        out = np.empty((len(X), X.shape[1]), dtype=np.float64)
+        for i, col in enumerate(X.columns):
+            values = X[col]
+            hashed = (pd.util.hash_array(values.astype(str).to_numpy(dtype=object)) % self.n_buckets).astype(np.int64)
+            out[:, i] = np.where(values.notna().to_numpy(), hashed, -1)
+        return out
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray([f"{col}_hash" for col in self.columns_], dtype=object)
+
+class DatetimeFeatures(BaseEstimator, TransformerMixin):
+    """
+    Expand each date column into DATETIME_PARTS (calendar parts plus days
+    since the epoch). The text format is inferred once at fit time so that
+    transform parses whole columns in a single pass; unparseable -> NaN.
+    """
+
+    def fit(self, X, y=None):
+        X = pd.DataFrame(X)
+        self.columns_ = [str(col) for col in X.columns]
+        self.formats_ = [_guess_datetime_format(X[col]) for col in X.columns]
+        return self
+
+    def transform(self, X):
+        X = pd.DataFrame(X)
+        parts = []
+        for col, fmt in zip(X.columns, self.formats_):
+            parsed = parse_datetime(X[col], fmt)
+            parts.append(np.column_stack([
+                parsed.dt.year.to_numpy(dtype=np.float64, na_value=np.nan),
+                parsed.dt.month.to_numpy(dtype=np.float64, na_value=np.nan),
+                parsed.dt.dayofweek.to_numpy(dtype=np.float64, na_value=np.nan),
+                parsed.dt.dayofyear.to_numpy(dtype=np.float64, na_value=np.nan),
+                ((parsed - DATETIME_EPOCH) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64, na_value=np.nan),
+            ]))
+        if not parts:
+            return np.empty((len(X), 0), dtype=np.float64)
+        return np.hstack(parts)
+
+    def transform_value(self, index: int, value) -> np.ndarray:
+        """DATETIME_PARTS of a single value of the index-th column, as transform would compute them."""
+        try:
+            ts = pd.to_datetime(value, format=self.formats_[index] or "mixed")
+        except (TypeError, ValueError):
+            ts = pd.NaT
+        if pd.isna(ts):
+            return np.full(len(DATETIME_PARTS), np.nan)
+        return np.array([ts.year, ts.month, ts.dayofweek, ts.dayofyear,
+                         (ts - DATETIME_EPOCH) / pd.Timedelta(days=1)], dtype=np.float64)
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray([f"{col}_{part}" for col in self.columns_ for part in DATETIME_PARTS], dtype=object)
+
+def split_features(X: pd.DataFrame, datetime_features=None, max_categories: int = ONEHOT_MAX_CATEGORIES):
+    """
+    Assign each column of X to an encoding: numeric, datetime, one-hot
+    categorical (at most max_categories distinct values) or high-cardinality.
+    """
+    if datetime_features is None:
+        datetime_features = detect_datetime_columns(X)
+    datetime_features = [col for col in X.columns if col in set(datetime_features)]
+    
+    numeric_features = [col for col in X.select_dtypes(include=['number']).columns if col not in datetime_features]
+    categorical_features, high_cardinality_features = [], []
+    for col in X.select_dtypes(include=['object', 'string', 'bool', 'category']).columns:
+        if col in datetime_features:
+            continue
+        if X[col].nunique(dropna=True) > max_categories:
+            high_cardinality_features.append(col)
+        else:
+            categorical_features.append(col)
+    
+    return {
+        "numeric": numeric_features,
+        "categorical": categorical_features,
+        "high_cardinality": high_cardinality_features,
+        "datetime": datetime_features
+    }
+
+def build_pipeline(numeric_features, categorical_features, high_cardinality_features=(), datetime_features=(),
+                   high_cardinality_encoding: str = HIGH_CARDINALITY_ENCODING):
+    """
+    ColumnTransformer for the feature groups of split_features. One-hot
+    columns fold categories rarer than ONEHOT_MIN_FREQUENCY into a single
+    "infrequent" column, high-cardinality columns are frequency-encoded or
+    hashed to one column each, and dates are expanded to calendar parts,
+    so the width of the output does not grow with the number of distinct values.
+    """
+    if high_cardinality_encoding not in ("frequency", "hash"):
+        raise ValueError("high_cardinality_encoding must be 'frequency' or 'hash'.")
+    
     numeric_transformer = Pipeline(steps=[
         ('imputer', SimpleImputer(strategy='median')),
         ('scaler', StandardScaler())
@@ -34,17 +325,43 @@ def build_pipeline(numeric_features, categorical_features):
 
     categorical_transformer = Pipeline(steps=[
         ('imputer', SimpleImputer(strategy='most_frequent')),
-        ('onehot', OneHotEncoder(handle_unknown='ignore'))
+        ('onehot', OneHotEncoder(handle_unknown='infrequent_if_exist',
+                                 min_frequency=ONEHOT_MIN_FREQUENCY,
+                                 max_categories=ONEHOT_MAX_CATEGORIES))
     ])
 
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ('num', numeric_transformer, numeric_features),
-            ('cat', categorical_transformer, categorical_features)
+    transformers = [
+        ('num', numeric_transformer, list(numeric_features)),
+        ('cat', categorical_transformer, list(categorical_features))
+    ]
+    if len(high_cardinality_features):
+        encoder = FrequencyEncoder() if high_cardinality_encoding == "frequency" else HashEncoder()
+        transformers.append(('highcard', encoder, list(high_cardinality_features)))
+    if len(datetime_features):
+        datetime_transformer = Pipeline(steps=[
+            ('extract', DatetimeFeatures()),
+            ('imputer', SimpleImputer(strategy='median', keep_empty_features=True))
         ])
+        transformers.append(('date', datetime_transformer, list(datetime_features)))
+
+    preprocessor = ColumnTransformer(transformers=transformers)
 
     return preprocessor
 
+def get_transformed_feature_names(preprocessor):
+    """
+    Output feature names of a fitted ColumnTransformer, without the
+    "num__"/"cat__" prefixes. Returns [] if they cannot be determined.
+    """
+    try:
+        names = preprocessor.get_feature_names_out()
+    except Exception as e:
+        print(f"Error extracting feature names: {e}")
+        return []
+    
+    prefixes = tuple(f"{name}__" for name, _, _ in preprocessor.transformers_)
+    return [name.split("__", 1)[1] if name.startswith(prefixes) else name for name in names]
+
 def clean_data(df: pd.DataFrame, target: str = None):
     
     if target and target in df.columns:
@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+
+from ..utils.config import MODEL_CACHE_MAX_ENTRIES, MODEL_CACHE_MAX_BYTES
+from ..utils.metrics import stage
+from .model_store import list_models, load_model_file, model_version
+
+
+class _Entry:
+    __slots__ = ("model", "version", "size", "artifacts")
+
+    def __init__(self, model, version, size):
+        self.model = model
+        self.version = version
+        self.size = size
+        self.artifacts = {}
+
+
+class ModelRegistry:
+    """
+    Process-wide LRU cache of loaded model pipelines.
+
+    Entries are keyed on model_id and validated against the stored model's
+    (mtime_ns, size) on every lookup, so a model that is overwritten on disk
+    is reloaded even if nobody called invalidate(). The cache is bounded both
+    by entry count and by the total on-disk size of the models it holds.
+    """
+
+    def __init__(self, max_entries: int = MODEL_CACHE_MAX_ENTRIES, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _file_version(self, model_id: str):
+        return model_version(model_id)
+
+    def _drop(self, model_id: str):
+        entry = self._entries.pop(model_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            model_id = next(iter(self._entries))
+            self._drop(model_id)
+            self.evictions += 1
+
+    def get(self, model_id: str):
+        version, size = self._file_version(model_id)
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(model_id)
+                self.hits += 1
+                return entry.model
+            self.misses += 1
+
+        # Loading is the expensive part; do it outside the lock so that
+        # lookups for other models are not serialised behind it.
+        with stage("model_load") as timed:
+            model = load_model_file(model_id)
+            timed.bytes_read = size
+
+        with self._lock:
+            self._drop(model_id)
+            if size <= self.max_bytes and self.max_entries > 0:
+                self._entries[model_id] = _Entry(model, version, size)
+                self._bytes += size
+                self._evict()
+        return model
+
+    def get_artifact(self, model_id: str, name: str, factory):
+        """
+        Return an object derived from the model (e.g. a compiled scorer),
+        building it with factory(model) on first use. Artifacts live and die
+        with the cached entry, so they are rebuilt whenever the model is.
+        """
+        model = self.get(model_id)
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None and entry.model is model and name in entry.artifacts:
+                return entry.artifacts[name]
+
+        artifact = factory(model)
+
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None and entry.model is model:
+                entry.artifacts[name] = artifact
+        return artifact
+
+    def invalidate(self, model_id: str):
+        with self._lock:
+            if self._drop(model_id) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "models": list(self._entries.keys()),
+            }
+
+
+registry = ModelRegistry()
+
+
+def load_model(model_id: str):
+    return registry.get(model_id)
+
+
+def warm_up(model_ids) -> dict:
+    """
+    Load model_ids into the registry ahead of traffic; "*" stands for every
+    stored model, up to the registry's entry limit. Models that cannot be
+    loaded are reported and skipped. Returns load seconds per model.
+    """
+    if "*" in model_ids:
+        model_ids = list_models()[:registry.max_entries]
+    loaded = {}
+    for model_id in model_ids:
+        start = time.perf_counter()
+        try:
+            registry.get(model_id)
+        except Exception as e:
+            print(f"Warm-up skipped model {model_id}: {e}")
+            continue
+        loaded[model_id] = round(time.perf_counter() - start, 3)
+    return loaded
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+from .model_store import model_version
+from ..utils.helpers import UPLOAD_DIR
+from ..utils.config import SHAP_PLOT_MAX_FEATURES, SHAP_PLOT_MAX_POINTS, RENDER_WORKERS, RENDER_CACHE_MAX_BYTES
+from ..utils.metrics import stage
+
+RENDER_DIRNAME = ".renders"
+_KEY = re.compile(r"^[0-9a-f]{40}$")
+
+
+def _scale_colours(values: np.ndarray) -> np.ndarray:
+    """Feature values mapped to [0, 1] between their 5th and 95th percentiles, as shap colours them."""
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return np.full(values.shape, np.nan)
+    low, high = np.percentile(finite, [5, 95])
+    if high <= low:
+        low, high = finite.min(), finite.max()
+    if high <= low:
+        return np.where(np.isfinite(values), 0.5, np.nan)
+    return np.clip((values - low) / (high - low), 0.0, 1.0)
+
+
+def summary_data(shap_values: np.ndarray, X, feature_names, importance: np.ndarray, expected_value: float,
+                 max_features: int = SHAP_PLOT_MAX_FEATURES, max_points: int = SHAP_PLOT_MAX_POINTS) -> dict:
+    """
+    JSON-serialisable data of a SHAP summary (beeswarm) chart: the
+    max_features most important features, each with the SHAP values and
+    colour-scaled feature values of at most max_points rows.
+    """
+    X = X.toarray() if sp.issparse(X) else np.asarray(X, dtype=np.float64)
+    rows = np.arange(shap_values.shape[0])
+    if len(rows) > max_points:
+        rows = np.sort(np.random.default_rng(0).choice(len(rows), max_points, replace=False))
+
+    features = []
+    for i in np.argsort(-importance, kind="stable")[:max_features]:
+        colours = _scale_colours(X[rows, i].astype(np.float64))
+        features.append({
+            "name": feature_names[i],
+            "importance": float(importance[i]),
+            "shap_values": np.round(shap_values[rows, i].astype(np.float64), 6).tolist(),
+            "feature_values": [None if np.isnan(c) else round(float(c), 4) for c in colours],
+        })
+    return {"expected_value": expected_value, "n_points": len(rows), "features": features}
+
+
+def render_summary(data: dict, path: str):
+    """
+    Draw the summary chart of summary_data() to a PNG. Uses a standalone
+    Figure with its own Agg canvas, so no pyplot global state is touched
+    and renders can run concurrently.
+    """
+    with stage("render") as timed:
+        _draw_summary(data, path)
+        timed.bytes_written = os.path.getsize(path)
+
+
+def _draw_summary(data: dict, path: str):
+    # matplotlib is imported by the render threads, not when the app starts.
+    from matplotlib import colormaps
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.colors import Normalize
+    from matplotlib.figure import Figure
+
+    features = data["features"][::-1]
+    fig = Figure(figsize=(8, 0.4 * len(features) + 1.5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    cmap = colormaps["coolwarm"]
+    rng = np.random.default_rng(0)
+    for position, feature in enumerate(features):
+        shap_values = np.asarray(feature["shap_values"], dtype=np.float64)
+        colours = np.asarray([np.nan if c is None else c for c in feature["feature_values"]], dtype=np.float64)
+        y = position + rng.uniform(-0.3, 0.3, len(shap_values))
+        missing = np.isnan(colours)
+        ax.scatter(shap_values[missing], y[missing], color="#888888", s=8, alpha=0.6, linewidths=0)
+        ax.scatter(shap_values[~missing], y[~missing], c=colours[~missing], cmap=cmap, vmin=0.0, vmax=1.0,
+                   s=8, alpha=0.8, linewidths=0)
+    ax.axvline(0.0, color="#999999", linewidth=0.8)
+    ax.set_yticks(range(len(features)))
+    ax.set_yticklabels([feature["name"] for feature in features])
+    ax.set_ylim(-0.5, len(features) - 0.5)
+    ax.set_xlabel("SHAP value (impact on model output)")
+    colorbar = fig.colorbar(ScalarMappable(norm=Normalize(0.0, 1.0), cmap=cmap), ax=ax, ticks=[0.0, 1.0], aspect=40)
+    colorbar.set_ticklabels(["Low", "High"])
+    colorbar.set_label("Feature value")
+    fig.savefig(path, format="png", bbox_inches="tight", dpi=100)
+
+
+class PlotRenderer:
+    """
+    Cache of SHAP summary artifacts keyed by (model version, upload,
+    sample config): a JSON payload with the importances and chart data,
+    and the PNG rendered from it by a background thread pool. The PNG can
+    always be (re)built from the JSON, in whichever process asks for it.
+    Explanations are evicted least recently used first once the directory
+    exceeds max_bytes.
+    """
+
+    def __init__(self, render_dir: str = os.path.join(UPLOAD_DIR, RENDER_DIRNAME), workers: int = RENDER_WORKERS,
+                 max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.render_dir = render_dir
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self._pool = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def key(self, model_id: str, file_path: str, config: dict) -> str:
+        st = os.stat(file_path)
+        identity = {
+            "model_id": model_id,
+            "model_version": list(model_version(model_id)[0]),
+            "source": [os.path.abspath(file_path), st.st_size, st.st_mtime_ns],
+            "config": config,
+        }
+        return hashlib.sha1(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def data_path(self, key: str) -> str:
+        return os.path.join(self.render_dir, f"{key}.json")
+
+    def plot_path(self, key: str) -> str:
+        return os.path.join(self.render_dir, f"{key}.png")
+
+    def load(self, key: str):
+        try:
+            with open(self.data_path(key)) as f:
+                payload = json.load(f)
+            # The JSON's mtime is the explanation's last use, for eviction.
+            os.utime(self.data_path(key))
+        except (OSError, ValueError):
+            return None
+        return payload
+
+    def _write(self, path: str, write):
+        os.makedirs(self.render_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def store(self, key: str, payload: dict):
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f)
+
+        self._write(self.data_path(key), write)
+        self.evict(keep=key)
+
+    def _render(self, key: str, data: dict):
+        try:
+            self._write(self.plot_path(key), lambda tmp_path: render_summary(data, tmp_path))
+            self.evict(keep=key)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _queue(self, key: str, data: dict):
+        """Future of the queued render of `key`, or None when its PNG exists."""
+        if os.path.exists(self.plot_path(key)):
+            return None
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+                future = self._pending[key] = self._pool.submit(self._render, key, data)
+        return future
+
+    def submit(self, key: str, data: dict) -> bool:
+        """Queue the PNG for `key` if needed; True when it is ready now."""
+        return self._queue(key, data) is None
+
+    def ensure_plot(self, key: str) -> str:
+        """
+        Path of the PNG for `key`, waiting for a queued render or rendering
+        from the cached data if needed. Raises FileNotFoundError for keys
+        that were never explained.
+        """
+        if not _KEY.match(key):
+            raise FileNotFoundError(f"No rendered explanation {key}.")
+        with self._lock:
+            future = self._pending.get(key)
+        if future is None and not os.path.exists(self.plot_path(key)):
+            payload = self.load(key)
+            if payload is None:
+                raise FileNotFoundError(f"No rendered explanation {key}.")
+            future = self._queue(key, payload["plot_data"])
+        if future is not None:
+            future.result()
+        try:
+            os.utime(self.plot_path(key))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No rendered explanation {key}.")
+        return self.plot_path(key)
+
+    def ensure_data(self, key: str) -> str:
+        path = self.data_path(key)
+        if not _KEY.match(key):
+            raise FileNotFoundError(f"No explanation data {key}.")
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No explanation data {key}.")
+        return path
+
+    def _entries(self):
+        """(last use, bytes, key) per cached explanation, its JSON and PNG counted together."""
+        files = {}
+        if not os.path.isdir(self.render_dir):
+            return []
+        for entry in os.scandir(self.render_dir):
+            key, ext = os.path.splitext(entry.name)
+            # Skips in-flight "<key>.<ext>.tmp-*" files.
+            if ext not in (".json", ".png") or not _KEY.match(key):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            used, size = files.get(key, (0, 0))
+            files[key] = (max(used, st.st_mtime_ns), size + st.st_size)
+        return [(used, size, key) for key, (used, size) in files.items()]
+
+    def evict(self, keep: str = None):
+        """
+        Remove least recently used explanations until the directory fits in
+        max_bytes, sparing `keep` and keys whose PNG is still rendering.
+        """
+        with self._lock:
+            spared = set(self._pending) | {keep}
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                if key in spared:
+                    continue
+                for path in (self.data_path(key), self.plot_path(key)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+renderer = PlotRenderer()
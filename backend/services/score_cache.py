@@ -0,0 +1,371 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+import scipy.sparse as sp
+
+from .fastpath import transformed_output
+from .model_store import model_version
+from .preprocess import iter_data_chunks
+from ..utils.config import PREDICT_CHUNK_SIZE, SCORING_CACHE_MAX_BYTES
+from ..utils.helpers import UPLOAD_DIR, file_index, get_file_hash
+from ..utils.metrics import stage
+from ..utils.parallel import parallelism
+
+CACHE_DIRNAME = ".scoring"
+META_FILENAME = "meta.json"
+OUTPUT_FILENAME = "output.bin"
+DENSE_FILENAME = "X.bin"
+CSR_FILENAMES = ("data.bin", "indices.bin", "indptr.bin")
+FORMAT_VERSION = 1
+
+
+def _content_id(file_path: str) -> str:
+    """
+    Identity of a file's content: the SHA-256 recorded for the upload when
+    file_path is an indexed upload, else its path, size and mtime.
+    """
+    file_id = os.path.splitext(os.path.basename(file_path))[0]
+    record = file_index.get(file_id)
+    if record is not None and os.path.abspath(record["path"]) == os.path.abspath(file_path):
+        return f"sha256:{get_file_hash(file_id)}"
+    st = os.stat(file_path)
+    return f"stat:{os.path.abspath(file_path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _as_float32(X):
+    """The transformed matrix as the cache stores it: float32, CSR if sparse."""
+    if sp.issparse(X):
+        return sp.csr_matrix(X, dtype=np.float32)
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+class ScoredFile:
+    """
+    Read-only view of a cached entry: the model output of every row
+    (float64, as the forest computed it) and the transformed features
+    (float32), memory-mapped so only the rows asked for are read.
+    """
+
+    def __init__(self, path: str, meta: dict):
+        self.meta = meta
+        self.n_rows = meta["n_rows"]
+        self.n_features = meta["n_features"]
+        self.sparse = meta["sparse"]
+        shape = (self.n_rows,) + tuple(meta["output_shape"])
+        self.output = np.memmap(os.path.join(path, OUTPUT_FILENAME), dtype=np.float64, mode="r", shape=shape)
+        if self.sparse:
+            data, indices, indptr = (os.path.join(path, name) for name in CSR_FILENAMES)
+            self._indptr = np.memmap(indptr, dtype=np.int64, mode="r", shape=(self.n_rows + 1,))
+            nnz = int(self._indptr[-1])
+            # Empty files cannot be mapped; an all-zero matrix has no data.
+            self._data = np.memmap(data, dtype=np.float32, mode="r", shape=(nnz,)) if nnz else np.empty(0, np.float32)
+            self._indices = np.memmap(indices, dtype=np.int32, mode="r", shape=(nnz,)) if nnz else np.empty(0, np.int32)
+        else:
+            self._X = np.memmap(os.path.join(path, DENSE_FILENAME), dtype=np.float32, mode="r",
+                                shape=(self.n_rows, self.n_features))
+
+    def rows(self, start: int, stop: int):
+        """Transformed features of rows [start, stop)."""
+        if not self.sparse:
+            return np.array(self._X[start:stop])
+        lo, hi = int(self._indptr[start]), int(self._indptr[stop])
+        return sp.csr_matrix((np.array(self._data[lo:hi]), np.array(self._indices[lo:hi]),
+                              np.array(self._indptr[start:stop + 1]) - lo),
+                             shape=(stop - start, self.n_features))
+
+    def take(self, indices: np.ndarray):
+        """Transformed features of the given rows, in that order."""
+        indices = np.asarray(indices, dtype=np.int64)
+        if not self.sparse:
+            return np.asarray(self._X[indices])
+        starts = np.asarray(self._indptr[indices])
+        lengths = np.asarray(self._indptr[indices + 1]) - starts
+        indptr = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # Position of every kept non-zero in the stored data/indices arrays.
+        gather = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return sp.csr_matrix((np.asarray(self._data[gather]), np.asarray(self._indices[gather]), indptr),
+                             shape=(len(indices), self.n_features))
+
+
+class _ScoredArrays:
+    """In-memory stand-in for ScoredFile, for files too large to cache."""
+
+    def __init__(self, X, output: np.ndarray):
+        self.X = X
+        self.output = output
+        self.n_rows, self.n_features = X.shape
+        self.sparse = sp.issparse(X)
+
+    def rows(self, start: int, stop: int):
+        return self.X[start:stop]
+
+    def take(self, indices: np.ndarray):
+        return self.X[np.asarray(indices, dtype=np.int64)]
+
+
+class _EntryWriter:
+    """
+    Appends scored chunks to a temporary entry directory; the entry only
+    becomes visible on commit. Stops writing (and keeps scoring) once the
+    entry alone would exceed the cache's disk budget.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.path = os.path.join(cache_dir, f".tmp-{uuid.uuid4().hex}")
+        self.max_bytes = max_bytes
+        self.active = True
+        self.files = {}
+        self.sparse = None
+        self.n_rows = 0
+        self.n_features = None
+        self.output_shape = None
+        self.nnz = 0
+        self.bytes = 0
+        os.makedirs(self.path)
+
+    def _file(self, name: str):
+        if name not in self.files:
+            self.files[name] = open(os.path.join(self.path, name), "wb")
+        return self.files[name]
+
+    def _write(self, name: str, array: np.ndarray):
+        array.tofile(self._file(name))
+        self.bytes += array.nbytes
+
+    def append(self, X, output: np.ndarray):
+        if not self.active:
+            return
+        if self.sparse is None:
+            self.sparse, self.n_features, self.output_shape = sp.issparse(X), X.shape[1], output.shape[1:]
+        # ColumnTransformer decides sparse vs dense per call; keep the first chunk's layout.
+        if self.sparse and not sp.issparse(X):
+            X = sp.csr_matrix(X)
+        elif not self.sparse and sp.issparse(X):
+            X = X.toarray()
+
+        if self.sparse:
+            indptr = X.indptr.astype(np.int64) + self.nnz
+            self._write(CSR_FILENAMES[0], X.data.astype(np.float32, copy=False))
+            self._write(CSR_FILENAMES[1], X.indices.astype(np.int32, copy=False))
+            self._write(CSR_FILENAMES[2], indptr if self.n_rows == 0 else indptr[1:])
+            self.nnz += X.nnz
+        else:
+            self._write(DENSE_FILENAME, np.ascontiguousarray(X, dtype=np.float32))
+        self._write(OUTPUT_FILENAME, np.ascontiguousarray(output, dtype=np.float64))
+        self.n_rows += X.shape[0]
+        if self.bytes > self.max_bytes:
+            self.discard()
+
+    def _close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def commit(self, entry_path: str, meta: dict) -> bool:
+        """Swap the entry in; False if it was abandoned or another writer got there first."""
+        self._close()
+        if not self.active or not self.n_rows or not self.n_features:
+            self.discard()
+            return False
+        meta = dict(meta, version=FORMAT_VERSION, n_rows=self.n_rows, n_features=self.n_features,
+                    sparse=self.sparse, output_shape=list(self.output_shape), bytes=self.bytes)
+        with open(os.path.join(self.path, META_FILENAME), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.replace(self.path, entry_path)
+        except OSError:
+            self.discard()
+            return False
+        self.active = False
+        return True
+
+    def discard(self):
+        self._close()
+        self.active = False
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ScoringCache:
+    """
+    Disk cache of scored files keyed by (model version, file content): the
+    preprocessed feature matrix (dense float32 or CSR) and the forest
+    output of every row, written the first time a file is scored. Later
+    predictions, reports with other thresholds and SHAP runs on the same
+    file read them back instead of parsing and scoring it again. Entries
+    are evicted least recently used first once the total exceeds
+    max_bytes; the output does not depend on the inference engine, which
+    is bit-exact across engines.
+    """
+
+    def __init__(self, cache_dir: str = os.path.join(UPLOAD_DIR, CACHE_DIRNAME),
+                 max_bytes: int = SCORING_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _identity(self, model_id: str, file_path: str) -> dict:
+        return {
+            "model_id": model_id,
+            "model_version": list(model_version(model_id)[0]),
+            "content": _content_id(file_path),
+        }
+
+    def _entry_path(self, identity: dict) -> str:
+        key = hashlib.sha1(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, model_id: str, file_path: str):
+        """The cached ScoredFile of file_path under model_id, or None."""
+        identity = self._identity(model_id, file_path)
+        path = self._entry_path(identity)
+        meta_path = os.path.join(path, META_FILENAME)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("version") != FORMAT_VERSION or meta.get("identity") != identity:
+                return None
+            scored = ScoredFile(path, meta)
+            # meta.json's mtime is the entry's last use, for eviction.
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            # Missing, or evicted while being opened.
+            return None
+        return scored
+
+    def _writer(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return _EntryWriter(self.cache_dir, self.max_bytes)
+
+    def _commit(self, writer: _EntryWriter, identity: dict):
+        if writer.commit(self._entry_path(identity), {"identity": identity}):
+            self.evict()
+
+    def score_frame(self, model_id: str, model, file_path: str, df, n_jobs: int = None, engine: str = None):
+        """Model output for df, the whole of file_path, from the cache or scored and cached now."""
+        scored = self.lookup(model_id, file_path)
+        if scored is not None and scored.n_rows == len(df):
+            return np.array(scored.output)
+
+        identity = self._identity(model_id, file_path)
+        with stage("transform"):
+            X = _as_float32(model.named_steps['preprocessor'].transform(df))
+        with parallelism(n_jobs):
+            output = transformed_output(model_id, model, X, engine)
+        writer = self._writer()
+        try:
+            writer.append(X, output)
+            self._commit(writer, identity)
+        finally:
+            writer.discard()
+        return output
+
+    def iter_scores(self, model_id: str, model, file_path: str, chunk_size: int = None, n_jobs: int = None,
+                    engine: str = None, frames: bool = False, features: bool = False):
+        """
+        Yield (frame, X, output) per chunk of chunk_size rows, in file
+        order. frame is the raw chunk (all columns) when frames is set,
+        X the transformed float32 features when features is set, else
+        None. On a miss the file is read (only the model's columns unless
+        frames are wanted), scored, and cached if the generator is run to
+        the end; on a hit the file is only read for frames.
+        """
+        chunk_size = chunk_size or PREDICT_CHUNK_SIZE
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+
+        scored = self.lookup(model_id, file_path)
+        if scored is not None:
+            if frames:
+                start = 0
+                for chunk in iter_data_chunks(file_path, chunk_size):
+                    stop = start + len(chunk)
+                    yield chunk, scored.rows(start, stop) if features else None, np.array(scored.output[start:stop])
+                    start = stop
+            else:
+                for start in range(0, scored.n_rows, chunk_size):
+                    stop = min(start + chunk_size, scored.n_rows)
+                    yield None, scored.rows(start, stop) if features else None, np.array(scored.output[start:stop])
+            return
+
+        identity = self._identity(model_id, file_path)
+        preprocessor = model.named_steps['preprocessor']
+        columns = None if frames else list(getattr(preprocessor, 'feature_names_in_', [])) or None
+        writer = self._writer()
+        try:
+            for chunk in iter_data_chunks(file_path, chunk_size, columns=columns):
+                with stage("transform"):
+                    X = _as_float32(preprocessor.transform(chunk))
+                # Cores are held while scoring, not while the consumer handles the chunk.
+                with parallelism(n_jobs):
+                    output = transformed_output(model_id, model, X, engine)
+                writer.append(X, output)
+                yield chunk if frames else None, X if features else None, output
+            self._commit(writer, identity)
+        finally:
+            writer.discard()
+
+    def ensure(self, model_id: str, model, file_path: str, n_jobs: int = None, engine: str = None):
+        """
+        ScoredFile of file_path, scoring and caching it first if needed.
+        A file too large for the disk budget is scored into memory instead.
+        """
+        scored = self.lookup(model_id, file_path)
+        if scored is not None:
+            return scored
+
+        X_parts, outputs = [], []
+        for _, X, output in self.iter_scores(model_id, model, file_path, n_jobs=n_jobs, engine=engine,
+                                             features=True):
+            X_parts.append(X)
+            outputs.append(output)
+        scored = self.lookup(model_id, file_path)
+        if scored is not None or not outputs:
+            return scored or _ScoredArrays(np.empty((0, 0), dtype=np.float32), np.empty(0))
+        if any(sp.issparse(X) for X in X_parts):
+            X = sp.vstack([sp.csr_matrix(X) for X in X_parts], format="csr")
+        else:
+            X = np.vstack(X_parts)
+        return _ScoredArrays(X, np.concatenate(outputs))
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(".tmp-") or not entry.is_dir():
+                continue
+            try:
+                used = os.stat(os.path.join(entry.path, META_FILENAME)).st_mtime_ns
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+            except OSError:
+                continue
+            entries.append((used, size, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+scoring_cache = ScoringCache()
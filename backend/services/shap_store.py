@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from .dataset_cache import read_meta as read_dataset_meta
+from .model_store import model_version
+from .preprocess import get_transformed_feature_names
+from .registry import load_model
+from .score_cache import scoring_cache
+from .shapley import compute_shap_values, expected_value
+from .train import TrainingCancelled
+from ..utils.config import SHAP_STORE_CHUNK_ROWS, SHAP_TOP_K
+
+STORE_DIRNAME = ".shap"
+META_FILENAME = "meta.json"
+VALUES_FILENAME = "values.bin"
+OUTPUT_FILENAME = "output.bin"
+FORMAT_VERSION = 1
+
+
+def get_store_dir(file_path: str, model_id: str) -> str:
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(os.path.dirname(file_path), STORE_DIRNAME, stem, model_id)
+
+
+def _source_signature(file_path: str) -> dict:
+    st = os.stat(file_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def build_shap_store(model_id: str, file_path: str, approximate: bool = False,
+                     chunk_rows: int = SHAP_STORE_CHUNK_ROWS, progress=None, should_cancel=None) -> dict:
+    """
+    Explain every row of file_path once and store the SHAP values next to
+    the upload: one float32 rows x features matrix (row-major, so a
+    customer's values are a single contiguous read) plus the model output
+    per row. Runs as a background job; progress(fraction, stage) and
+    should_cancel() follow train_model's conventions. Returns the store's
+    metadata.
+    """
+    if chunk_rows <= 0:
+        raise ValueError("chunk_rows must be positive.")
+    model = load_model(model_id)
+    version, _ = model_version(model_id)
+    preprocessor = model.named_steps['preprocessor']
+    feature_names = list(get_transformed_feature_names(preprocessor))
+    dataset_meta = read_dataset_meta(file_path)
+    total = dataset_meta["n_rows"] if dataset_meta else None
+
+    store_dir = get_store_dir(file_path, model_id)
+    tmp_dir = f"{store_dir}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_dir)
+    try:
+        n_rows, n_features = 0, None
+        with open(os.path.join(tmp_dir, VALUES_FILENAME), "wb") as values_file, \
+                open(os.path.join(tmp_dir, OUTPUT_FILENAME), "wb") as output_file:
+            for _, X, output in scoring_cache.iter_scores(model_id, model, file_path, chunk_rows, features=True):
+                if should_cancel is not None and should_cancel():
+                    raise TrainingCancelled(f"SHAP job for {model_id} was cancelled.")
+                # Serial: this runs in a training-pool worker, which already holds its share of the cores.
+                values = compute_shap_values(model_id, X, approximate=approximate, workers=1)
+                scores = output[:, 1] if output.ndim == 2 and output.shape[1] > 1 else output.ravel()
+                np.ascontiguousarray(values, dtype=np.float32).tofile(values_file)
+                scores.astype(np.float32).tofile(output_file)
+                n_rows += X.shape[0]
+                n_features = values.shape[1]
+                if progress is not None:
+                    progress(min(n_rows / total, 1.0) if total else 0.0, "explaining")
+
+        if n_features is not None and len(feature_names) != n_features:
+            feature_names = [f"Feature {i}" for i in range(n_features)]
+        meta = {
+            "version": FORMAT_VERSION,
+            "source": _source_signature(file_path),
+            "model_id": model_id,
+            "model_version": list(version),
+            "n_rows": n_rows,
+            "n_features": n_features or len(feature_names),
+            "feature_names": feature_names,
+            "expected_value": expected_value(model_id),
+            "approximate": approximate,
+        }
+        with open(os.path.join(tmp_dir, META_FILENAME), "w") as f:
+            json.dump(meta, f)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.replace(tmp_dir, store_dir)
+    if progress is not None:
+        progress(1.0, "done")
+    return meta
+
+
+def read_store_meta(file_path: str, model_id: str) -> dict:
+    """
+    Metadata of the SHAP store for (file, model). Raises FileNotFoundError
+    if there is none, or if the file or the model changed since it was built.
+    """
+    meta_path = os.path.join(get_store_dir(file_path, model_id), META_FILENAME)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise FileNotFoundError(f"No SHAP values stored for model {model_id} on this file; run an explain job first.")
+    if (meta.get("version") != FORMAT_VERSION or meta.get("source") != _source_signature(file_path)
+            or meta.get("model_version") != list(model_version(model_id)[0])):
+        raise FileNotFoundError(f"Stored SHAP values for model {model_id} are out of date; run an explain job again.")
+    return meta
+
+
+def row_drivers(file_path: str, model_id: str, row: int, top_k: int = SHAP_TOP_K) -> dict:
+    """
+    The top_k features by |SHAP value| for one row of a stored file, read
+    straight from the memory-mapped store.
+    """
+    if top_k <= 0:
+        raise ValueError("top_k must be positive.")
+    meta = read_store_meta(file_path, model_id)
+    n_rows, n_features = meta["n_rows"], meta["n_features"]
+    if not 0 <= row < n_rows:
+        raise ValueError(f"Row {row} is out of range; the file has {n_rows} rows.")
+
+    store_dir = get_store_dir(file_path, model_id)
+    values = np.memmap(os.path.join(store_dir, VALUES_FILENAME), dtype=np.float32, mode="r",
+                       shape=(n_rows, n_features))[row]
+    values = np.asarray(values, dtype=np.float64)
+    output = np.memmap(os.path.join(store_dir, OUTPUT_FILENAME), dtype=np.float32, mode="r", shape=(n_rows,))[row]
+
+    top = np.argsort(-np.abs(values), kind="stable")[:top_k]
+    return {
+        "row": row,
+        "model_id": model_id,
+        "prediction": float(output),
+        "expected_value": meta["expected_value"],
+        "drivers": [{"feature": meta["feature_names"][i], "shap_value": float(values[i])} for i in top],
+    }
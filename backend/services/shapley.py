@@ -0,0 +1,225 @@
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+from .registry import load_model, registry
+from .score_cache import scoring_cache
+from ..utils.metrics import stage
+from ..utils.config import (
+    SHAP_BACKGROUND_SIZE, SHAP_CHUNK_ROWS, SHAP_WORKERS, SHAP_STRATA, SHAP_CONFIDENCE,
+    SHAP_EXPLAINERS_PER_MODEL
+)
+
+PERTURBATIONS = ("tree_path_dependent", "interventional")
+
+
+def _positive_class(values):
+    """SHAP output for class 1 (the churn class) of a classifier, or the regression output."""
+    if isinstance(values, list):
+        return values[1] if len(values) > 1 else values[0]
+    values = np.asarray(values)
+    if values.ndim == 3:
+        return values[:, :, 1] if values.shape[2] > 1 else values[:, :, 0]
+    if values.ndim == 1:
+        # expected_value: one entry per class of a classifier, a single one for a regressor.
+        return values[1] if values.size > 1 else values[0]
+    return values
+
+
+def get_explainer(model_id: str, feature_perturbation: str = "tree_path_dependent", background=None):
+    """
+    TreeExplainer for model_id's forest, cached with the model in the
+    registry so its tree conversion and expected value are computed once.
+    Interventional explainers depend on their background rows as well and
+    are keyed on a digest of them; each model keeps the most recent
+    SHAP_EXPLAINERS_PER_MODEL.
+    """
+    if feature_perturbation not in PERTURBATIONS:
+        raise ValueError(f"feature_perturbation must be one of {', '.join(PERTURBATIONS)}.")
+    if feature_perturbation == "interventional" and background is None:
+        raise ValueError("Interventional explanations need background rows.")
+
+    key = (feature_perturbation, None)
+    if background is not None and feature_perturbation == "interventional":
+        key = (feature_perturbation, hashlib.sha1(np.ascontiguousarray(background).tobytes()).hexdigest())
+
+    explainers = registry.get_artifact(model_id, "shap_explainers", lambda model: OrderedDict())
+    explainer = explainers.get(key)
+    if explainer is None:
+        # shap pulls in numba and IPython; only endpoints that explain pay for it.
+        import shap
+
+        rf = load_model(model_id).named_steps['classifier']
+        if feature_perturbation == "interventional":
+            explainer = shap.TreeExplainer(rf, data=background, feature_perturbation="interventional")
+        else:
+            explainer = shap.TreeExplainer(rf)
+        explainers[key] = explainer
+        while len(explainers) > SHAP_EXPLAINERS_PER_MODEL:
+            explainers.popitem(last=False)
+    return explainer
+
+
+def expected_value(model_id: str, feature_perturbation: str = "tree_path_dependent", background=None) -> float:
+    """Base value the SHAP values of a row add up from (positive class for classifiers)."""
+    explainer = get_explainer(model_id, feature_perturbation, background)
+    return float(_positive_class(np.atleast_1d(explainer.expected_value)))
+
+
+def _explain_chunk(model_id: str, X, feature_perturbation: str, background, approximate: bool):
+    if sp.issparse(X):
+        X = X.toarray()
+    explainer = get_explainer(model_id, feature_perturbation, background)
+    values = explainer.shap_values(X, approximate=approximate, check_additivity=False)
+    return _positive_class(values)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the API process is multi-threaded.
+            _pool = ProcessPoolExecutor(max_workers=SHAP_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def compute_shap_values(model_id: str, X, feature_perturbation: str = "tree_path_dependent", background=None,
+                        approximate: bool = False, chunk_rows: int = SHAP_CHUNK_ROWS,
+                        workers: int = SHAP_WORKERS) -> np.ndarray:
+    """
+    SHAP values (rows x features) of the transformed matrix X for the
+    positive class. Rows are explained in chunks of chunk_rows spread over
+    the SHAP_WORKERS process pool, each worker keeping its own cached
+    explainer; with workers=1, or a single chunk, they are explained in
+    the calling thread.
+    """
+    if chunk_rows <= 0:
+        raise ValueError("chunk_rows must be positive.")
+    chunks = [X[start:start + chunk_rows] for start in range(0, X.shape[0], chunk_rows)]
+    with stage("shap"):
+        if workers <= 1 or len(chunks) <= 1:
+            results = [_explain_chunk(model_id, chunk, feature_perturbation, background, approximate)
+                       for chunk in chunks]
+        else:
+            pool = _get_pool()
+            futures = [pool.submit(_explain_chunk, model_id, chunk, feature_perturbation, background, approximate)
+                       for chunk in chunks]
+            results = [future.result() for future in futures]
+    if not results:
+        return np.empty((0, X.shape[1]))
+    return np.concatenate(results)
+
+
+def stratified_sample(scores: np.ndarray, size: int, n_strata: int = SHAP_STRATA, random_state: int = 42):
+    """
+    Proportional stratified sample of `size` rows, the strata being
+    quantile bins of the model output. Every non-empty stratum gets at
+    least two rows (one if it only has one) so its variance is defined.
+    Returns the sorted row indices, their stratum, and each stratum's size.
+    """
+    edges = np.unique(np.quantile(scores, np.linspace(0, 1, n_strata + 1)[1:-1]))
+    strata = np.searchsorted(edges, scores, side="right")
+    counts = np.bincount(strata, minlength=len(edges) + 1)
+
+    rng = np.random.default_rng(random_state)
+    picked = []
+    for h, count in enumerate(counts):
+        if count == 0:
+            continue
+        take = min(count, max(2, int(round(size * count / len(scores)))))
+        picked.append(rng.choice(np.flatnonzero(strata == h), take, replace=False))
+    indices = np.sort(np.concatenate(picked))
+    return indices, strata[indices], counts
+
+
+def importance_bounds(abs_values: np.ndarray, strata: np.ndarray, counts: np.ndarray, confidence: float):
+    """
+    Stratified estimate of mean |SHAP| per feature over the whole file, with
+    a normal-approximation confidence interval (finite population
+    corrected). Returns (estimate, lower, upper).
+    """
+    from scipy.stats import norm
+
+    population = counts.sum()
+    estimate = np.zeros(abs_values.shape[1])
+    variance = np.zeros(abs_values.shape[1])
+    for h, count in enumerate(counts):
+        rows = abs_values[strata == h]
+        if len(rows) == 0:
+            continue
+        weight = count / population
+        estimate += weight * rows.mean(axis=0)
+        if len(rows) > 1:
+            variance += weight ** 2 * (1 - len(rows) / count) * rows.var(axis=0, ddof=1) / len(rows)
+    margin = norm.ppf(0.5 + confidence / 2) * np.sqrt(variance)
+    return estimate, np.maximum(estimate - margin, 0.0), estimate + margin
+
+
+def explain_global(model_id: str, file_path: str, sample_size: int = None, approximate: bool = False,
+                   feature_perturbation: str = "tree_path_dependent", confidence: float = SHAP_CONFIDENCE):
+    """
+    Global SHAP importance of model_id on a file. With sample_size, only a
+    stratified sample of that many rows (strata: quantiles of the predicted
+    churn probability) is explained and the importances come with
+    `confidence` bounds; otherwise every row is and the bounds are exact.
+    Interventional mode uses SHAP_BACKGROUND_SIZE random rows of the file
+    as background. Rows and model output come from the scoring cache.
+
+    Returns a dict with the explained transformed rows and their SHAP
+    values, and per-feature importance/lower/upper arrays.
+    """
+    if feature_perturbation not in PERTURBATIONS:
+        raise ValueError(f"feature_perturbation must be one of {', '.join(PERTURBATIONS)}.")
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1.")
+    if sample_size is not None and sample_size < 2:
+        raise ValueError("sample_size must be at least 2.")
+
+    model = load_model(model_id)
+    scored = scoring_cache.ensure(model_id, model, file_path)
+    n_rows = scored.n_rows
+
+    if sample_size is not None and sample_size < n_rows:
+        output = np.asarray(scored.output)
+        scores = output[:, 1] if output.ndim == 2 and output.shape[1] > 1 else output.ravel()
+        indices, strata, counts = stratified_sample(scores, sample_size)
+    else:
+        indices, strata, counts = np.arange(n_rows), np.zeros(n_rows, dtype=np.int64), np.array([n_rows])
+
+    X = scored.take(indices)
+    background = None
+    if feature_perturbation == "interventional":
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(n_rows, min(n_rows, SHAP_BACKGROUND_SIZE), replace=False))
+        background = scored.take(rows)
+        background = background.toarray() if sp.issparse(background) else np.asarray(background)
+
+    values = compute_shap_values(model_id, X, feature_perturbation, background, approximate)
+    importance, lower, upper = importance_bounds(np.abs(values), strata, counts, confidence)
+    return {
+        "X": X,
+        "shap_values": values,
+        "importance": importance,
+        "lower": lower,
+        "upper": upper,
+        "expected_value": expected_value(model_id, feature_perturbation, background),
+        "n_rows": n_rows,
+        "rows_explained": len(indices),
+    }
@@ -1,4 +1,3 @@
-import pandas as pd
 import numpy as np
 from sklearn.base import is_classifier
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
@@ -6,49 +5,39 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from sklearn.pipeline import Pipeline
-import joblib
-import os
-from .preprocess import build_pipeline, get_column_info
+from ..utils.parallel import parallelism, train_budget
+from .tuning import tune_forest
+from .model_store import save_model, load_model_file
+from ..utils.config import RETRAIN_NEW_TREES
+from .preprocess import (
+    build_pipeline, load_data, optimize_dtypes, get_transformed_feature_names,
+    detect_datetime_columns, split_features
+)
 
 MODEL_DIR = "backend/models"
+N_ESTIMATORS = 100
+TREES_PER_BATCH = 10
 
-def train_model(file_path: str, target: str, task: str, model_id: str):
-    df = pd.read_csv(file_path)
-    
-    
-    df = df.dropna(subset=[target])
-    
-    X = df.drop(columns=[target])
-    y = df[target]
-    
-    numeric_features = X.select_dtypes(include=['int64', 'float64']).columns.tolist()
-    categorical_features = X.select_dtypes(include=['object', 'bool']).columns.tolist()
-    
-    preprocessor = build_pipeline(numeric_features, categorical_features)
-    
-    
-    if task == "classification":
-        model = RandomForestClassifier(n_estimators=100, random_state=42)
-    elif task == "regression":
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-    else:
-        raise ValueError("Invalid task type. Choose 'classification' or 'regression'.")
-    
-    clf = Pipeline(steps=[('preprocessor', preprocessor),
-                          ('classifier', model)])
-    
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    clf.fit(X_train, y_train)
-    
-    
+class TrainingCancelled(Exception):
+    pass
+
+def _reporter(model_id: str, progress, should_cancel):
+    def report(fraction, stage):
+        if progress is not None:
+            progress(fraction, stage)
+        if should_cancel is not None and should_cancel():
+            raise TrainingCancelled(f"Training of {model_id} was cancelled.")
+    return report
+
+def evaluate_model(clf, X_test, y_test, task: str, is_binary: bool = None):
     y_pred = clf.predict(X_test)
     metrics = {}
     
     if task == "classification":
         metrics['accuracy'] = accuracy_score(y_test, y_pred)
         
-        is_binary = len(np.unique(y)) == 2
+        if is_binary is None:
+            is_binary = len(clf.named_steps['classifier'].classes_) == 2
         avg_method = 'binary' if is_binary else 'weighted'
         
         metrics['precision'] = precision_score(y_test, y_pred, average=avg_method, zero_division=0)
@@ -65,9 +54,10 @@ def train_model(file_path: str, target: str, task: str, model_id: str):
         metrics['rmse'] = np.sqrt(mean_squared_error(y_test, y_pred))
         metrics['mae'] = mean_absolute_error(y_test, y_pred)
         metrics['r2'] = r2_score(y_test, y_pred)
-        
-    
     
+    return metrics
+
+def get_feature_importance(clf, top_n: int = 20):
     feature_importance = {}
     try:
         rf_model = clf.named_steps['classifier']
@@ -76,23 +66,189 @@ def train_model(file_path: str, target: str, task: str, model_id: str):
         preprocessor_step = clf.named_steps['preprocessor']
         
         
-        cat_names = preprocessor_step.named_transformers_['cat']['onehot'].get_feature_names_out(categorical_features)
-        feature_names = numeric_features + list(cat_names)
+        feature_names = get_transformed_feature_names(preprocessor_step)
         
         importances = rf_model.feature_importances_
         
         if len(feature_names) == len(importances):
             feature_importance = dict(zip(feature_names, importances))
             
-            feature_importance = dict(sorted(feature_importance.items(), key=lambda item: item[1], reverse=True)[:20])
+            feature_importance = dict(sorted(feature_importance.items(), key=lambda item: item[1], reverse=True)[:top_n])
     except Exception as e:
         print(f"Could not extract feature importance: {e}")
+    
+    return feature_importance
+
+def train_model(file_path: str, target: str, task: str, model_id: str, progress=None, should_cancel=None,
+                n_jobs: int = None, backend: str = None, tune: bool = False, tune_candidates: int = None):
+    """
+    Fit and persist a preprocessing + random forest pipeline.
+
+    The forest is grown in batches of TREES_PER_BATCH trees via warm_start
+    (same trees as a single fit with the same random_state), so that
+    progress(fraction, stage) can be reported between batches and a
+    should_cancel() returning True aborts with TrainingCancelled.
+    Trees are fitted on n_jobs cores (capped by TRAIN_N_JOBS) with the
+    given joblib backend; batches grow to at least one tree per core.
+    With tune=True the forest's hyperparameters and tree count are first
+    chosen by tune_forest on the training split.
+
+    Returns (metrics, feature_importance, memory_report, tuning_report),
+    the last being None when not tuning.
+    """
+    report = _reporter(model_id, progress, should_cancel)
+    
+    report(0.0, "loading")
+    df = load_data(file_path)
+    
+    
+    df = df.dropna(subset=[target])
+    # Dates are near-unique as text; keep them for feature extraction.
+    datetime_features = detect_datetime_columns(df.drop(columns=[target]))
+    df, memory_report = optimize_dtypes(df, target=target, keep=datetime_features)
+    print(f"Dtype optimisation for {model_id}: {memory_report['bytes_before']} -> "
+          f"{memory_report['bytes_after']} bytes, dropped {memory_report['dropped']}")
+    
+    X = df.drop(columns=[target])
+    y = df[target]
+    
+    features = split_features(X, datetime_features)
+    print(f"Feature encoding for {model_id}: one-hot {features['categorical']}, "
+          f"high-cardinality {features['high_cardinality']}, datetime {features['datetime']}")
+    
+    preprocessor = build_pipeline(features['numeric'], features['categorical'],
+                                  features['high_cardinality'], features['datetime'])
+    
+    
+    if task == "classification":
+        model = RandomForestClassifier(n_estimators=N_ESTIMATORS, random_state=42)
+    elif task == "regression":
+        model = RandomForestRegressor(n_estimators=N_ESTIMATORS, random_state=42)
+    else:
+        raise ValueError("Invalid task type. Choose 'classification' or 'regression'.")
+    
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    
+    n_estimators = N_ESTIMATORS
+    tuning_report = None
+    fit_start = 0.1
+    if tune:
+        report(0.05, "tuning")
+        with parallelism(n_jobs, backend, budget=train_budget, default=-1):
+            params, tuning_report = tune_forest(
+                preprocessor, X_train, y_train, task,
+                **({"n_candidates": tune_candidates} if tune_candidates else {}),
+                progress=lambda fraction: report(0.05 + 0.35 * fraction, "tuning")
+            )
+        n_estimators = params["n_estimators"]
+        model.set_params(**params)
+        fit_start = 0.4
+        print(f"Tuning for {model_id}: best {tuning_report['best_params']} "
+              f"({tuning_report['scoring']} {tuning_report['best_score']:.4f})")
+    
+    report(fit_start - 0.05, "preprocessing")
+    X_train_transformed = preprocessor.fit_transform(X_train)
+    
+    # The forest keeps n_jobs=None so that scoring follows the caller's
+    # parallelism() context rather than whatever training used.
+    with parallelism(n_jobs, backend, budget=train_budget, default=-1) as granted:
+        trees_per_batch = max(TREES_PER_BATCH, granted)
+        model.set_params(warm_start=True)
+        for n_trees in range(trees_per_batch, n_estimators + trees_per_batch, trees_per_batch):
+            model.set_params(n_estimators=min(n_trees, n_estimators))
+            model.fit(X_train_transformed, y_train)
+            report(fit_start + (0.9 - fit_start) * len(model.estimators_) / n_estimators, "fitting")
+        model.set_params(warm_start=False)
+        
+        clf = Pipeline(steps=[('preprocessor', preprocessor),
+                              ('classifier', model)])
         
+        report(0.9, "evaluating")
+        metrics = evaluate_model(clf, X_test, y_test, task, is_binary=len(np.unique(y)) == 2)
     
-    if not os.path.exists(MODEL_DIR):
-        os.makedirs(MODEL_DIR)
+    feature_importance = get_feature_importance(clf)
         
-    model_path = os.path.join(MODEL_DIR, f"{model_id}.pkl")
-    joblib.dump(clf, model_path)
     
-    return metrics, feature_importance
+    report(0.95, "saving")
+    save_model(clf, model_id)
+    
+    if progress is not None:
+        progress(1.0, "done")
+    return metrics, feature_importance, memory_report, tuning_report
+
+def retrain_model(model_id: str, file_path: str, target: str, output_model_id: str = None,
+                  new_trees: int = RETRAIN_NEW_TREES, max_trees: int = None, progress=None, should_cancel=None,
+                  n_jobs: int = None, backend: str = None):
+    """
+    Grow an existing pipeline on a new batch of labelled rows. The fitted
+    preprocessor is reused as-is; new_trees trees are added to the forest
+    via warm_start, fitted on 80% of the batch only, and if max_trees is
+    set the oldest trees are dropped to keep a fixed window. Metrics are
+    computed on the remaining 20% of the batch. The result is saved as
+    output_model_id (default: overwrite model_id).
+
+    Returns (metrics, feature_importance, None, retrain_report).
+    """
+    output_model_id = output_model_id or model_id
+    report = _reporter(output_model_id, progress, should_cancel)
+    if new_trees is None or new_trees <= 0:
+        raise ValueError("new_trees must be positive.")
+    if max_trees is not None and max_trees < new_trees:
+        raise ValueError("max_trees must be at least new_trees.")
+    
+    report(0.0, "loading")
+    # A private copy: the base model may be cached and in use elsewhere.
+    clf = load_model_file(model_id)
+    preprocessor = clf.named_steps['preprocessor']
+    rf = clf.named_steps['classifier']
+    task = "classification" if is_classifier(rf) else "regression"
+    
+    columns = list(getattr(preprocessor, 'feature_names_in_', []))
+    df = load_data(file_path, columns=columns + [target] if columns else None)
+    if target not in df.columns:
+        raise ValueError(f"Target column {target!r} not found in the new batch.")
+    df = df.dropna(subset=[target])
+    X = df.drop(columns=[target])
+    y = df[target]
+    
+    if task == "classification" and not np.array_equal(np.unique(y), rf.classes_):
+        # warm_start refits classes_ from the new batch; older trees would no longer line up.
+        raise ValueError(f"The new batch must contain exactly the classes {rf.classes_.tolist()}, "
+                         f"got {np.unique(y).tolist()}.")
+    
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    
+    report(0.1, "preprocessing")
+    X_train_transformed = preprocessor.transform(X_train)
+    
+    n_before = len(rf.estimators_)
+    with parallelism(n_jobs, backend, budget=train_budget, default=-1):
+        report(0.2, "fitting")
+        rf.set_params(warm_start=True, n_estimators=n_before + new_trees)
+        rf.fit(X_train_transformed, y_train)
+        rf.set_params(warm_start=False)
+        
+        pruned = 0
+        if max_trees is not None and len(rf.estimators_) > max_trees:
+            pruned = len(rf.estimators_) - max_trees
+            rf.estimators_ = rf.estimators_[pruned:]
+            rf.set_params(n_estimators=max_trees)
+        
+        report(0.9, "evaluating")
+        metrics = evaluate_model(clf, X_test, y_test, task)
+    
+    feature_importance = get_feature_importance(clf)
+    
+    report(0.95, "saving")
+    save_model(clf, output_model_id)
+    
+    if progress is not None:
+        progress(1.0, "done")
+    return metrics, feature_importance, None, {
+        "base_model_id": model_id,
+        "rows": len(df),
+        "trees_before": n_before,
+        "trees_added": new_trees,
+        "trees_pruned": pruned,
+        "trees_after": len(rf.estimators_),
+    }
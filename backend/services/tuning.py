@@ -0,0 +1,132 @@
+import itertools
+import math
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.metrics import accuracy_score, r2_score, roc_auc_score
+from sklearn.model_selection import KFold, StratifiedKFold, train_test_split
+
+from ..utils.config import (
+    TUNE_CANDIDATES, TUNE_CV, TUNE_FACTOR, TUNE_MIN_ESTIMATORS, TUNE_MAX_ESTIMATORS, TUNE_MAX_ROWS
+)
+
+# Same axes as the GridSearchCV in the root main.py, plus max_features;
+# n_estimators is not searched, it is the halving budget.
+PARAM_GRID = {
+    "max_depth": [5, 10, 20, None],
+    "min_samples_leaf": [1, 2, 4, 8],
+    "max_features": ["sqrt", 0.5, 1.0],
+}
+
+
+def sample_candidates(n_candidates: int, random_state: int = 42):
+    grid = [dict(zip(PARAM_GRID, values)) for values in itertools.product(*PARAM_GRID.values())]
+    if n_candidates >= len(grid):
+        return grid
+    rng = np.random.default_rng(random_state)
+    return [grid[i] for i in sorted(rng.choice(len(grid), n_candidates, replace=False))]
+
+
+def _score(forest, X, y, task: str) -> float:
+    """Higher is better: AUC for binary classification, accuracy otherwise, R² for regression."""
+    if task == "regression":
+        return r2_score(y, forest.predict(X))
+    if len(forest.classes_) == 2 and len(np.unique(y)) == 2:
+        return roc_auc_score(y, forest.predict_proba(X)[:, 1])
+    return accuracy_score(y, forest.predict(X))
+
+
+def _grow(forest, n_estimators: int, X_train, y_train, X_val, y_val, task: str):
+    # warm_start: only the trees beyond the current count are fitted.
+    forest.set_params(n_estimators=n_estimators)
+    forest.fit(X_train, y_train)
+    return forest, _score(forest, X_val, y_val, task)
+
+
+class FoldCache:
+    """
+    Cross-validation folds with the preprocessor fitted once per fold and
+    the transformed train/validation matrices kept, so candidates never
+    refit or rerun the ColumnTransformer.
+    """
+
+    def __init__(self, preprocessor, X, y, task: str, cv: int = TUNE_CV, random_state: int = 42):
+        splitter = (StratifiedKFold(cv, shuffle=True, random_state=random_state) if task == "classification"
+                    else KFold(cv, shuffle=True, random_state=random_state))
+        self.folds = []
+        for train_idx, val_idx in splitter.split(X, y):
+            fold_preprocessor = clone(preprocessor)
+            X_train = fold_preprocessor.fit_transform(X.iloc[train_idx])
+            X_val = fold_preprocessor.transform(X.iloc[val_idx])
+            self.folds.append((X_train, y.iloc[train_idx], X_val, y.iloc[val_idx]))
+
+
+def tune_forest(preprocessor, X, y, task: str, n_candidates: int = TUNE_CANDIDATES, cv: int = TUNE_CV,
+                factor: int = TUNE_FACTOR, min_estimators: int = TUNE_MIN_ESTIMATORS,
+                max_estimators: int = TUNE_MAX_ESTIMATORS, max_rows: int = TUNE_MAX_ROWS,
+                random_state: int = 42, progress=None):
+    """
+    Successive halving over PARAM_GRID with n_estimators as the resource.
+    Every round grows each surviving candidate's per-fold forests to the
+    round budget via warm_start and keeps the best 1/factor by mean CV
+    score. (candidate, fold) fits run in parallel under the active joblib
+    config, one core each. At most max_rows rows (stratified for
+    classification) are used. progress(fraction) is called after each round.
+
+    Returns the best parameters (including the final n_estimators) and a
+    report of the search.
+    """
+    if len(X) > max_rows:
+        stratify = y if task == "classification" else None
+        X, _, y, _ = train_test_split(X, y, train_size=max_rows, stratify=stratify, random_state=random_state)
+
+    folds = FoldCache(preprocessor, X, y, task, cv, random_state).folds
+    forest_cls = RandomForestClassifier if task == "classification" else RandomForestRegressor
+
+    candidates = sample_candidates(n_candidates, random_state)
+    forests = {i: [forest_cls(warm_start=True, n_jobs=1, random_state=random_state, **params)
+                   for _ in folds]
+               for i, params in enumerate(candidates)}
+
+    n_rounds = max(1, math.ceil(math.log(max(len(candidates), 1), factor)) + 1)
+    budgets = [min(max_estimators, min_estimators * factor ** r) for r in range(n_rounds - 1)]
+    budgets = sorted(set(budgets) | {max_estimators})
+
+    alive = list(forests)
+    rounds = []
+    scores = {}
+    for r, budget in enumerate(budgets):
+        jobs = [(i, k) for i in alive for k in range(len(folds))]
+        results = Parallel(prefer="threads")(
+            delayed(_grow)(forests[i][k], budget, *folds[k], task) for i, k in jobs
+        )
+        fold_scores = {}
+        for (i, k), (forest, score) in zip(jobs, results):
+            forests[i][k] = forest
+            fold_scores.setdefault(i, []).append(score)
+        scores = {i: float(np.mean(s)) for i, s in fold_scores.items()}
+        rounds.append({"n_estimators": budget, "n_candidates": len(alive),
+                       "best_score": max(scores.values())})
+
+        if r < len(budgets) - 1:
+            keep = max(1, math.ceil(len(alive) / factor))
+            alive = sorted(alive, key=lambda i: scores[i], reverse=True)[:keep]
+            # Eliminated candidates' forests are not needed any more.
+            for i in set(forests) - set(alive):
+                del forests[i]
+        if progress is not None:
+            progress((r + 1) / len(budgets))
+
+    best = max(alive, key=lambda i: scores[i])
+    best_params = dict(candidates[best], n_estimators=budgets[-1])
+    return best_params, {
+        "best_params": best_params,
+        "best_score": scores[best],
+        "scoring": "r2" if task == "regression" else ("auc" if len(np.unique(y)) == 2 else "accuracy"),
+        "n_candidates": len(candidates),
+        "n_rows": len(X),
+        "cv": cv,
+        "rounds": rounds,
+    }
@@ -0,0 +1,160 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Environment variable {name} must be an integer, got {value!r}")
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Environment variable {name} must be a number, got {value!r}")
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return default if value is None or value == "" else value
+
+
+def _env_limits(name: str, default: dict) -> dict:
+    """Parse "endpoint=N,endpoint=N" overrides on top of the defaults."""
+    limits = dict(default)
+    for item in _env_str(name, "").split(","):
+        if not item.strip():
+            continue
+        key, _, value = item.partition("=")
+        try:
+            limits[key.strip()] = int(value)
+        except ValueError:
+            raise ValueError(f"Environment variable {name} has an invalid entry {item!r}")
+    return limits
+
+
+# Model registry: bounded LRU of unpickled pipelines shared by every endpoint.
+MODEL_CACHE_MAX_ENTRIES = _env_int("MODEL_CACHE_MAX_ENTRIES", 8)
+MODEL_CACHE_MAX_BYTES = _env_int("MODEL_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+# How trained models are saved: "forest" (tree arrays as .npy buffers) or "pickle".
+MODEL_FORMAT = _env_str("MODEL_FORMAT", "forest")
+# Models loaded into the registry while the app starts, before it takes
+# requests: comma-separated ids, or "*" for every stored model (up to
+# MODEL_CACHE_MAX_ENTRIES). Empty = no warm-up.
+WARMUP_MODELS = [m.strip() for m in _env_str("WARMUP_MODELS", "").split(",") if m.strip()]
+
+# Upper bound on scenarios scored by a single /simulate-batch request.
+SIMULATE_BATCH_MAX_ROWS = _env_int("SIMULATE_BATCH_MAX_ROWS", 100_000)
+# Batches up to this many scenarios go through the compiled scorer (as
+# /simulate does); its per-row vectorizer loses to the sklearn pipeline
+# at about 100 rows, so bigger batches use the pipeline.
+SIMULATE_COMPILED_MAX_ROWS = _env_int("SIMULATE_COMPILED_MAX_ROWS", 64)
+
+# Rows scored per chunk by streaming prediction and report generation.
+PREDICT_CHUNK_SIZE = _env_int("PREDICT_CHUNK_SIZE", 50_000)
+# High-risk customers listed in the PDF report.
+REPORT_TOP_N = _env_int("REPORT_TOP_N", 50)
+# Scoring cache: disk budget for the transformed features and model output
+# kept per (model version, file content); least recently used entries go first.
+SCORING_CACHE_MAX_BYTES = _env_int("SCORING_CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024)
+
+# Background training: worker processes and how many finished jobs to remember.
+TRAIN_WORKERS = _env_int("TRAIN_WORKERS", 2)
+JOB_HISTORY_SIZE = _env_int("JOB_HISTORY_SIZE", 100)
+
+# Forest parallelism: cores shared by concurrent /predict and /generate-report
+# requests, the n_jobs a request asks for by default (-1 = every free core),
+# the per-training-worker core cap, and the joblib backend.
+CPU_BUDGET = _env_int("CPU_BUDGET", os.cpu_count() or 1)
+PREDICT_N_JOBS = _env_int("PREDICT_N_JOBS", -1)
+TRAIN_N_JOBS = _env_int("TRAIN_N_JOBS", max(1, (os.cpu_count() or 1) // max(1, TRAIN_WORKERS)))
+JOBLIB_BACKEND = _env_str("JOBLIB_BACKEND", "threading")
+
+# Forest inference for /predict and /generate-report: "sklearn" (Pipeline
+# predict_proba) or "flat" (packed node table walked level by level in
+# numpy), the rows per block the flat engine scores at once, and the
+# largest batch it is used for: above it sklearn's traversal is faster,
+# so "flat" hands bigger batches to sklearn.
+INFERENCE_ENGINE = _env_str("INFERENCE_ENGINE", "sklearn")
+ENGINE_BLOCK_ROWS = _env_int("ENGINE_BLOCK_ROWS", 1024)
+FLAT_ENGINE_MAX_ROWS = _env_int("FLAT_ENGINE_MAX_ROWS", 512)
+
+# SHAP explanations: default rows for a sampled /explain, background rows of
+# interventional mode, rows per chunk handed to the SHAP worker processes
+# (1 worker = explain in the request thread), quantile strata of the sample,
+# confidence level of the importance bounds, and interventional explainers
+# kept per model.
+SHAP_SAMPLE_SIZE = _env_int("SHAP_SAMPLE_SIZE", 2000)
+SHAP_BACKGROUND_SIZE = _env_int("SHAP_BACKGROUND_SIZE", 100)
+SHAP_CHUNK_ROWS = _env_int("SHAP_CHUNK_ROWS", 500)
+SHAP_WORKERS = _env_int("SHAP_WORKERS", min(4, os.cpu_count() or 1))
+SHAP_STRATA = _env_int("SHAP_STRATA", 10)
+SHAP_CONFIDENCE = _env_float("SHAP_CONFIDENCE", 0.95)
+SHAP_EXPLAINERS_PER_MODEL = _env_int("SHAP_EXPLAINERS_PER_MODEL", 4)
+# Per-row SHAP store: rows read and explained per chunk by the batch job,
+# and drivers returned by a row lookup by default.
+SHAP_STORE_CHUNK_ROWS = _env_int("SHAP_STORE_CHUNK_ROWS", 10_000)
+SHAP_TOP_K = _env_int("SHAP_TOP_K", 10)
+# SHAP summary charts: features and points per feature kept in the chart
+# data, background threads rendering the PNGs, and the disk budget for the
+# cached chart data and PNGs (least recently used go first).
+SHAP_PLOT_MAX_FEATURES = _env_int("SHAP_PLOT_MAX_FEATURES", 20)
+SHAP_PLOT_MAX_POINTS = _env_int("SHAP_PLOT_MAX_POINTS", 1000)
+RENDER_WORKERS = _env_int("RENDER_WORKERS", 2)
+RENDER_CACHE_MAX_BYTES = _env_int("RENDER_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+
+# Executor for blocking endpoint work: "thread" or "process" pool.
+EXECUTOR_KIND = _env_str("EXECUTOR_KIND", "thread")
+EXECUTOR_WORKERS = _env_int("EXECUTOR_WORKERS", os.cpu_count() or 4)
+# Per-endpoint concurrent executions, and how many more may wait before 429.
+ENDPOINT_CONCURRENCY = _env_limits("ENDPOINT_CONCURRENCY", {
+    "predict": 4,
+    "explain": 1,
+    "simulate": 8,
+    "simulate-batch": 2,
+    "generate-report": 2,
+    "compress-model": 1,
+    "explain-row": 16,
+})
+ENDPOINT_QUEUE_DEPTH = _env_limits("ENDPOINT_QUEUE_DEPTH", {})
+DEFAULT_ENDPOINT_CONCURRENCY = _env_int("DEFAULT_ENDPOINT_CONCURRENCY", 4)
+DEFAULT_ENDPOINT_QUEUE_DEPTH = _env_int("DEFAULT_ENDPOINT_QUEUE_DEPTH", 16)
+
+# Request header that opts a request into a per-stage timing breakdown in
+# its response headers (any non-empty value other than "0").
+TRACE_HEADER = _env_str("TRACE_HEADER", "X-Trace")
+
+# Uploads are streamed to disk in blocks and rejected beyond the size cap.
+MAX_UPLOAD_BYTES = _env_int("MAX_UPLOAD_BYTES", 5 * 1024 * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = _env_int("UPLOAD_CHUNK_BYTES", 1024 * 1024)
+# Rows parsed to infer column types for the /upload-csv response.
+SCHEMA_SAMPLE_ROWS = _env_int("SCHEMA_SAMPLE_ROWS", 10_000)
+
+# Categorical encoding at training time: one-hot up to ONEHOT_MAX_CATEGORIES
+# distinct values, with categories below ONEHOT_MIN_FREQUENCY (share of rows)
+# folded together; above that "frequency" or "hash" encoding.
+ONEHOT_MAX_CATEGORIES = _env_int("ONEHOT_MAX_CATEGORIES", 50)
+ONEHOT_MIN_FREQUENCY = _env_float("ONEHOT_MIN_FREQUENCY", 0.01)
+HIGH_CARDINALITY_ENCODING = _env_str("HIGH_CARDINALITY_ENCODING", "frequency")
+# Rows checked when deciding whether a text column holds dates.
+DATETIME_SAMPLE_ROWS = _env_int("DATETIME_SAMPLE_ROWS", 1000)
+
+# Hyperparameter tuning (successive halving with n_estimators as the budget):
+# candidates sampled from the grid, CV folds, elimination factor, tree
+# budget range and the row cap for the search itself.
+TUNE_CANDIDATES = _env_int("TUNE_CANDIDATES", 27)
+TUNE_CV = _env_int("TUNE_CV", 3)
+TUNE_FACTOR = _env_int("TUNE_FACTOR", 3)
+TUNE_MIN_ESTIMATORS = _env_int("TUNE_MIN_ESTIMATORS", 20)
+TUNE_MAX_ESTIMATORS = _env_int("TUNE_MAX_ESTIMATORS", 200)
+TUNE_MAX_ROWS = _env_int("TUNE_MAX_ROWS", 200_000)
+
+# Incremental retraining: trees added per new batch.
+RETRAIN_NEW_TREES = _env_int("RETRAIN_NEW_TREES", 20)
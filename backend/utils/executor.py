@@ -0,0 +1,141 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .config import (
+    EXECUTOR_KIND, EXECUTOR_WORKERS, ENDPOINT_CONCURRENCY, ENDPOINT_QUEUE_DEPTH,
+    DEFAULT_ENDPOINT_CONCURRENCY, DEFAULT_ENDPOINT_QUEUE_DEPTH
+)
+
+
+class Saturated(Exception):
+    pass
+
+
+class _Gate:
+    """Concurrency limit, queue bound and timing counters for one endpoint."""
+
+    def __init__(self, concurrency: int, queue_depth: int):
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.exec_total = 0.0
+        self.exec_max = 0.0
+
+    def snapshot(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue_depth,
+            "running": self.running,
+            "queued": self.pending - self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_seconds_avg": self.wait_total / finished if finished else 0.0,
+            "wait_seconds_max": self.wait_max,
+            "exec_seconds_avg": self.exec_total / finished if finished else 0.0,
+            "exec_seconds_max": self.exec_max,
+        }
+
+
+class EndpointExecutor:
+    """
+    Runs blocking endpoint work (pandas, sklearn, SHAP, FPDF) off the event
+    loop. Each endpoint gets its own concurrency limit plus a bounded queue
+    of waiters; once both are full, run() raises Saturated so the handler
+    can answer 429 instead of piling up work.
+    """
+
+    def __init__(self, kind: str = EXECUTOR_KIND, max_workers: int = EXECUTOR_WORKERS):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind {kind!r}; use 'thread' or 'process'.")
+        self.kind = kind
+        self.max_workers = max_workers
+        self._pool = None
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="endpoint")
+            return self._pool
+
+    def _gate(self, endpoint: str) -> _Gate:
+        gate = self._gates.get(endpoint)
+        if gate is None:
+            gate = _Gate(
+                ENDPOINT_CONCURRENCY.get(endpoint, DEFAULT_ENDPOINT_CONCURRENCY),
+                ENDPOINT_QUEUE_DEPTH.get(endpoint, DEFAULT_ENDPOINT_QUEUE_DEPTH),
+            )
+            self._gates[endpoint] = gate
+        return gate
+
+    async def run(self, endpoint: str, fn, *args, **kwargs):
+        gate = self._gate(endpoint)
+        if gate.pending >= gate.concurrency + gate.queue_depth:
+            gate.rejected += 1
+            raise Saturated(f"Too many concurrent '{endpoint}' requests; retry shortly.")
+
+        gate.pending += 1
+        enqueued = time.perf_counter()
+        try:
+            async with gate.semaphore:
+                started = time.perf_counter()
+                wait = started - enqueued
+                gate.running += 1
+                if self.kind == "thread":
+                    # Keep request-scoped context variables visible in the worker thread.
+                    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+                else:
+                    call = functools.partial(fn, *args, **kwargs)
+                ok = False
+                try:
+                    result = await asyncio.get_running_loop().run_in_executor(self._get_pool(), call)
+                    ok = True
+                    return result
+                finally:
+                    elapsed = time.perf_counter() - started
+                    gate.running -= 1
+                    if ok:
+                        gate.completed += 1
+                    else:
+                        gate.failed += 1
+                    gate.wait_total += wait
+                    gate.wait_max = max(gate.wait_max, wait)
+                    gate.exec_total += elapsed
+                    gate.exec_max = max(gate.exec_max, elapsed)
+        finally:
+            gate.pending -= 1
+
+    def metrics(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "endpoints": {name: gate.snapshot() for name, gate in self._gates.items()},
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+executor = EndpointExecutor()
@@ -0,0 +1,122 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+INDEX_FILENAME = ".file_index.sqlite"
+# Uploads are stored as "<uuid4><ext>"; anything else in the directory is a
+# derived artifact (predictions, plots, reports) and is not indexed.
+_UPLOAD_NAME = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(\.[A-Za-z0-9]+)?$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    columns TEXT,
+    created_at REAL NOT NULL
+)
+"""
+
+
+def read_csv_header(path: str):
+    try:
+        with open(path, newline="", encoding="utf-8", errors="replace") as f:
+            return next(csv.reader(f), [])
+    except OSError:
+        return []
+
+
+class FileIndex:
+    """
+    SQLite table mapping file_id to the stored upload and its metadata,
+    so resolving a file_id is a primary-key lookup instead of a directory scan.
+    """
+
+    def __init__(self, upload_dir: str):
+        self.upload_dir = upload_dir
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialised = False
+
+    @property
+    def db_path(self) -> str:
+        return os.path.join(self.upload_dir, INDEX_FILENAME)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.upload_dir, exist_ok=True)
+            created = not os.path.exists(self.db_path)
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            with self._init_lock:
+                if not self._initialised:
+                    conn.execute(_SCHEMA)
+                    conn.commit()
+                    self._initialised = True
+            self._local.conn = conn
+            if created:
+                # A fresh index must not hide uploads that already exist on disk.
+                self.rebuild()
+        return conn
+
+    def add(self, file_id: str, path: str, size: int, sha256: str = None, columns=None, created_at: float = None):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO files (file_id, path, size, sha256, columns, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (file_id, path, size, sha256, json.dumps(columns) if columns is not None else None,
+             created_at if created_at is not None else time.time()),
+        )
+        conn.commit()
+
+    def get(self, file_id: str):
+        row = self._connect().execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["columns"] = json.loads(record["columns"]) if record["columns"] else None
+        return record
+
+    def set_hash(self, file_id: str, sha256: str):
+        conn = self._connect()
+        conn.execute("UPDATE files SET sha256 = ? WHERE file_id = ?", (sha256, file_id))
+        conn.commit()
+
+    def remove(self, file_id: str):
+        conn = self._connect()
+        conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+        conn.commit()
+
+    def rebuild(self) -> int:
+        """
+        Reconcile the index with the upload directory: index uploads that are
+        missing (e.g. written before the index existed) and drop rows whose
+        file is gone. Content hashes of back-filled files are left empty and
+        computed on demand. Returns the number of rows added.
+        """
+        conn = self._connect()
+        known = {row["file_id"]: row["path"] for row in conn.execute("SELECT file_id, path FROM files")}
+
+        stale = [file_id for file_id, path in known.items() if not os.path.exists(path)]
+        conn.executemany("DELETE FROM files WHERE file_id = ?", [(file_id,) for file_id in stale])
+
+        added = 0
+        for entry in os.scandir(self.upload_dir):
+            match = _UPLOAD_NAME.match(entry.name)
+            if not match or not entry.is_file() or match.group(1) in known:
+                continue
+            st = entry.stat()
+            columns = read_csv_header(entry.path) if entry.name.endswith(".csv") else None
+            conn.execute(
+                "INSERT OR REPLACE INTO files (file_id, path, size, sha256, columns, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (match.group(1), entry.path, st.st_size, None,
+                 json.dumps(columns) if columns is not None else None, st.st_mtime),
+            )
+            added += 1
+        conn.commit()
+        return added
@@ -1,22 +1,59 @@
 import uuid
 import os
+import hashlib
+import io
+import json
+from .file_index import FileIndex, read_csv_header
+from .config import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES
+from .metrics import stage
 
 UPLOAD_DIR = "uploads"
 MODEL_DIR = "backend/models"
+# Multipart boundaries and part headers around an upload's content.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+file_index = FileIndex(UPLOAD_DIR)
+
+class UploadTooLarge(ValueError):
+    pass
 
 def generate_id() -> str:
     return str(uuid.uuid4())
 
 def get_file_path(file_id: str) -> str:
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
+    record = file_index.get(file_id)
+    if record is None or not os.path.exists(record["path"]):
+        return None
+    return record["path"]
+
+def get_file_hash(file_id: str) -> str:
+    """
+    SHA-256 of an upload's content. Recorded at upload time; computed and
+    stored on first request for files back-filled by a rebuild.
+    """
+    record = file_index.get(file_id)
+    if record is None:
+        return None
+    if record["sha256"]:
+        return record["sha256"]
     
-    for fname in os.listdir(UPLOAD_DIR):
-        if fname.startswith(file_id):
-            return os.path.join(UPLOAD_DIR, fname)
-    return None
+    digest = hashlib.sha256()
+    with open(record["path"], "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+    file_index.set_hash(file_id, sha256)
+    return sha256
 
-def save_upload_file(file_content: bytes, filename: str) -> str:
+def save_upload_file(source, filename: str, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """
+    Copy an upload to disk block by block, hashing as it goes, so memory use
+    does not depend on the file size. `source` is a binary file object (or
+    bytes). Raises UploadTooLarge once more than max_bytes have been read.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    
     if not os.path.exists(UPLOAD_DIR):
         os.makedirs(UPLOAD_DIR)
     
@@ -24,7 +61,89 @@ def save_upload_file(file_content: bytes, filename: str) -> str:
     ext = os.path.splitext(filename)[1]
     save_path = os.path.join(UPLOAD_DIR, f"{file_id}{ext}")
     
-    with open(save_path, "wb") as f:
-        f.write(file_content)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with stage("upload_write") as timed, open(save_path, "wb") as f:
+            for block in iter(lambda: source.read(UPLOAD_CHUNK_BYTES), b""):
+                size += len(block)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit.")
+                digest.update(block)
+                f.write(block)
+                timed.bytes_written = size
+    except BaseException:
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        raise
+    
+    file_index.add(
+        file_id,
+        save_path,
+        size=size,
+        sha256=digest.hexdigest(),
+        columns=read_csv_header(save_path) if ext == ".csv" else None
+    )
         
     return file_id
+
+class BodySizeLimit:
+    """
+    ASGI middleware capping request bodies at max_bytes (plus multipart
+    overhead). A declared Content-Length over the cap is answered with 413
+    before any of the body is read; chunked bodies are counted as they
+    arrive and cut off at the cap. Either way an oversized upload is never
+    spooled to disk in full, which checking in the endpoint cannot prevent:
+    the form is parsed before the endpoint runs.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, overhead: int = MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.limit = max_bytes + overhead
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Upload exceeds the {self.max_bytes} byte limit."}).encode()
+        await send({"type": "http.response.start", "status": 413, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"connection", b"close"),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.limit:
+            return await self._reject(send)
+
+        received = 0
+        exceeded = started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    exceeded = True
+                    raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit.")
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # Once the body is cut off, whatever the app makes of it (FastAPI
+            # reports a form parsing error) is replaced by the 413.
+            if exceeded and not started:
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded or started:
+                raise
+        if exceeded and not started:
+            await self._reject(send)
@@ -0,0 +1,261 @@
+import contextvars
+import json
+import math
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+BYTES_BUCKETS = tuple(float(2 ** power) for power in range(10, 36, 2))  # 1 KiB .. 32 GiB
+
+HELP = {
+    "churn_request_seconds": ("histogram", "Wall time of HTTP requests by route."),
+    "churn_requests_total": ("counter", "HTTP requests by route and status code."),
+    "churn_request_peak_rss_bytes": ("histogram", "Largest resident set size seen during a request."),
+    "churn_request_bytes_read": ("histogram", "Bytes read from disk per request."),
+    "churn_request_bytes_written": ("histogram", "Bytes written to disk per request."),
+    "churn_stage_seconds": ("histogram", "Wall time of hot-path stages."),
+    "churn_stage_cpu_seconds_total": ("counter", "CPU time of the thread running each stage."),
+    "churn_stage_bytes_read_total": ("counter", "Bytes read from disk by each stage."),
+    "churn_stage_bytes_written_total": ("counter", "Bytes written to disk by each stage."),
+    "churn_startup_seconds": ("gauge", "Boot latency by phase: import of the app, startup hooks, process start to ready."),
+    "process_resident_memory_bytes": ("gauge", "Current resident set size."),
+    "process_peak_resident_memory_bytes": ("gauge", "Peak resident set size of the process."),
+}
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def peak_rss() -> int:
+    """Resident set size high-water mark of the process, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def process_age():
+    """Seconds since this process started (Linux), or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, counted after the parenthesised command name, which may contain spaces.
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+    return time.time() - (boot_time + started_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _labels(labels: dict, extra: dict = None) -> str:
+    items = dict(labels, **(extra or {}))
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in items.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(items, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Process-wide histograms, counters and gauges, rendered in the
+    Prometheus text exposition format. Series are keyed by metric name and
+    label set.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, labels: dict, value: float, buckets=SECONDS_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, labels: dict, value: float):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def render(self) -> str:
+        with self._lock:
+            series = {}
+            for (name, labels), histogram in self._histograms.items():
+                lines = series.setdefault(name, [])
+                labels = dict(labels)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, {'le': _number(bound)})} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+            for (name, labels), value in list(self._counters.items()) + list(self._gauges.items()):
+                series.setdefault(name, []).append(f"{name}{_labels(dict(labels))} {_number(value)}")
+        series["process_resident_memory_bytes"] = [f"process_resident_memory_bytes {current_rss()}"]
+        series["process_peak_resident_memory_bytes"] = [f"process_peak_resident_memory_bytes {peak_rss()}"]
+
+        out = []
+        for name in sorted(series):
+            kind, text = HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(series[name])
+        return "\n".join(out) + "\n"
+
+
+metrics = Metrics()
+
+
+class RequestTrace:
+    """
+    Stages, bytes and peak RSS of one request. Shared by the threads that
+    work on it (the endpoint executor copies the context); RSS is sampled
+    when the request starts and ends and whenever a stage finishes, so the
+    peak is a lower bound on the true one.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss = current_rss()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, wall: float, cpu: float, bytes_read: int, bytes_written: int):
+        rss = current_rss()
+        with self._lock:
+            totals = self.stages.setdefault(name, [0, 0.0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += wall
+            totals[2] += cpu
+            totals[3] += bytes_read
+            totals[4] += bytes_written
+            self.bytes_read += bytes_read
+            self.bytes_written += bytes_written
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {
+                name: {"calls": calls, "wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3),
+                       "bytes_read": read, "bytes_written": written}
+                for name, (calls, wall, cpu, read, written) in self.stages.items()
+            }
+            wall = sum(stats[1] for stats in self.stages.values())
+            cpu = sum(stats[2] for stats in self.stages.values())
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "stages": stages,
+            # Stage time not spent on the CPU: disk, page faults, locks, waiting on pools.
+            "stage_wait_ms": round(max(wall - cpu, 0.0) * 1000, 3),
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_bytes": self.peak_rss,
+        }
+
+    def headers(self) -> dict:
+        """Server-Timing (per stage wall time, CPU time as description) and the full summary as JSON."""
+        summary = self.summary()
+        timings = [f'{name};dur={stats["wall_ms"]};desc="cpu {stats["cpu_ms"]}ms x{stats["calls"]}"'
+                   for name, stats in summary["stages"].items()]
+        timings.append(f'total;dur={summary["total_ms"]}')
+        return {"Server-Timing": ", ".join(timings), "X-Trace-Summary": json.dumps(summary, separators=(",", ":"))}
+
+
+_current = contextvars.ContextVar("request_trace", default=None)
+
+
+def begin_request() -> RequestTrace:
+    trace = RequestTrace()
+    _current.set(trace)
+    return trace
+
+
+def end_request(trace: RequestTrace, endpoint: str, method: str, status: int):
+    trace.peak_rss = max(trace.peak_rss, current_rss())
+    labels = {"endpoint": endpoint, "method": method}
+    metrics.observe("churn_request_seconds", labels, time.perf_counter() - trace.started)
+    metrics.inc("churn_requests_total", dict(labels, status=str(status)))
+    metrics.observe("churn_request_peak_rss_bytes", labels, trace.peak_rss, BYTES_BUCKETS)
+    metrics.observe("churn_request_bytes_read", labels, trace.bytes_read, BYTES_BUCKETS)
+    metrics.observe("churn_request_bytes_written", labels, trace.bytes_written, BYTES_BUCKETS)
+
+
+class Stage:
+    """Handle yielded by stage(); set bytes_read / bytes_written on it."""
+
+    __slots__ = ("name", "bytes_read", "bytes_written")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a hot-path stage: wall time into churn_stage_seconds, CPU time of
+    the calling thread (work fanned out to pools is not included) and the
+    bytes set on the yielded handle into counters, and all of it into the
+    current request's trace if there is one.
+    """
+    handle = Stage(name)
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield handle
+    finally:
+        wall, cpu = time.perf_counter() - start, time.thread_time() - cpu_start
+        labels = {"stage": name}
+        metrics.observe("churn_stage_seconds", labels, wall)
+        metrics.inc("churn_stage_cpu_seconds_total", labels, cpu)
+        if handle.bytes_read:
+            metrics.inc("churn_stage_bytes_read_total", labels, handle.bytes_read)
+        if handle.bytes_written:
+            metrics.inc("churn_stage_bytes_written_total", labels, handle.bytes_written)
+        trace = _current.get()
+        if trace is not None:
+            trace.add(name, wall, cpu, handle.bytes_read, handle.bytes_written)
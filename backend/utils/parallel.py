@@ -0,0 +1,80 @@
+import threading
+from contextlib import contextmanager
+
+from joblib import parallel_config
+
+from .config import CPU_BUDGET, PREDICT_N_JOBS, TRAIN_N_JOBS, JOBLIB_BACKEND
+
+JOBLIB_BACKENDS = ("threading", "loky", "multiprocessing")
+
+
+class CpuBudget:
+    """
+    Pool of cores shared by the forests of concurrent requests. Each request
+    asks for n_jobs and is granted what is still free, but always at least
+    one core, so acquire() never blocks; concurrency itself is bounded by
+    the endpoint executor gates.
+    """
+
+    def __init__(self, total: int):
+        self.total = max(1, total)
+        self.in_use = 0
+        self.grants = 0
+        self.clipped = 0
+        self._lock = threading.Lock()
+
+    def resolve(self, n_jobs: int) -> int:
+        """joblib semantics: -1 is every core, -2 all but one, and so on."""
+        if n_jobs == 0:
+            raise ValueError("n_jobs must be a positive or negative integer, not 0.")
+        if n_jobs < 0:
+            return max(1, self.total + 1 + n_jobs)
+        return min(n_jobs, self.total)
+
+    def acquire(self, n_jobs: int) -> int:
+        requested = self.resolve(n_jobs)
+        with self._lock:
+            granted = max(1, min(requested, self.total - self.in_use))
+            self.in_use += granted
+            self.grants += 1
+            if granted < requested:
+                self.clipped += 1
+        return granted
+
+    def release(self, granted: int):
+        with self._lock:
+            self.in_use -= granted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "total": self.total,
+                "in_use": self.in_use,
+                "grants": self.grants,
+                "clipped": self.clipped,
+            }
+
+
+cpu_budget = CpuBudget(CPU_BUDGET)
+# Training runs one job per worker process, each capped at TRAIN_N_JOBS cores.
+train_budget = CpuBudget(TRAIN_N_JOBS)
+
+
+@contextmanager
+def parallelism(n_jobs: int = None, backend: str = None, budget: CpuBudget = None, default: int = PREDICT_N_JOBS):
+    """
+    Reserve cores from `budget` and make them the joblib default for the
+    current thread, so forests whose own n_jobs is None (as saved by
+    train_model) fit and predict with the granted count. Yields that count.
+    """
+    backend = backend or JOBLIB_BACKEND
+    if backend not in JOBLIB_BACKENDS:
+        raise ValueError(f"Unknown joblib backend {backend!r}; use one of {', '.join(JOBLIB_BACKENDS)}.")
+    budget = budget or cpu_budget
+
+    granted = budget.acquire(default if n_jobs is None else n_jobs)
+    try:
+        with parallel_config(backend=backend, n_jobs=granted):
+            yield granted
+    finally:
+        budget.release(granted)
@@ -11,27 +11,109 @@ class TrainRequest(BaseModel):
     file_id: str
     target: str
     task: str  
+    n_jobs: Optional[int] = None
+    backend: Optional[str] = None
+    tune: bool = False
+    tune_candidates: Optional[int] = None
 
 class TrainResponse(BaseModel):
     model_id: str
     metrics: Dict[str, float]
     feature_importance: Dict[str, float]
+    memory_report: Optional[Dict[str, Any]] = None
+    tuning: Optional[Dict[str, Any]] = None
+    retrain: Optional[Dict[str, Any]] = None
+
+class RetrainRequest(BaseModel):
+    model_id: str
+    file_id: str
+    target: str
+    output_model_id: Optional[str] = None
+    new_trees: Optional[int] = None
+    max_trees: Optional[int] = None
+    n_jobs: Optional[int] = None
+    backend: Optional[str] = None
+
+class CompressRequest(BaseModel):
+    model_id: str
+    file_id: str
+    target: str
+    output_model_id: Optional[str] = None
+    top_k: Optional[int] = None
+    max_depth: Optional[int] = None
+    threshold_dtype: Optional[str] = None
+    value_dtype: Optional[str] = None
+
+class CompressResponse(BaseModel):
+    model_id: str
+    base_model_id: str
+    metrics_before: Dict[str, float]
+    metrics_after: Dict[str, float]
+    metrics_delta: Dict[str, float]
+    trees_before: int
+    trees_after: int
+    nodes_before: int
+    nodes_after: int
+    bytes_before: int
+    bytes_after: int
+    oob_scores_kept: Optional[List[float]] = None
+
+class TrainJobStatus(BaseModel):
+    job_id: str
+    kind: str = "train"
+    model_id: str
+    status: str
+    progress: float
+    stage: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
 
 class PredictRequest(BaseModel):
     model_id: str
     file_id: str 
+    stream: bool = False
+    chunk_size: Optional[int] = None
+    n_jobs: Optional[int] = None
+    engine: Optional[str] = None
 
 class PredictionResponse(BaseModel):
-    predictions: List[Any]
+    predictions: Optional[List[Any]] = None
+    summary: Optional[Dict[str, Any]] = None
     download_url: str
 
 class ExplainRequest(BaseModel):
     model_id: str
     file_id: str
+    sample: bool = False
+    sample_size: Optional[int] = None
+    approximate: bool = False
+    feature_perturbation: str = "tree_path_dependent"
+    confidence: Optional[float] = None
+    plot: str = "png"
 
 class ExplainResponse(BaseModel):
     summary_plot_url: str
     feature_importance: Dict[str, float]
+    importance_bounds: Optional[Dict[str, List[float]]] = None
+    expected_value: Optional[float] = None
+    rows_explained: Optional[int] = None
+    n_rows: Optional[int] = None
+    plot_ready: bool = False
+    plot_data_url: Optional[str] = None
+    plot_data: Optional[Dict[str, Any]] = None
+
+class ExplainJobRequest(BaseModel):
+    model_id: str
+    file_id: str
+    approximate: bool = False
+
+class RowExplanationResponse(BaseModel):
+    file_id: str
+    model_id: str
+    row: int
+    prediction: float
+    expected_value: float
+    drivers: List[Dict[str, Any]]
 
 class SimulateRequest(BaseModel):
     model_id: str
@@ -40,8 +122,21 @@ class SimulateRequest(BaseModel):
 class SimulateResponse(BaseModel):
     prediction: float 
 
+class SimulateBatchRequest(BaseModel):
+    model_id: str
+    rows: Optional[List[Dict[str, Any]]] = None
+    base: Optional[Dict[str, Any]] = None
+    grid: Optional[Dict[str, List[Any]]] = None
+
+class SimulateBatchResponse(BaseModel):
+    n_rows: int
+    columns: Dict[str, List[Any]]
+    predictions: List[float]
+
 class ReportRequest(BaseModel):
     model_id: str
     file_id: str
     thresholds: Dict[str, float] 
     recommendations: Dict[str, str] 
+    n_jobs: Optional[int] = None
+    engine: Optional[str] = None
@@ -0,0 +1,84 @@
+"""
+Bit-exact parity check and throughput of the flat inference engine
+(FlatForest.predict_batch) against sklearn's predict_proba / predict, on
+the sample CSV upsampled to the largest batch size. The batch size where
+the speedup drops below 1 is what FLAT_ENGINE_MAX_ROWS should be set to.
+
+    python -m benchmarks.bench_inference [--batches 1,1000,1000000] [--n-jobs 1]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from backend.services.fastpath import FlatForest
+from backend.services.preprocess import build_pipeline, split_features
+from backend.utils.parallel import CpuBudget, parallelism
+
+from .bench_parallel import upsample
+
+
+def check_parity(forest, X) -> int:
+    """Rows whose output differs in any bit between sklearn and the flat engine."""
+    with parallelism(1, budget=CpuBudget(1)):
+        expected = forest.predict_proba(X) if hasattr(forest, "predict_proba") else forest.predict(X)[:, None]
+    actual = FlatForest.from_estimator(forest).predict_batch(X)
+    return int((expected.view(np.uint64) != actual.view(np.uint64)).any(axis=1).sum())
+
+
+def throughput(fn, X, batch: int, min_rows: int, min_seconds: float = 1.0) -> float:
+    """Rows per second scoring X[:batch] repeatedly until both minimums are met."""
+    X_batch = X[:batch]
+    rows, elapsed = 0, 0.0
+    while rows < min_rows or elapsed < min_seconds:
+        start = time.perf_counter()
+        fn(X_batch)
+        elapsed += time.perf_counter() - start
+        rows += X_batch.shape[0]
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--csv", default="customer_churn.csv")
+    parser.add_argument("--target", default="Churn")
+    parser.add_argument("--batches", default="1,1000,1000000", help="comma-separated batch sizes")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--n-jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    batches = [int(b) for b in args.batches.split(",")]
+    df = pd.read_csv(args.csv).dropna(subset=[args.target])
+    X, y = df.drop(columns=[args.target]), df[args.target]
+    features = split_features(X)
+    preprocessor = build_pipeline(features['numeric'], features['categorical'],
+                                  features['high_cardinality'], features['datetime'])
+    X_train = preprocessor.fit_transform(X)
+
+    classifier = RandomForestClassifier(n_estimators=args.n_estimators, random_state=42).fit(X_train, y)
+    regressor = RandomForestRegressor(n_estimators=args.n_estimators, random_state=42).fit(
+        X_train, pd.factorize(y)[0].astype(np.float64))
+
+    big = upsample(df, args.target, max(batches + [len(df)]))
+    X_big = preprocessor.transform(big.drop(columns=[args.target]))
+    for name, forest in (("classifier", classifier), ("regressor", regressor)):
+        mismatched = check_parity(forest, X_big)
+        print(f"parity ({name}): {X_big.shape[0]} rows, {mismatched} rows differ")
+        if mismatched:
+            raise SystemExit(f"flat engine diverges from sklearn for the {name}")
+
+    flat = FlatForest.from_estimator(classifier)
+    budget = CpuBudget(args.n_jobs)
+    print(f"{'batch':>9} {'sklearn rows/s':>15} {'flat rows/s':>13} {'speedup':>8}")
+    for batch in batches:
+        min_rows = max(batch, 10_000)
+        with parallelism(args.n_jobs, budget=budget):
+            sklearn_rate = throughput(classifier.predict_proba, X_big, batch, min_rows)
+            flat_rate = throughput(flat.predict_batch, X_big, batch, min_rows)
+        print(f"{batch:>9} {sklearn_rate:>15,.0f} {flat_rate:>13,.0f} {flat_rate / sklearn_rate:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Scaling curve of forest fit and predict_proba over n_jobs, on the sample
+CSV upsampled (with jittered numeric columns) to a production-like size.
+
+    python -m benchmarks.bench_parallel [--rows 2000000] [--n-jobs 1,2,4,8,16,32] [--backend threading]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from backend.services.preprocess import build_pipeline, split_features
+from backend.utils.parallel import CpuBudget, parallelism
+
+
+def upsample(df: pd.DataFrame, target: str, n_rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    out = df.iloc[rng.integers(0, len(df), n_rows)].reset_index(drop=True)
+    for col in out.columns:
+        if col != target and pd.api.types.is_float_dtype(out[col]):
+            out[col] = out[col] * rng.normal(1.0, 0.05, n_rows)
+    return out
+
+
+def default_n_jobs():
+    cores = os.cpu_count() or 1
+    steps = [1]
+    while steps[-1] * 2 <= cores:
+        steps.append(steps[-1] * 2)
+    if steps[-1] != cores:
+        steps.append(cores)
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--csv", default="customer_churn.csv")
+    parser.add_argument("--target", default="Churn")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=None)
+    parser.add_argument("--n-jobs", default=None, help="comma-separated core counts (default: powers of two up to all cores)")
+    parser.add_argument("--backend", default="threading")
+    args = parser.parse_args()
+
+    n_jobs_list = [int(n) for n in args.n_jobs.split(",")] if args.n_jobs else default_n_jobs()
+
+    df = upsample(pd.read_csv(args.csv).dropna(subset=[args.target]), args.target, args.rows)
+    X, y = df.drop(columns=[args.target]), df[args.target]
+    features = split_features(X)
+    preprocessor = build_pipeline(features['numeric'], features['categorical'],
+                                  features['high_cardinality'], features['datetime'])
+    start = time.perf_counter()
+    X_transformed = preprocessor.fit_transform(X)
+    print(f"{args.rows} rows, {X_transformed.shape[1]} features, preprocessing {time.perf_counter() - start:.2f} s")
+
+    budget = CpuBudget(max(n_jobs_list))
+    baseline = None
+    print(f"{'n_jobs':>6} {'fit s':>9} {'predict s':>10} {'fit x':>7} {'predict x':>10}")
+    for n_jobs in n_jobs_list:
+        model = RandomForestClassifier(n_estimators=args.n_estimators, max_depth=args.max_depth, random_state=42)
+        with parallelism(n_jobs, args.backend, budget=budget):
+            start = time.perf_counter()
+            model.fit(X_transformed, y)
+            fit_s = time.perf_counter() - start
+            start = time.perf_counter()
+            model.predict_proba(X_transformed)
+            predict_s = time.perf_counter() - start
+        baseline = baseline or (fit_s, predict_s)
+        print(f"{n_jobs:>6} {fit_s:>9.2f} {predict_s:>10.2f} {baseline[0] / fit_s:>7.2f} {baseline[1] / predict_s:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Parity check and latency benchmark for the compiled /simulate fast path.
+
+    python -m benchmarks.bench_simulate [--csv customer_churn.csv] [--target Churn]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from backend.services.fastpath import compile_pipeline
+from backend.services.preprocess import build_pipeline, split_features
+
+
+def fit_reference_pipeline(df: pd.DataFrame, target: str) -> Pipeline:
+    X = df.drop(columns=[target])
+    features = split_features(X)
+    preprocessor = build_pipeline(features['numeric'], features['categorical'],
+                                  features['high_cardinality'], features['datetime'])
+    model = Pipeline(steps=[('preprocessor', preprocessor),
+                            ('classifier', RandomForestClassifier(n_estimators=100, random_state=42))])
+    model.fit(X, df[target])
+    return model
+
+
+def edge_cases(record: dict) -> dict:
+    """Variants of one input row that the compiled path must accept or reject exactly as sklearn does."""
+    first = next(iter(record))
+    numeric = next((col for col, value in record.items() if isinstance(value, (int, float))), first)
+    return {
+        "partial row": {col: value for col, value in record.items() if col != first},
+        "extra keys": dict(record, unknown_feature=1, another="x"),
+        "None value": dict(record, **{numeric: None}),
+        "all None": {col: None for col in record},
+        "numeric text": dict(record, **{numeric: str(record[numeric])}),
+        "non-numeric text": dict(record, **{numeric: "abc"}),
+    }
+
+
+def outcome(fn, row):
+    """fn(row), or the ValueError message it raised."""
+    try:
+        return float(fn(row))
+    except ValueError as e:
+        return f"ValueError: {e}"
+
+
+def time_calls(fn, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        for row in rows:
+            start = time.perf_counter()
+            fn(row)
+            timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--csv", default="customer_churn.csv")
+    parser.add_argument("--target", default="Churn")
+    parser.add_argument("--rows", type=int, default=200, help="rows used for the latency loop")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv).dropna(subset=[args.target])
+    model = fit_reference_pipeline(df, args.target)
+    compiled = compile_pipeline(model)
+
+    X = df.drop(columns=[args.target])
+    records = X.to_dict(orient="records")
+
+    expected = model.predict_proba(X)[:, 1]
+    actual = np.array([compiled.predict_one(r) for r in records])
+    max_diff = float(np.max(np.abs(expected - actual)))
+    print(f"parity: {len(records)} rows, max |diff| = {max_diff:.3e}")
+    if max_diff > 1e-9:
+        raise SystemExit("compiled fast path diverges from Pipeline.predict_proba")
+
+    reference = lambda r: model.predict_proba(pd.DataFrame([r]))[0][1]
+    for name, row in edge_cases(records[0]).items():
+        expected_outcome, actual_outcome = outcome(reference, row), outcome(compiled.predict_one, row)
+        print(f"parity ({name}): {actual_outcome!r}")
+        if expected_outcome != actual_outcome:
+            raise SystemExit(f"compiled fast path differs on {name}: {actual_outcome!r}, sklearn {expected_outcome!r}")
+
+    sample = records[:args.rows]
+    sk_p50, sk_p99 = time_calls(lambda r: model.predict_proba(pd.DataFrame([r]))[0][1], sample, args.repeat)
+    fp_p50, fp_p99 = time_calls(compiled.predict_one, sample, args.repeat)
+    print(f"sklearn pipeline: p50 {sk_p50:.3f} ms  p99 {sk_p99:.3f} ms")
+    print(f"compiled path:    p50 {fp_p50:.3f} ms  p99 {fp_p99:.3f} ms  ({sk_p50 / fp_p50:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Cold-start latency of the API: each run starts a fresh interpreter, imports
+backend.main, runs the startup hooks (including WARMUP_MODELS, when set)
+and serves a first request per endpoint given, printing the median time of
+each phase and the heavy libraries loaded by the end.
+
+    python -m benchmarks.bench_startup [--runs 5] [--request GET:/]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY = ("pandas", "sklearn", "shap", "matplotlib", "fpdf")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from backend.main import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+timings = {"import": imported - started}
+with TestClient(app) as client:
+    timings["ready"] = time.perf_counter() - started
+    for request in sys.argv[1:]:
+        method, _, path = request.partition(":")
+        start = time.perf_counter()
+        client.request(method, path)
+        timings[request] = time.perf_counter() - start
+print(json.dumps({"timings": timings, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY,)
+
+
+def probe(requests) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    out = subprocess.run([sys.executable, "-c", _PROBE, *requests], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--request", action="append", default=[],
+                        help="METHOD:/path served after startup, e.g. GET:/model-cache/stats (repeatable)")
+    args = parser.parse_args()
+
+    results = [probe(args.request) for _ in range(args.runs)]
+    print(f"{'phase':<32} {'median s':>9} {'max s':>8}")
+    for phase in results[0]["timings"]:
+        values = [result["timings"][phase] for result in results]
+        print(f"{phase:<32} {statistics.median(values):>9.3f} {max(values):>8.3f}")
+    print(f"loaded: {', '.join(results[-1]['loaded']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
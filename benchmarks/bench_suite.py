@@ -0,0 +1,384 @@
+"""
+End-to-end benchmark of the service layer and the HTTP API on synthetic
+churn datasets shaped like customer_churn.csv (plus optional extra numeric,
+categorical and high-cardinality columns). Each operation runs directly
+against backend.services and through the FastAPI app (in-process test
+client); latency p50/p99, throughput and peak RSS go to a JSON file.
+
+    python -m benchmarks.bench_suite run [--sizes 10k,1m,10m] [--repeat 5] [--output bench.json]
+    python -m benchmarks.bench_suite compare base.json new.json [--threshold 0.1]
+
+Datasets are generated once into the work directory and reused. Every
+backend path (uploads, models, caches) is relative to the working
+directory, so the run chdirs there and leaves the repository alone. After
+the first repetition the columnar, scoring and SHAP caches are warm;
+--cold clears them (and the model registry) before every repetition.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+OPS = ("upload", "train", "predict", "predict_stream", "explain", "simulate", "report")
+MODES = ("direct", "api")
+STATES = np.array(["AK", "CA", "FL", "IL", "NY", "OH", "PA", "RI", "TX", "WA"])
+THRESHOLDS = {"high": 0.75, "medium": 0.5}
+RECOMMENDATIONS = {"high": "Call within a week", "medium": "Send a retention offer"}
+GENERATE_CHUNK_ROWS = 1_000_000
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def size_label(n_rows: int) -> str:
+    for scale, suffix in ((1_000_000, "m"), (1_000, "k")):
+        if n_rows >= scale and n_rows % scale == 0:
+            return f"{n_rows // scale}{suffix}"
+    return str(n_rows)
+
+
+def synthesize_chunk(start: int, n_rows: int, config: dict, seed: int) -> pd.DataFrame:
+    """
+    Rows [start, start + n_rows) of a synthetic dataset: the columns of
+    customer_churn.csv with similar marginals, config["numeric"] extra
+    numeric and config["categorical"] extra categorical columns (with
+    config["cardinality"] levels, skewed), config["high_cardinality"] id-like
+    text columns, and a Churn label driven mostly by Num_Sites as in the
+    sample. config["missing"] is the share of numeric values left empty.
+    """
+    rng = np.random.default_rng([seed, start])
+    ids = np.arange(start, start + n_rows)
+    df = pd.DataFrame({
+        "Names": np.char.add("Customer ", ids.astype(str)),
+        "Age": np.clip(rng.normal(41.8, 6.1, n_rows), 22, 65).round(1),
+        "Total_Purchase": np.clip(rng.normal(10062.0, 2408.0, n_rows), 100, None).round(2),
+        "Account_Manager": rng.integers(0, 2, n_rows),
+        "Years": np.clip(rng.normal(5.27, 1.27, n_rows), 1, None).round(2),
+        "Num_Sites": np.clip(rng.normal(8.6, 1.76, n_rows), 3, 14).round(),
+    })
+    seconds = rng.integers(0, 10 * 365 * 86400, n_rows)
+    dates = np.datetime64("2006-01-01T00:00:00") + seconds.astype("timedelta64[s]")
+    df["Onboard_date"] = np.char.replace(np.datetime_as_string(dates, unit="s"), "T", " ")
+    df["Location"] = np.char.add(np.char.add(rng.integers(1, 99999, n_rows).astype(str), " Main Street, "),
+                                 STATES[rng.integers(0, len(STATES), n_rows)])
+    df["Company"] = np.char.add("Company ", rng.integers(0, max(n_rows // 2, 1), n_rows).astype(str))
+
+    logit = (-1.9 + 1.6 * (df["Num_Sites"] - 8.6) / 1.76 + 0.4 * (df["Years"] - 5.27) / 1.27
+             + 0.3 * df["Account_Manager"] + 0.2 * (df["Age"] - 41.8) / 6.1)
+    for i in range(config["numeric"]):
+        values = rng.normal(0.0, 1.0, n_rows)
+        logit += 0.3 * values / (i + 1)
+        df[f"metric_{i}"] = values.round(4)
+    for i in range(config["categorical"]):
+        # Zipf-like level frequencies, as real categorical columns tend to have.
+        weights = 1.0 / np.arange(1, config["cardinality"] + 1)
+        codes = rng.choice(config["cardinality"], n_rows, p=weights / weights.sum())
+        logit += 0.5 * (codes == 0)
+        df[f"segment_{i}"] = np.char.add(f"s{i}_", codes.astype(str))
+    for i in range(config["high_cardinality"]):
+        df[f"ref_{i}"] = np.char.add("R", rng.integers(0, max(n_rows // 10, 1), n_rows).astype(str))
+
+    if config["missing"] > 0:
+        for col in ["Age", "Total_Purchase", "Years"] + [f"metric_{i}" for i in range(config["numeric"])]:
+            df.loc[rng.random(n_rows) < config["missing"], col] = np.nan
+    df["Churn"] = (rng.random(n_rows) < 1.0 / (1.0 + np.exp(-logit))).astype(int)
+    return df
+
+
+def synthesize(path: str, n_rows: int, config: dict, seed: int = 0) -> str:
+    """Write the dataset to path in chunks (so 10M rows fit in memory); reused if already there."""
+    if os.path.exists(path):
+        return path
+    tmp_path = f"{path}.tmp"
+    for i, start in enumerate(range(0, n_rows, GENERATE_CHUNK_ROWS)):
+        chunk = synthesize_chunk(start, min(GENERATE_CHUNK_ROWS, n_rows - start), config, seed)
+        chunk.to_csv(tmp_path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+class PeakRss:
+    """Samples the process RSS in a background thread while the block runs."""
+
+    def __init__(self, interval: float = 0.005):
+        from backend.utils.metrics import current_rss
+        self.current_rss = current_rss
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current_rss())
+
+    def __enter__(self):
+        self.baseline = self.peak = self.current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_rss())
+
+
+def clear_caches():
+    from backend.services.registry import registry
+    registry.clear()
+    for path in ("data/.columnar", "uploads/.columnar", "uploads/.scoring", "uploads/.renders"):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_outputs():
+    """Prediction CSVs and PDF reports of the last call; at 10M rows they add up fast."""
+    if not os.path.isdir("uploads"):
+        return
+    for entry in os.scandir("uploads"):
+        if entry.name.startswith(("prediction_", "churn_report_")):
+            os.remove(entry.path)
+
+
+def check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path} -> "
+                           f"{response.status_code}: {response.text[:500]}")
+    return response.json()
+
+
+def operations(ctx: dict) -> dict:
+    """op -> {mode: callable(call_index)}; each call handles the whole dataset (simulate: one row)."""
+    from backend.services.explain import generate_report, generate_shap_explanation, simulate_prediction
+    from backend.services.predict import make_prediction, make_prediction_stream
+    from backend.services.train import train_model
+
+    client, path, model_id, file_id = ctx["client"], ctx["path"], ctx["model_id"], ctx["file_id"]
+    scenarios = ctx["scenarios"]
+
+    def upload_api(_):
+        with open(path, "rb") as f:
+            check(client.post("/upload-csv", files={"file": (os.path.basename(path), f, "text/csv")}))
+
+    return {
+        "upload": {"api": upload_api},
+        "train": {
+            "direct": lambda _: train_model(path, "Churn", "classification", f"bench_train_{ctx['label']}"),
+            "api": lambda _: check(client.post("/train-model", json={
+                "file_id": file_id, "target": "Churn", "task": "classification"})),
+        },
+        "predict": {
+            "direct": lambda _: make_prediction(model_id, path),
+            "api": lambda _: check(client.post("/predict", json={"model_id": model_id, "file_id": file_id})),
+        },
+        "predict_stream": {
+            "direct": lambda _: make_prediction_stream(model_id, path),
+            "api": lambda _: check(client.post("/predict", json={
+                "model_id": model_id, "file_id": file_id, "stream": True})),
+        },
+        "explain": {
+            "direct": lambda _: generate_shap_explanation(model_id, path, sample=True),
+            "api": lambda _: check(client.post("/explain", json={
+                "model_id": model_id, "file_id": file_id, "sample": True})),
+        },
+        "simulate": {
+            "direct": lambda i: simulate_prediction(model_id, scenarios[i % len(scenarios)]),
+            "api": lambda i: check(client.post("/simulate", json={
+                "model_id": model_id, "features": scenarios[i % len(scenarios)]})),
+        },
+        "report": {
+            "direct": lambda _: generate_report(model_id, path, THRESHOLDS, RECOMMENDATIONS),
+            "api": lambda _: check(client.post("/generate-report", json={
+                "model_id": model_id, "file_id": file_id,
+                "thresholds": THRESHOLDS, "recommendations": RECOMMENDATIONS})),
+        },
+    }
+
+
+def measure(fn, calls: int, rows: int, cold: bool) -> dict:
+    latencies = []
+    with PeakRss() as rss:
+        for i in range(calls):
+            if cold:
+                clear_caches()
+            start = time.perf_counter()
+            fn(i)
+            latencies.append(time.perf_counter() - start)
+            remove_outputs()
+    latencies = np.array(latencies)
+    return {
+        "calls": calls,
+        "rows_per_call": rows,
+        "latency_s": {
+            "first": float(latencies[0]),
+            "p50": float(np.percentile(latencies, 50)),
+            "p99": float(np.percentile(latencies, 99)),
+            "mean": float(latencies.mean()),
+            "min": float(latencies.min()),
+            "max": float(latencies.max()),
+        },
+        "throughput_rows_per_s": float(rows * calls / latencies.sum()) if latencies.sum() > 0 else None,
+        "peak_rss_bytes": int(rss.peak),
+        "rss_growth_bytes": int(rss.peak - rss.baseline),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    config = {"numeric": args.numeric, "categorical": args.categorical, "cardinality": args.cardinality,
+              "high_cardinality": args.high_cardinality, "missing": args.missing}
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    ops = args.ops.split(",") if args.ops else list(OPS)
+    modes = args.modes.split(",")
+    for name in ops:
+        if name not in OPS:
+            raise SystemExit(f"Unknown op {name!r}; choose from {', '.join(OPS)}.")
+    output = os.path.abspath(args.output)
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    os.makedirs("data", exist_ok=True)
+
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    from backend.services.train import train_model
+    from backend.utils.helpers import save_upload_file
+
+    variant = "-".join(f"{key}{value}" for key, value in config.items())
+    train_path = synthesize(f"data/churn_{size_label(args.train_rows)}_{variant}_train.csv",
+                            args.train_rows, config, seed=1)
+    model_id = f"bench_{size_label(args.train_rows)}_{variant}"
+    print(f"training the scoring model on {args.train_rows} rows ...")
+    train_model(train_path, "Churn", "classification", model_id)
+
+    results = []
+    with TestClient(app) as client:
+        for n_rows in sizes:
+            label = size_label(n_rows)
+            print(f"generating {label} rows ...")
+            path = synthesize(f"data/churn_{label}_{variant}.csv", n_rows, config)
+            with open(path, "rb") as f:
+                file_id = save_upload_file(f, os.path.basename(path))
+            scenarios = pd.read_csv(path, nrows=args.simulate_calls).drop(columns=["Churn"])
+            scenarios = [{key: (None if pd.isna(value) else value) for key, value in row.items()}
+                         for row in json.loads(scenarios.to_json(orient="records"))]
+            ctx = {"client": client, "path": path, "model_id": model_id, "file_id": file_id,
+                   "label": label, "scenarios": scenarios}
+            table = operations(ctx)
+            for op in ops:
+                for mode in modes:
+                    fn = table[op].get(mode)
+                    if fn is None:
+                        continue
+                    if op == "train" and n_rows > args.train_max_rows:
+                        print(f"{label:>5} {mode:>6} {op:<15} skipped (--train-max-rows)")
+                        continue
+                    calls = args.simulate_calls if op == "simulate" else (1 if op == "upload" else args.repeat)
+                    result = measure(fn, calls, 1 if op == "simulate" else n_rows, args.cold)
+                    result.update({"dataset": label, "rows": n_rows, "mode": mode, "op": op})
+                    results.append(result)
+                    latency = result["latency_s"]
+                    print(f"{label:>5} {mode:>6} {op:<15} p50 {latency['p50'] * 1000:>10.1f} ms  "
+                          f"p99 {latency['p99'] * 1000:>10.1f} ms  "
+                          f"{result['throughput_rows_per_s']:>14,.0f} rows/s  "
+                          f"peak {result['peak_rss_bytes'] / 2 ** 20:>8.0f} MiB")
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": dict(config, train_rows=args.train_rows, repeat=args.repeat, cold=args.cold),
+        },
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}")
+
+
+def compare(args) -> int:
+    """Print new vs base per (dataset, mode, op); return the number of regressions."""
+    with open(args.base) as f:
+        base = {(r["dataset"], r["mode"], r["op"]): r for r in json.load(f)["results"]}
+    with open(args.new) as f:
+        new = {(r["dataset"], r["mode"], r["op"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"{'dataset':>7} {'mode':>6} {'op':<15} {'p50 base':>10} {'p50 new':>10} {'p50':>7} "
+          f"{'p99':>7} {'peak rss':>8}")
+    for key in sorted(base.keys() & new.keys()):
+        old, cur = base[key], new[key]
+        ratios = {
+            "p50": cur["latency_s"]["p50"] / old["latency_s"]["p50"] if old["latency_s"]["p50"] else 1.0,
+            "p99": cur["latency_s"]["p99"] / old["latency_s"]["p99"] if old["latency_s"]["p99"] else 1.0,
+            "rss": cur["peak_rss_bytes"] / old["peak_rss_bytes"] if old["peak_rss_bytes"] else 1.0,
+        }
+        flagged = [name for name, ratio in ratios.items()
+                   if ratio > 1.0 + (args.memory_threshold if name == "rss" else args.threshold)]
+        regressions += bool(flagged)
+        print(f"{key[0]:>7} {key[1]:>6} {key[2]:<15} {old['latency_s']['p50'] * 1000:>8.1f}ms "
+              f"{cur['latency_s']['p50'] * 1000:>8.1f}ms {ratios['p50']:>6.2f}x {ratios['p99']:>6.2f}x "
+              f"{ratios['rss']:>7.2f}x" + (f"  REGRESSION ({', '.join(flagged)})" if flagged else ""))
+    for key in sorted(base.keys() ^ new.keys()):
+        print(f"{key[0]:>7} {key[1]:>6} {key[2]:<15} only in {'base' if key in base else 'new'}")
+    print(f"{regressions} regression(s)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmark and write a JSON report")
+    run_parser.add_argument("--sizes", default="10k,1m,10m", help="comma-separated row counts, e.g. 10k,1m,10m")
+    run_parser.add_argument("--ops", default=None, help=f"comma-separated subset of {','.join(OPS)}")
+    run_parser.add_argument("--modes", default=",".join(MODES))
+    run_parser.add_argument("--repeat", type=int, default=5, help="calls per operation (simulate: --simulate-calls)")
+    run_parser.add_argument("--simulate-calls", type=int, default=200)
+    run_parser.add_argument("--cold", action="store_true", help="clear caches and the model registry before every call")
+    run_parser.add_argument("--train-rows", type=int, default=10_000, help="rows of the model the scoring ops use")
+    run_parser.add_argument("--train-max-rows", type=int, default=1_000_000,
+                            help="skip the train op on larger datasets")
+    run_parser.add_argument("--numeric", type=int, default=0, help="extra numeric columns")
+    run_parser.add_argument("--categorical", type=int, default=2, help="extra categorical columns")
+    run_parser.add_argument("--cardinality", type=int, default=8, help="levels per extra categorical column")
+    run_parser.add_argument("--high-cardinality", type=int, default=0, help="extra id-like text columns")
+    run_parser.add_argument("--missing", type=float, default=0.0, help="share of numeric values left empty")
+    run_parser.add_argument("--workdir", default=".bench")
+    run_parser.add_argument("--output", default="bench.json")
+
+    compare_parser = commands.add_parser("compare", help="flag regressions between two JSON reports")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed latency increase (0.10 = 10%%)")
+    compare_parser.add_argument("--memory-threshold", type=float, default=0.20, help="allowed peak RSS increase")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif compare(args):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,30 @@ export const trainModel = async (fileId: string, target: string, task: string) =
     return response.data;
 };
 
+export const submitTrainJob = async (fileId: string, target: string, task: string) => {
+    const response = await api.post('/train-jobs', {
+        file_id: fileId,
+        target,
+        task,
+    });
+    return response.data;
+};
+
+export const getTrainJob = async (jobId: string) => {
+    const response = await api.get(`/train-jobs/${jobId}`);
+    return response.data;
+};
+
+export const getTrainJobResult = async (jobId: string) => {
+    const response = await api.get(`/train-jobs/${jobId}/result`);
+    return response.data;
+};
+
+export const cancelTrainJob = async (jobId: string) => {
+    const response = await api.post(`/train-jobs/${jobId}/cancel`);
+    return response.data;
+};
+
 export const predict = async (modelId: string, fileId: string) => {
     const response = await api.post('/predict', {
         model_id: modelId,
@@ -68,6 +92,15 @@ export const simulate = async (modelId: string, features: any) => {
     return response.data;
 };
 
+export const simulateBatch = async (modelId: string, base: any, grid: Record<string, any[]>) => {
+    const response = await api.post('/simulate-batch', {
+        model_id: modelId,
+        base: base,
+        grid: grid,
+    });
+    return response.data;
+};
+
 export const generateReport = async (modelId: string, fileId: string, thresholds: any, recommendations: any) => {
     const response = await api.post('/generate-report', {
         model_id: modelId,
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useLocation } from 'react-router-dom';
-import { predict, explain, simulate, generateReport, downloadModelUrl } from '../api';
+import { predict, explain, simulate, simulateBatch, generateReport, downloadModelUrl } from '../api';
 import { Loader2, Download, BarChart2, Activity, FileText, Zap } from 'lucide-react';
 import axios from 'axios';
 
@@ -28,6 +28,11 @@ const PredictPage: React.FC = () => {
     const [simulationResult, setSimulationResult] = useState<number | null>(null);
     const [simulating, setSimulating] = useState(false);
 
+    const [sweepFeature, setSweepFeature] = useState<string>('');
+    const [sweepValues, setSweepValues] = useState<string>('');
+    const [sweepResult, setSweepResult] = useState<any>(null);
+    const [sweeping, setSweeping] = useState(false);
+
     useEffect(() => {
         const storedConfig = localStorage.getItem('churnConfig');
         if (storedConfig) {
@@ -100,6 +105,7 @@ const PredictPage: React.FC = () => {
         const { prediction, ...feats } = row;
         setSimulationFeatures(feats);
         setSimulationResult(null);
+        setSweepResult(null);
     };
 
     const handleSimulationChange = (key: string, value: string) => {
@@ -122,6 +128,23 @@ const PredictPage: React.FC = () => {
         }
     };
 
+    // Scores the selected row once per value of one feature, in a single request.
+    const runSweep = async () => {
+        if (!modelId || !sweepFeature) return;
+        const values = sweepValues.split(',').map(v => v.trim()).filter(v => v !== '')
+            .map(v => (isNaN(Number(v)) ? v : Number(v)));
+        if (values.length === 0) return;
+        setSweeping(true);
+        try {
+            const res = await simulateBatch(modelId, simulationFeatures, { [sweepFeature]: values });
+            setSweepResult(res);
+        } catch (err: any) {
+            alert("Sweep failed: " + (err.response?.data?.detail || err.message));
+        } finally {
+            setSweeping(false);
+        }
+    };
+
     if (!modelId) {
         return <div className="text-center mt-10">No model selected. <a href="/" className="text-blue-600">Go Home</a></div>;
     }
@@ -250,6 +273,53 @@ const PredictPage: React.FC = () => {
                                 >
                                     {simulating ? <Loader2 className="animate-spin" /> : "Simulate Change"}
                                 </button>
+
+                                <div className="mt-6 pt-4 border-t border-gray-200 space-y-2">
+                                    <h3 className="text-sm font-bold text-gray-700">Sweep a Feature</h3>
+                                    <select
+                                        value={sweepFeature}
+                                        onChange={(e) => { setSweepFeature(e.target.value); setSweepResult(null); }}
+                                        className="w-full text-sm border-gray-300 rounded shadow-sm focus:ring-indigo-500 focus:border-indigo-500 p-1 border"
+                                    >
+                                        <option value="">-- Select Feature --</option>
+                                        {Object.keys(simulationFeatures).filter(key => key !== 'prediction' && key !== 'Prediction').map(key => (
+                                            <option key={key} value={key}>{key}</option>
+                                        ))}
+                                    </select>
+                                    <input
+                                        type="text"
+                                        value={sweepValues}
+                                        onChange={(e) => setSweepValues(e.target.value)}
+                                        placeholder="Values, comma-separated (e.g. 30, 40, 50)"
+                                        className="w-full text-sm border-gray-300 rounded shadow-sm focus:ring-indigo-500 focus:border-indigo-500 p-1 border"
+                                    />
+                                    <button
+                                        onClick={runSweep}
+                                        disabled={sweeping || !sweepFeature || !sweepValues.trim()}
+                                        className="w-full bg-white text-yellow-600 font-bold py-2 rounded-lg border-2 border-yellow-500 hover:bg-yellow-50 transition-colors flex justify-center items-center disabled:opacity-50 disabled:cursor-not-allowed"
+                                    >
+                                        {sweeping ? <Loader2 className="animate-spin" /> : "Run Sweep"}
+                                    </button>
+
+                                    {sweepResult && (
+                                        <table className="min-w-full text-xs font-mono">
+                                            <thead>
+                                                <tr className="text-gray-500">
+                                                    <th className="text-left py-1">{sweepFeature}</th>
+                                                    <th className="text-right py-1">Prob</th>
+                                                </tr>
+                                            </thead>
+                                            <tbody className="divide-y divide-gray-100">
+                                                {sweepResult.predictions.map((p: number, i: number) => (
+                                                    <tr key={i}>
+                                                        <td className="py-1">{String(sweepResult.columns[sweepFeature][i])}</td>
+                                                        <td className="py-1 text-right font-bold">{p.toFixed(4)}</td>
+                                                    </tr>
+                                                ))}
+                                            </tbody>
+                                        </table>
+                                    )}
+                                </div>
                             </div>
                         ) : (
                             <div className="text-center py-10 text-gray-400 relative z-10">
@@ -1,7 +1,7 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
-import { trainModel } from '../api';
-import { Loader2, ArrowRight } from 'lucide-react';
+import { submitTrainJob, getTrainJob, getTrainJobResult, cancelTrainJob } from '../api';
+import { Loader2, ArrowRight, X } from 'lucide-react';
 import clsx from 'clsx';
 
 const SelectTarget: React.FC = () => {
@@ -14,6 +14,18 @@ const SelectTarget: React.FC = () => {
     const [task, setTask] = useState<string>('classification');
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState<string | null>(null);
+    const [job, setJob] = useState<any>(null);
+    const polling = useRef<number | null>(null);
+    const mounted = useRef(true);
+
+    // Stop polling when the page is left mid-training.
+    useEffect(() => {
+        mounted.current = true;
+        return () => {
+            mounted.current = false;
+            if (polling.current !== null) window.clearTimeout(polling.current);
+        };
+    }, []);
 
     if (!fileId) {
         return <div className="text-center mt-10">No file uploaded. <a href="/" className="text-blue-600">Go back</a></div>;
@@ -24,24 +36,55 @@ const SelectTarget: React.FC = () => {
         setLoading(true);
         setError(null);
         try {
-            const data = await trainModel(fileId, target, task);
-            navigate('/training-result', {
-                state: {
-                    modelId: data.model_id,
-                    metrics: data.metrics,
-                    featureImportance: data.feature_importance,
-                    target,
-                    task,
-                    fileId
-                }
-            });
+            const submitted = await submitTrainJob(fileId, target, task);
+            setJob(submitted);
+            poll(submitted.job_id);
         } catch (err: any) {
             setError(err.response?.data?.detail || "Training failed");
-        } finally {
             setLoading(false);
         }
     };
 
+    // Training runs as a background job: poll its progress until it finishes.
+    const poll = async (jobId: string) => {
+        try {
+            const status = await getTrainJob(jobId);
+            setJob(status);
+            if (status.status === 'completed') {
+                const data = await getTrainJobResult(jobId);
+                navigate('/training-result', {
+                    state: {
+                        modelId: data.model_id,
+                        metrics: data.metrics,
+                        featureImportance: data.feature_importance,
+                        target,
+                        task,
+                        fileId
+                    }
+                });
+            } else if (status.status === 'failed' || status.status === 'cancelled') {
+                setError(status.status === 'failed' ? status.error || "Training failed" : "Training cancelled");
+                setJob(null);
+                setLoading(false);
+            } else if (mounted.current) {
+                polling.current = window.setTimeout(() => poll(jobId), 1000);
+            }
+        } catch (err: any) {
+            setError(err.response?.data?.detail || "Training failed");
+            setJob(null);
+            setLoading(false);
+        }
+    };
+
+    const handleCancel = async () => {
+        if (!job) return;
+        try {
+            setJob(await cancelTrainJob(job.job_id));
+        } catch (err: any) {
+            setError(err.response?.data?.detail || "Could not cancel training");
+        }
+    };
+
     return (
         <div className="max-w-3xl mx-auto py-12 px-4">
             <h1 className="text-2xl font-bold text-gray-900 mb-6">Configure Training</h1>
@@ -98,15 +141,40 @@ const SelectTarget: React.FC = () => {
 
                 {error && <div className="p-4 bg-red-50 text-red-700 rounded-lg text-sm">{error}</div>}
 
-                <div className="pt-4">
+                {job && (
+                    <div>
+                        <div className="flex justify-between text-sm text-gray-600 mb-2">
+                            <span className="capitalize">{job.stage || job.status}</span>
+                            <span>{Math.round(job.progress * 100)}%</span>
+                        </div>
+                        <div className="w-full h-2 bg-gray-200 rounded-full overflow-hidden">
+                            <div
+                                className="h-full bg-blue-600 transition-all"
+                                style={{ width: `${Math.round(job.progress * 100)}%` }}
+                            />
+                        </div>
+                    </div>
+                )}
+
+                <div className="pt-4 flex space-x-4">
                     <button
                         onClick={handleTrain}
                         disabled={!target || loading}
-                        className="w-full py-4 bg-black text-white rounded-lg font-bold text-lg hover:bg-gray-800 disabled:opacity-50 disabled:cursor-not-allowed flex items-center justify-center"
+                        className="flex-1 py-4 bg-black text-white rounded-lg font-bold text-lg hover:bg-gray-800 disabled:opacity-50 disabled:cursor-not-allowed flex items-center justify-center"
                     >
                         {loading ? <Loader2 className="animate-spin mr-2" /> : <ArrowRight className="mr-2" />}
                         {loading ? "Training Model..." : "Start Training"}
                     </button>
+                    {job && (
+                        <button
+                            onClick={handleCancel}
+                            disabled={job.status === 'cancelling'}
+                            className="py-4 px-6 border border-gray-300 text-gray-700 rounded-lg font-bold hover:bg-gray-50 disabled:opacity-50 disabled:cursor-not-allowed flex items-center justify-center"
+                        >
+                            <X className="mr-2" size={18} />
+                            {job.status === 'cancelling' ? "Cancelling..." : "Cancel"}
+                        </button>
+                    )}
                 </div>
             </div>
         </div>
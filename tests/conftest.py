@@ -0,0 +1,45 @@
+import os
+import shutil
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(REPO_DIR, "customer_churn.csv")
+
+
+@pytest.fixture(scope="session")
+def workdir(tmp_path_factory):
+    """
+    Fresh working directory holding a copy of the sample CSV. uploads/ and
+    backend/models are relative paths, so models, caches and reports made
+    by the tests stay out of the repository.
+    """
+    path = tmp_path_factory.mktemp("churn")
+    previous = os.getcwd()
+    os.chdir(path)
+    os.makedirs("uploads")
+    os.makedirs(os.path.join("backend", "models"))
+    shutil.copy(SAMPLE_CSV, os.path.join("uploads", "customer_churn.csv"))
+    yield path
+    os.chdir(previous)
+
+
+@pytest.fixture(scope="session")
+def sample_csv(workdir):
+    return os.path.join("uploads", "customer_churn.csv")
+
+
+@pytest.fixture(scope="session")
+def classifier_id(sample_csv):
+    from backend.services.train import train_model
+
+    train_model(sample_csv, "Churn", "classification", "test_Churn", n_jobs=1)
+    return "test_Churn"
+
+
+@pytest.fixture(scope="session")
+def regressor_id(sample_csv):
+    from backend.services.train import train_model
+
+    train_model(sample_csv, "Total_Purchase", "regression", "test_Total_Purchase", n_jobs=1)
+    return "test_Total_Purchase"
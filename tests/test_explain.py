@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from backend.services.explain import generate_shap_explanation
+from backend.services.shap_store import build_shap_store, row_drivers
+from backend.services.shapley import expected_value
+
+
+def test_global_explanation_of_regressor(sample_csv, regressor_id):
+    importance, _, details = generate_shap_explanation(regressor_id, sample_csv, sample_size=100, render=False)
+    assert importance
+    assert isinstance(details["expected_value"], float)
+
+
+def test_expected_value_of_classifier_is_churn_class(classifier_id):
+    assert 0.0 < expected_value(classifier_id) < 1.0
+
+
+def test_shap_store_of_regressor(monkeypatch, sample_csv, regressor_id):
+    from backend.services import shapley
+
+    # The store is built inside a training-pool worker and must not start a pool of its own.
+    monkeypatch.setattr(shapley, "SHAP_WORKERS", 4)
+    monkeypatch.setattr(shapley, "_get_pool", lambda: pytest.fail("nested SHAP pool"))
+    build_shap_store(regressor_id, sample_csv, chunk_rows=200)
+    drivers = row_drivers(sample_csv, regressor_id, 0, 3)
+    assert np.isfinite(drivers["expected_value"])
+    assert len(drivers["drivers"]) == 3
@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.services.fastpath import FlatForest, get_compiled_pipeline, get_flat_forest
+from backend.services.preprocess import load_data
+from backend.services.registry import load_model
+from backend.utils.parallel import CpuBudget, parallelism
+
+
+def _forest_and_rows(model_id, sample_csv, target):
+    model = load_model(model_id)
+    X = model.named_steps["preprocessor"].transform(load_data(sample_csv).drop(columns=[target]))
+    return model.named_steps["classifier"], X
+
+
+def _sklearn_output(forest, X):
+    with parallelism(1, budget=CpuBudget(1)):
+        return forest.predict_proba(X) if hasattr(forest, "predict_proba") else forest.predict(X)[:, None]
+
+
+def _bits(array):
+    return np.ascontiguousarray(array, dtype=np.float64).view(np.uint64)
+
+
+@pytest.mark.parametrize("model_fixture,target", [("classifier_id", "Churn"), ("regressor_id", "Total_Purchase")])
+def test_stored_flat_forest_is_mapped_and_bit_exact(request, sample_csv, model_fixture, target):
+    model_id = request.getfixturevalue(model_fixture)
+    forest, X = _forest_and_rows(model_id, sample_csv, target)
+    flat = get_flat_forest(model_id)
+
+    assert all(isinstance(getattr(flat, name), np.memmap) for name in FlatForest.TABLES)
+    expected = _sklearn_output(forest, X)
+    assert np.array_equal(_bits(flat.predict_batch(X, block_rows=128)), _bits(expected))
+    assert np.array_equal(_bits(flat.predict_row(X[0])), _bits(expected[0]))
+
+
+def _simulation_cases(record: dict) -> dict:
+    return {
+        "full row": record,
+        "partial row": {col: value for col, value in record.items() if col != "Onboard_date"},
+        "extra keys": dict(record, unknown_feature=1, Names="x"),
+        "None value": dict(record, Age=None),
+        "None date": dict(record, Onboard_date=None),
+        "all None": {col: None for col in record},
+        "numeric text": dict(record, Age="42"),
+        "non-numeric text": dict(record, Age="abc"),
+    }
+
+
+def _outcome(fn, row):
+    try:
+        return float(fn(row))
+    except ValueError as e:
+        return f"ValueError: {e}"
+
+
+@pytest.mark.parametrize("model_fixture,target", [("classifier_id", "Churn"), ("regressor_id", "Total_Purchase")])
+def test_compiled_simulation_matches_pipeline(request, sample_csv, model_fixture, target):
+    model_id = request.getfixturevalue(model_fixture)
+    compiled = get_compiled_pipeline(model_id)
+    assert compiled is not None
+    model = load_model(model_id)
+    columns = list(model.named_steps["preprocessor"].feature_names_in_)
+    frame = load_data(sample_csv)[columns]
+
+    if hasattr(model.named_steps["classifier"], "predict_proba"):
+        reference = lambda row: model.predict_proba(pd.DataFrame([row]))[0][1]
+        expected = model.predict_proba(frame)[:, 1]
+    else:
+        reference = lambda row: model.predict(pd.DataFrame([row]))[0]
+        expected = model.predict(frame)
+    actual = np.array([compiled.predict_one(row) for row in frame.to_dict(orient="records")])
+    assert np.array_equal(actual, expected)
+
+    for name, row in _simulation_cases(frame.iloc[0].to_dict()).items():
+        assert _outcome(compiled.predict_one, row) == _outcome(reference, row), name
+
+
+def test_flat_engine_scores_small_batches_only(monkeypatch, sample_csv, classifier_id):
+    from backend.services import fastpath
+
+    model = load_model(classifier_id)
+    forest, X = _forest_and_rows(classifier_id, sample_csv, "Churn")
+    flat = get_flat_forest(classifier_id)
+    calls = []
+
+    def predict_batch(rows):
+        calls.append(rows.shape[0])
+        return FlatForest.predict_batch(flat, rows)
+
+    monkeypatch.setattr(flat, "predict_batch", predict_batch)
+    monkeypatch.setattr(fastpath, "FLAT_ENGINE_MAX_ROWS", 100)
+
+    with parallelism(1, budget=CpuBudget(1)):
+        small = fastpath.transformed_output(classifier_id, model, X[:100], engine="flat")
+        large = fastpath.transformed_output(classifier_id, model, X, engine="flat")
+    assert calls == [100]
+    assert np.array_equal(_bits(small), _bits(_sklearn_output(forest, X[:100])))
+    assert np.array_equal(_bits(large), _bits(_sklearn_output(forest, X)))
+
+
+def test_simulate_batch_uses_compiled_scorer_for_small_batches(monkeypatch, sample_csv, classifier_id):
+    from backend.services import explain
+
+    model = load_model(classifier_id)
+    columns = list(model.named_steps["preprocessor"].feature_names_in_)
+    rows = load_data(sample_csv)[columns].head(200).to_dict(orient="records")
+    compiled = get_compiled_pipeline(classifier_id)
+    calls = []
+
+    def predict_many(batch):
+        calls.append(len(batch))
+        return type(compiled).predict_many(compiled, batch)
+
+    monkeypatch.setattr(compiled, "predict_many", predict_many)
+    monkeypatch.setattr(explain, "SIMULATE_COMPILED_MAX_ROWS", 50)
+
+    with parallelism(1, budget=CpuBudget(1)):
+        small, _ = explain.simulate_batch(classifier_id, rows=rows[:50])
+        large, _ = explain.simulate_batch(classifier_id, rows=rows)
+        expected = model.predict_proba(pd.DataFrame(rows))[:, 1]
+    assert calls == [50]
+    assert small == expected[:50].tolist()
+    assert large == expected.tolist()
+
+
+def test_model_version_counts_flat_tables(classifier_id):
+    from backend.services.model_store import FLAT_DIRNAME, get_store_path, model_version
+
+    store = get_store_path(classifier_id)
+    flat = os.path.join(store, FLAT_DIRNAME)
+    on_disk = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(store) for name in names)
+    flat_bytes = sum(os.path.getsize(os.path.join(flat, name)) for name in os.listdir(flat))
+
+    _, size = model_version(classifier_id)
+    assert flat_bytes > 0
+    assert size == on_disk
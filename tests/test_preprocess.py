@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from backend.services.preprocess import HashEncoder, optimize_dtypes
+
+
+def test_optimize_dtypes_drops_near_unique_text():
+    df = pd.DataFrame({
+        "name": [f"customer {i}" for i in range(100)],
+        "plan": ["basic", "pro"] * 50,
+        "spend": np.arange(100, dtype=np.float64) / 2,
+        "Churn": [0, 1] * 50,
+    })
+    optimized, report = optimize_dtypes(df, target="Churn")
+
+    assert list(optimized.columns) == ["plan", "spend", "Churn"]
+    assert report["dropped"] == ["name"]
+    assert optimized["plan"].dtype == "category"
+    assert optimized["spend"].dtype == np.float32
+
+
+def test_hash_encoder_codes_match_at_inference():
+    train = pd.DataFrame({"city": ["a", "b", None, "c"]})
+    encoder = HashEncoder().fit(train)
+    codes = encoder.transform(train)[:, 0]
+
+    assert codes[2] == -1
+    assert np.array_equal(encoder.transform(pd.DataFrame({"city": ["c", "a"]}))[:, 0], codes[[3, 0]])
@@ -0,0 +1,40 @@
+import os
+import time
+
+import numpy as np
+
+from backend.services.render import PlotRenderer, summary_data
+
+
+def _payload(seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    shap_values, X = rng.normal(size=(50, 3)), rng.normal(size=(50, 3))
+    data = summary_data(shap_values, X, ["a", "b", "c"], np.abs(shap_values).mean(axis=0), 0.5)
+    return {"feature_importance": {}, "details": {}, "plot_data": data}
+
+
+def test_least_recently_used_explanations_are_evicted(tmp_path):
+    renderer = PlotRenderer(str(tmp_path), workers=1)
+    keys = [f"{i:040x}" for i in range(3)]
+    for seed, key in enumerate(keys):
+        renderer.store(key, _payload(seed))
+        renderer.ensure_plot(key)
+        time.sleep(0.01)
+
+    renderer.load(keys[0])
+    renderer.max_bytes = renderer.stats()["bytes"] - 1
+    renderer.evict()
+
+    assert not os.path.exists(renderer.data_path(keys[1]))
+    assert not os.path.exists(renderer.plot_path(keys[1]))
+    assert os.path.exists(renderer.plot_path(keys[0])) and os.path.exists(renderer.plot_path(keys[2]))
+    assert renderer.stats()["bytes"] <= renderer.max_bytes
+    renderer.shutdown()
+
+
+def test_just_stored_explanation_is_kept(tmp_path):
+    renderer = PlotRenderer(str(tmp_path), workers=1, max_bytes=1)
+    key = "f" * 40
+    renderer.store(key, _payload(0))
+    assert renderer.load(key) is not None
+    renderer.shutdown()
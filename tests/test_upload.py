@@ -0,0 +1,61 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from backend.utils.helpers import BodySizeLimit
+
+
+def _client(received):
+    app = FastAPI()
+    app.add_middleware(BodySizeLimit, max_bytes=1000, overhead=200)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        received.append(len(await file.read()))
+        return {"size": received[-1]}
+
+    return TestClient(app)
+
+
+def test_upload_within_limit_is_accepted():
+    received = []
+    response = _client(received).post("/upload", files={"file": ("a.csv", b"x" * 1000)})
+    assert response.status_code == 200
+    assert received == [1000]
+
+
+def test_oversized_content_length_is_rejected_before_parsing():
+    received = []
+    response = _client(received).post("/upload", files={"file": ("a.csv", b"x" * 5000)})
+    assert response.status_code == 413
+    assert received == []
+
+
+def test_oversized_chunked_body_is_cut_off():
+    received = []
+    boundary = b"b0undary"
+    parts = [b"--" + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="a.csv"\r\n\r\n']
+    parts += [b"x" * 500] * 10 + [b"\r\n--" + boundary + b"--\r\n"]
+    response = _client(received).post("/upload", content=iter(parts),
+                                      headers={"content-type": "multipart/form-data; boundary=b0undary"})
+    assert response.status_code == 413
+    assert received == []
+
+
+def test_upload_spooled_to_disk_with_process_executor(sample_csv, monkeypatch):
+    import backend.main as main
+    from backend.utils.executor import EndpointExecutor
+
+    with open(sample_csv, "rb") as f:
+        header, rows = f.readline(), f.read()
+    body = header + rows * (2 * 1024 * 1024 // len(rows) + 1)
+    assert len(body) > 1024 * 1024  # past SpooledTemporaryFile's in-memory size
+
+    pool = EndpointExecutor(kind="process", max_workers=1)
+    monkeypatch.setattr(main, "executor", pool)
+    try:
+        with TestClient(main.app) as client:
+            response = client.post("/upload-csv", files={"file": ("big.csv", body)})
+    finally:
+        pool.shutdown()
+    assert response.status_code == 200
+    assert "Churn" in response.json()["columns"]